@@ -0,0 +1,105 @@
+"""
+Synthetic repositories for the rflow benchmarks.
+
+A scenario is a working clone `work/` with a local bare repository `origin.git/` as its `origin`. All refs point to a
+handful of commits written with `git fast-import`, and the ref files are written as packed-refs directly, so even
+scenarios with 100k refs are generated in seconds.
+"""
+import json
+import os
+import subprocess
+from collections import namedtuple
+
+Scale = namedtuple('Scale', ['release_branches', 'tags', 'snapshot_tags', 'files'])
+
+SCALES = {
+    'small': Scale(release_branches=20, tags=50, snapshot_tags=100, files=100),
+    'branches': Scale(release_branches=10000, tags=100, snapshot_tags=100, files=100),
+    'tags': Scale(release_branches=100, tags=1000, snapshot_tags=100000, files=100),
+    'tree': Scale(release_branches=100, tags=100, snapshot_tags=100, files=100000),
+}
+
+GIT_IDENTITY = {
+    'GIT_AUTHOR_NAME': 'rflow-bench', 'GIT_AUTHOR_EMAIL': 'bench@example.com',
+    'GIT_COMMITTER_NAME': 'rflow-bench', 'GIT_COMMITTER_EMAIL': 'bench@example.com',
+}
+
+
+def git(cwd, *args, stdin=None):
+    env = dict(os.environ, **GIT_IDENTITY)
+    return subprocess.run(['git', *args], cwd=cwd, input=stdin, env=env, check=True,
+                          capture_output=True).stdout.decode().strip()
+
+
+def release_versions(count):
+    """
+    :param count: How many release lines to generate.
+    :return: The versions of the release branches, e.g. ['1.0.0', '1.1.0', ...], ascending.
+    """
+    return [f'{index // 100 + 1}.{index % 100}.0' for index in range(count)]
+
+
+def fast_import_stream(scale, version_info):
+    """
+    Build a fast-import stream with one commit on main holding version.info and `scale.files` other files.
+    """
+    blob = b'content\n'
+    chunks = [b'blob\nmark :1\ndata %d\n%s\n' % (len(blob), blob)]
+    info = version_info.encode()
+    chunks.append(b'blob\nmark :2\ndata %d\n%s\n' % (len(info), info))
+    chunks.append(b'commit refs/heads/main\nmark :3\ncommitter rflow-bench <bench@example.com> 1700000000 +0000\n'
+                  b'data 15\nInitial commit\n')
+    chunks.append(b'M 100644 :2 version.info\n')
+    for index in range(scale.files):
+        chunks.append(b'M 100644 :1 src/module%03d/file%06d.txt\n' % (index // 1000, index))
+    chunks.append(b'\n')
+    return b''.join(chunks)
+
+
+def write_packed_refs(git_dir, refs):
+    """
+    Write refs straight into packed-refs, replacing the loose refs git would otherwise create one file at a time.
+    :param git_dir: The git directory of the repository.
+    :param refs: A dict mapping full ref names to object ids.
+    """
+    lines = ['# pack-refs with: peeled fully-peeled sorted ']
+    lines += [f'{sha} {ref}' for ref, sha in sorted(refs.items())]
+    with open(os.path.join(git_dir, 'packed-refs'), 'w') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+def generate(root, scale):
+    """
+    Generate a scenario.
+    :param root: An empty directory that receives `work/` and `origin.git/`.
+    :param scale: The `Scale` of the scenario.
+    :return: The path of the working clone.
+    """
+    work = os.path.join(root, 'work')
+    origin = os.path.join(root, 'origin.git')
+    versions = release_versions(scale.release_branches)
+    latest = versions[-1].split('.')
+    version_info = json.dumps({'currentVersion': versions[-1],
+                               'nextVersion': f'{latest[0]}.{int(latest[1]) + 1}.0'}, indent=4)
+    git(root, 'init', '-q', '-b', 'main', work)
+    git(work, 'fast-import', '--quiet', stdin=fast_import_stream(scale, version_info))
+    commit = git(work, 'rev-parse', 'refs/heads/main')
+    refs = {'refs/heads/main': commit}
+    refs.update({f'refs/heads/release/v{version}': commit for version in versions})
+    # Release tags v<major>.<minor>.<patch> spread over the existing release lines only
+    for index in range(scale.tags):
+        major, minor, _ = versions[index % len(versions)].split('.')
+        refs[f'refs/tags/v{major}.{minor}.{index // len(versions)}'] = commit
+    refs.update({f'refs/tags/v1.0.0-{20000101000000 + index:014d}': commit for index in range(scale.snapshot_tags)})
+    git(root, 'init', '-q', '--bare', '-b', 'main', origin)
+    git(work, 'push', '-q', origin, 'main')
+    write_packed_refs(origin, refs)
+    refs.update({f'refs/remotes/origin/{ref[len("refs/heads/"):]}': sha
+                 for ref, sha in list(refs.items()) if ref.startswith('refs/heads/')})
+    os.remove(os.path.join(work, '.git', 'refs', 'heads', 'main'))
+    write_packed_refs(os.path.join(work, '.git'), refs)
+    git(work, 'remote', 'add', 'origin', origin)
+    git(work, 'config', 'branch.main.remote', 'origin')
+    git(work, 'config', 'branch.main.merge', 'refs/heads/main')
+    git(work, 'checkout', '-q', '-f', 'main')
+    return work
@@ -0,0 +1,173 @@
+"""
+End-to-end benchmarks of the rflow commands on synthetic repositories.
+
+For every scale a fresh scenario is generated (see `benchmarks.generate`) and `init`, `release`, `major`, `snap`, `fix`
+and `tag` are run one after the other as separate `python -m rflow.cli` processes. For every command the wall-clock
+time, the number of git processes it started (counted through GIT_TRACE2_EVENT) and the bytes that reached the bare
+origin are recorded.
+
+    python -m benchmarks.run --scale small --scale tags --output results.json
+    python -m benchmarks.run --scale small --compare baseline.json --threshold 1.25
+    python -m benchmarks.run --scale tags --backend gitpython --backend slim
+
+The results are written as JSON. With --compare, the exit code is 1 when a command got slower than the baseline by
+more than the threshold factor or started more git processes.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.generate import GIT_IDENTITY, SCALES, generate, git
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def directory_size(path):
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(directory, name))
+    return total
+
+
+def count_git_processes(trace_file):
+    """
+    Count the git processes started directly by rflow in a trace2 event file. Processes started by git itself, such
+    as the pack-objects behind a push, have a nested session id and are not counted.
+    """
+    if not os.path.exists(trace_file):
+        return 0
+    sessions = set()
+    with open(trace_file, 'r') as file:
+        for line in file:
+            event = json.loads(line)
+            if event.get('event') == 'start' and '/' not in event.get('sid', '/'):
+                sessions.add(event['sid'])
+    return len(sessions)
+
+
+def run_command(work, origin, args, trace_dir, backend='gitpython'):
+    """
+    Run one rflow command and measure it.
+    :param backend: The git backend rflow runs on, see `rflow.backend`.
+    :return: A dict with the measurements.
+    """
+    trace_file = os.path.join(trace_dir, f'{args[0]}.trace')
+    env = dict(os.environ, GIT_TRACE2_EVENT=trace_file, PYTHONPATH=PROJECT_ROOT, RFLOW_BACKEND=backend,
+               RFLOW_NO_DAEMON='1', **GIT_IDENTITY)
+    origin_size = directory_size(origin)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-m', 'rflow.cli', *args], cwd=work, env=env, capture_output=True,
+                            text=True)
+    seconds = time.perf_counter() - start
+    return {
+        'command': ' '.join(args),
+        'seconds': round(seconds, 4),
+        'git_processes': count_git_processes(trace_file),
+        'bytes_pushed': directory_size(origin) - origin_size,
+        'exit_code': result.returncode,
+        'output': (result.stdout + result.stderr).strip().splitlines()[-1:] or [''],
+    }
+
+
+def run_scale(name, backend='gitpython'):
+    """
+    Generate the scenario of a scale and run every command in it.
+    :param name: A key of `SCALES`.
+    :param backend: The git backend rflow runs on.
+    :return: A list with one result dict per command.
+    """
+    results = []
+    with tempfile.TemporaryDirectory(prefix=f'rflow-bench-{name}-') as root:
+        start = time.perf_counter()
+        work = generate(root, SCALES[name])
+        generation = time.perf_counter() - start
+        origin = os.path.join(root, 'origin.git')
+        trace_dir = os.path.join(root, 'traces')
+        os.mkdir(trace_dir)
+        # init refuses to overwrite version.info, so it runs with the file moved out of the way
+        os.rename(os.path.join(work, 'version.info'), os.path.join(root, 'version.info'))
+        results.append(run_command(work, origin, ['init'], trace_dir, backend))
+        git(work, 'checkout', '-q', '--', 'version.info')
+        for args in (['release'], ['major'], ['snap'], ['fix', '1.0.0', 'bench']):
+            results.append(run_command(work, origin, args, trace_dir, backend))
+        release_branch = git(work, 'for-each-ref', '--format=%(refname:short)', '--sort=-committerdate',
+                             '--count=1', 'refs/heads/release/')
+        git(work, 'checkout', '-q', release_branch)
+        results.append(run_command(work, origin, ['tag'], trace_dir, backend))
+    for result in results:
+        result['scale'] = name
+        result['backend'] = backend
+        result['generation_seconds'] = round(generation, 4)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    :return: A list of human readable regressions of `results` against `baseline`.
+    """
+    previous = {(result['scale'], result.get('backend', 'gitpython'), result['command']): result
+                for result in baseline['results']}
+    regressions = []
+    for result in results:
+        backend = result.get('backend', 'gitpython')
+        old = previous.get((result['scale'], backend, result['command']))
+        if old is None:
+            continue
+        if result['seconds'] > old['seconds'] * threshold:
+            regressions.append(f"{result['scale']}/{backend}/{result['command']}: {old['seconds']:.3f}s -> "
+                               f"{result['seconds']:.3f}s")
+        if result['git_processes'] > old['git_processes']:
+            regressions.append(f"{result['scale']}/{backend}/{result['command']}: {old['git_processes']} -> "
+                               f"{result['git_processes']} git processes")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES), help='Scale to run, repeatable.')
+    parser.add_argument('--backend', action='append', choices=['gitpython', 'slim'],
+                        help='Git backend to run rflow on, repeatable to compare them (default gitpython).')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--compare', help='A previous results file to check for regressions.')
+    parser.add_argument('--threshold', type=float, default=1.25,
+                        help='Slowdown factor reported as a regression with --compare.')
+    options = parser.parse_args(argv)
+    results = []
+    for name in options.scale or ['small']:
+        for backend in options.backend or ['gitpython']:
+            results.extend(run_scale(name, backend))
+    print(f"{'SCALE':<10} {'BACKEND':<10} {'COMMAND':<16} {'TIME':>9} {'GIT':>5} {'PUSHED':>10}  EXIT")
+    for result in results:
+        print(f"{result['scale']:<10} {result['backend']:<10} {result['command']:<16} {result['seconds']:8.3f}s "
+              f"{result['git_processes']:5d} {result['bytes_pushed']:10d}  {result['exit_code']}")
+    report = {
+        'rflow_version': json.load(open(os.path.join(PROJECT_ROOT, 'version.info')))['currentVersion'],
+        'git_version': git(PROJECT_ROOT, '--version'),
+        'python_version': platform.python_version(),
+        'results': results,
+    }
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(report, file, indent=4)
+    failed = [result for result in results if result['exit_code'] != 0]
+    for result in failed:
+        print(f"{result['scale']}/{result['backend']}/{result['command']} failed: {result['output'][0]}",
+              file=sys.stderr)
+    if options.compare:
+        with open(options.compare, 'r') as file:
+            regressions = compare(results, json.load(file), options.threshold)
+        for regression in regressions:
+            print(f'Regression: {regression}', file=sys.stderr)
+        if regressions:
+            return 1
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
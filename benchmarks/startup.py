@@ -0,0 +1,66 @@
+"""
+Cold-start budget for the rflow entry point.
+
+Every subcommand is started in a fresh interpreter several times and the best wall-clock time is compared against
+its budget. Run from the root of a git repository that contains a version.info file:
+
+    python -m benchmarks.startup [--runs 5]
+
+The exit code is 1 when any subcommand exceeds its budget.
+"""
+import argparse
+import subprocess
+import sys
+import time
+
+# Budgets in milliseconds for starting the interpreter, importing rflow and reaching the subcommand.
+# None of these paths may import GitPython or open the repository.
+STARTUP_BUDGETS_MS = {
+    ('--help',): 150,
+    ('version',): 150,
+    ('init', '--help'): 150,
+    ('release', '--help'): 150,
+    ('major', '--help'): 150,
+    ('fix', '--help'): 150,
+    ('snap', '--help'): 150,
+    ('tag', '--help'): 150,
+    ('prune-snapshots', '--help'): 150,
+    ('versions', '--help'): 150,
+    ('status', '--help'): 150,
+    ('changelog', '--help'): 150,
+    ('push-status', '--help'): 150,
+    ('serve', '--help'): 150,
+}
+
+
+def measure(args, runs):
+    """
+    Measure the best cold-start time of `python -m rflow.cli <args>`.
+    :param args: The command line arguments passed to rflow.
+    :param runs: How many fresh interpreters to start.
+    :return: The fastest run in milliseconds.
+    """
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'rflow.cli', *args], capture_output=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='Interpreter starts per subcommand.')
+    options = parser.parse_args(argv)
+    over_budget = False
+    for args, budget in STARTUP_BUDGETS_MS.items():
+        elapsed = measure(args, options.runs)
+        status = 'ok' if elapsed <= budget else 'OVER'
+        over_budget = over_budget or elapsed > budget
+        print(f"{' '.join(args):<22} {elapsed:8.1f} ms  budget {budget:5d} ms  {status}")
+    return 1 if over_budget else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
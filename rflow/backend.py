@@ -0,0 +1,263 @@
+"""
+The git backends rflow runs on, selected with the RFLOW_BACKEND environment variable.
+
+`gitpython`, the default, opens repositories as `git.Repo` objects. `slim` opens them as `SlimRepo` objects, which run
+git directly with `subprocess` and read objects through one long-lived `git cat-file --batch` process, without
+loading GitPython at all. Both provide the part of the `git.Repo` interface rflow uses: `repo.git.<command>(*args)`,
+`repo.git.execute`, `repo.git.get_object_data`, `repo.branches`, `repo.working_dir`, `repo.git_dir` and
+`repo.common_dir`.
+
+The exceptions to catch around git calls are `GitError` and `GitCommandError` of this module. They are tuples that
+cover the exceptions of the slim backend and, when GitPython is selected or loaded, those of GitPython, so the same
+`except` clause works with either backend.
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from rflow import trace
+
+BACKEND_ENV = 'RFLOW_BACKEND'
+DEFAULT_BACKEND = 'gitpython'
+BACKENDS = ('gitpython', 'slim')
+# Like GitPython, run git with untranslated messages so that errors can be recognized by their text
+GIT_ENV = {'LANGUAGE': 'C', 'LC_ALL': 'C'}
+
+
+class SlimGitError(Exception):
+    """
+    Base class of the errors raised by the slim backend.
+    """
+
+
+class SlimGitCommandError(SlimGitError):
+    """
+    A git command of the slim backend exited with a non-zero status.
+    Has the `command`, `status`, `stdout` and `stderr` attributes of GitPython's `GitCommandError`.
+    """
+
+    def __init__(self, command, status, stdout='', stderr=''):
+        self.command = list(command)
+        self.status = status
+        self.stdout = stdout
+        self.stderr = stderr
+        message = f"Cmd('git') failed due to: exit code({status})\n  cmdline: {' '.join(self.command)}"
+        if stderr.strip():
+            message += f"\n  stderr: '{stderr.strip()}'"
+        super().__init__(message)
+
+
+class InvalidRepositoryError(SlimGitError):
+    """
+    The path is not the root of a git working tree. Raised by `open_repository` with either backend.
+    """
+
+
+def selected():
+    """
+    :return: The name of the backend chosen through RFLOW_BACKEND, `DEFAULT_BACKEND` when it is not set.
+    :raises ValueError: If RFLOW_BACKEND names an unknown backend.
+    """
+    name = os.environ.get(BACKEND_ENV) or DEFAULT_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown git backend {name!r} in {BACKEND_ENV}; expected one of {', '.join(BACKENDS)}.")
+    return name
+
+
+def open_repository(path='.', backend=None):
+    """
+    :param path: The root of the working tree.
+    :param backend: The name of the backend, by default the one selected through RFLOW_BACKEND.
+    :return: A `git.Repo` or a `SlimRepo`.
+    :raises InvalidRepositoryError: If the path is not the root of a git working tree.
+    """
+    if (backend or selected()) == 'slim':
+        return SlimRepo(path)
+    from git import InvalidGitRepositoryError, NoSuchPathError, Repo
+    try:
+        return Repo(path)
+    except (InvalidGitRepositoryError, NoSuchPathError) as e:
+        raise InvalidRepositoryError(f'{path} is not a git repository') from e
+
+
+class SlimRepo:
+    """
+    A repository accessed through plain git commands.
+    """
+
+    def __init__(self, path='.'):
+        """
+        :param path: The root of the working tree.
+        :raises InvalidRepositoryError: If the path is not the root of a git working tree.
+        """
+        path = os.path.abspath(path)
+        if not os.path.isdir(path):
+            raise InvalidRepositoryError(f'{path} is not a git repository')
+        self.git = SlimGit(path)
+        try:
+            top_level, git_dir, common_dir = self.git.rev_parse('--show-toplevel', '--absolute-git-dir',
+                                                                '--git-common-dir').splitlines()
+        except (SlimGitCommandError, ValueError):
+            raise InvalidRepositoryError(f'{path} is not a git repository') from None
+        # As with `git.Repo`, a subdirectory of a working tree is not a repository
+        if os.path.realpath(top_level) != os.path.realpath(path):
+            raise InvalidRepositoryError(f'{path} is not the root of a git working tree')
+        self.working_dir = path
+        self.git_dir = git_dir
+        self.common_dir = os.path.normpath(os.path.join(path, common_dir))
+
+    @property
+    def branches(self):
+        """
+        :return: The names of the local branches.
+        """
+        return self.git.for_each_ref('--format=%(refname:strip=2)', 'refs/heads/').splitlines()
+
+    def close(self):
+        """
+        Stop the long-lived git processes of the repository.
+        """
+        self.git.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f'<SlimRepo {self.working_dir}>'
+
+
+class SlimGit:
+    """
+    Runs git commands in a working tree: `git_cmd.for_each_ref('--format=%(refname)')` runs `git for-each-ref`.
+    Output is returned as a string without its trailing newline, and a failing command raises `SlimGitCommandError`.
+    """
+
+    def __init__(self, working_dir):
+        """
+        :param working_dir: The directory git runs in.
+        """
+        self.working_dir = working_dir
+        self._batch = None
+        self._batch_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        command = name.replace('_', '-')
+
+        def run(*args, **kwargs):
+            return self.execute(['git', command, *[str(arg) for arg in args]], **kwargs)
+
+        return run
+
+    def execute(self, command, istream=None, as_process=False, strip_newline_in_stdout=True):
+        """
+        Run a git command line.
+        :param command: The command as a list, starting with 'git'.
+        :param istream: A file handed to the command as its standard input.
+        :param as_process: Whether to return the running `SlimProcess` instead of waiting for the output.
+        :param strip_newline_in_stdout: Whether to drop the trailing newline of the output.
+        :return: The standard output as a string, or a `SlimProcess`.
+        :raises SlimGitCommandError: If the command fails.
+        """
+        start_time = time.perf_counter()
+        if as_process:
+            process = subprocess.Popen(command, cwd=self.working_dir, env=dict(os.environ, **GIT_ENV),
+                                       stdin=istream or subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+            return SlimProcess(command, process, start_time)
+        result = subprocess.run(command, cwd=self.working_dir, env=dict(os.environ, **GIT_ENV),
+                                stdin=istream or subprocess.DEVNULL, capture_output=True)
+        stdout = result.stdout.decode('utf-8', errors='replace')
+        stderr = result.stderr.decode('utf-8', errors='replace')
+        if result.returncode != 0:
+            trace.record_command(command, start_time, result.returncode, len(stdout) + len(stderr))
+            raise SlimGitCommandError(command, result.returncode, stdout, stderr)
+        if strip_newline_in_stdout and stdout.endswith('\n'):
+            stdout = stdout[:-1]
+        trace.record_command(command, start_time, 0, len(stdout))
+        return stdout
+
+    def get_object_data(self, name):
+        """
+        Read an object through the long-lived `git cat-file --batch` process of the repository, started on first use.
+        Safe to call from several threads.
+        :param name: An object name such as 'release/v1.2.0:version.info'.
+        :return: A (sha, type, size, data) tuple, where data is bytes.
+        :raises ValueError: If the object does not exist.
+        """
+        with self._batch_lock:
+            if self._batch is None or self._batch.poll() is not None:
+                command = ['git', 'cat-file', '--batch']
+                start_time = time.perf_counter()
+                self._batch = subprocess.Popen(command, cwd=self.working_dir, env=dict(os.environ, **GIT_ENV),
+                                               stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                               stderr=subprocess.DEVNULL)
+                trace.record_command(command, start_time, 0, 0)
+            self._batch.stdin.write(name.encode('utf-8') + b'\n')
+            self._batch.stdin.flush()
+            header = self._batch.stdout.readline().decode('utf-8').split()
+            if len(header) != 3:
+                raise ValueError(f"SHA could not be resolved, git returned: {' '.join(header)!r}")
+            sha, kind, size = header[0], header[1], int(header[2])
+            data = self._batch.stdout.read(size + 1)[:size]
+        return sha, kind, size, data
+
+    def close(self):
+        """
+        Stop the `git cat-file --batch` process.
+        """
+        with self._batch_lock:
+            batch, self._batch = self._batch, None
+        if batch is not None:
+            batch.stdin.close()
+            batch.wait()
+            batch.stdout.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class SlimProcess:
+    """
+    A running git command, as returned by `SlimGit.execute(..., as_process=True)`.
+    """
+
+    def __init__(self, command, process, start_time):
+        self.command = command
+        self.proc = process
+        self.stdout = process.stdout
+        self.start_time = start_time
+
+    def wait(self):
+        """
+        Wait for the command to exit.
+        :raises SlimGitCommandError: If it failed.
+        """
+        stderr = self.proc.stderr.read().decode('utf-8', errors='replace')
+        self.proc.stderr.close()
+        status = self.proc.wait()
+        trace.record_command(self.command, self.start_time, status, len(stderr))
+        if status != 0:
+            raise SlimGitCommandError(self.command, status, '', stderr)
+        return status
+
+
+def __getattr__(name):
+    # GitPython's classes are only added when it is the selected backend or already loaded, so that the slim backend
+    # never imports it
+    if name in ('GitError', 'GitCommandError'):
+        errors = (SlimGitError if name == 'GitError' else SlimGitCommandError,)
+        if selected() == 'gitpython' or 'git.exc' in sys.modules:
+            from git import exc
+            errors += (getattr(exc, name),)
+        return errors
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,232 @@
+"""
+A persistent catalog of the release versions of a repository, stored in `.git/rflow/catalog.json`.
+It holds the sorted versions of the release tags (v<major>.<minor>.<patch>) and of the release branches, so queries
+such as "latest 2.x tag", "next free patch of 1.4" or "does v1.4.3 exist" are answered by bisection instead of
+listing and parsing every ref. The catalog is rebuilt with one ref scan when packed-refs or a directory holding
+release tags or release branches changed since it was saved; changes made by rflow itself are applied to it in place.
+"""
+import bisect
+import json
+import os
+import re
+import tempfile
+
+from rflow import git_operations
+from rflow import trace
+
+CATALOG_FILE = 'catalog.json'
+CATALOG_FORMAT = 1
+TAG_RE = re.compile(r'^refs/tags/v(\d+)\.(\d+)\.(\d+)$')
+BRANCH_RE = re.compile(r'^refs/(?:heads|remotes/[^/]+)/release/v(\d+)\.(\d+)\.(\d+)$')
+REF_PATTERNS = ('refs/tags/v*', 'refs/heads/release/v*', 'refs/remotes/*/release/v*')
+
+
+def parse_ref(ref):
+    """
+    :param ref: The full name of a ref.
+    :return: A ('tag' or 'branch', (major, minor, patch)) tuple, or None if the ref is not a release tag or branch.
+    """
+    for kind, regex in (('tag', TAG_RE), ('branch', BRANCH_RE)):
+        match = regex.match(ref)
+        if match:
+            return kind, tuple(int(part) for part in match.groups())
+    return None
+
+
+def parse_version(version):
+    """
+    :param version: A version string such as '1.4.3'.
+    :return: A (major, minor, patch) tuple, or None if the version is not of that form.
+    """
+    match = re.fullmatch(r'(\d+)\.(\d+)\.(\d+)', version)
+    return tuple(int(part) for part in match.groups()) if match else None
+
+
+def ref_stamp(repo):
+    """
+    Fingerprint the files that change whenever a release tag or branch is created or deleted: packed-refs and the
+    directories holding loose release tags and branches. A repository with `extensions.refStorage=reftable` keeps
+    neither; there every ref update adds a table to `reftable/tables.list`, whose list of table names is the stamp.
+    :param repo: The repository object.
+    :return: A dict mapping paths relative to the git directory to [mtime_ns, size] (or to the table names for
+             reftable), or None for missing paths.
+    """
+    tables_list = os.path.join(repo.common_dir, 'reftable', 'tables.list')
+    if os.path.isdir(os.path.dirname(tables_list)):
+        try:
+            with open(tables_list) as file:
+                return {'reftable/tables.list': file.read().split()}
+        except OSError:
+            return {'reftable/tables.list': None}
+    paths = ['packed-refs', 'refs/tags', 'refs/heads/release', 'refs/remotes']
+    remotes_dir = os.path.join(repo.common_dir, 'refs', 'remotes')
+    if os.path.isdir(remotes_dir):
+        paths += sorted(f'refs/remotes/{remote}/release' for remote in os.listdir(remotes_dir))
+    stamp = {}
+    for path in paths:
+        try:
+            stat = os.stat(os.path.join(repo.common_dir, path))
+            stamp[path] = [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            stamp[path] = None
+    return stamp
+
+
+class VersionCatalog:
+    """
+    The sorted release versions of a repository.
+    `tags` is a sorted list of (major, minor, patch) tuples, `branches` a sorted list of ((major, minor, patch), ref)
+    tuples covering local and remote-tracking release branches.
+    """
+
+    def __init__(self, tags=(), branches=(), stamp=None):
+        self.tags = sorted(set(tags))
+        self.branches = sorted(set(branches))
+        self.stamp = stamp
+
+    @classmethod
+    def scan(cls, repo):
+        """
+        Build the catalog from one scan of the release refs.
+        :param repo: The repository object.
+        :return: A `VersionCatalog`.
+        """
+        stamp = ref_stamp(repo)
+        tags, branches = [], []
+        with trace.span('scan release refs'):
+            for ref in git_operations.list_refs(repo, *REF_PATTERNS):
+                parsed = parse_ref(ref)
+                if parsed and parsed[0] == 'tag':
+                    tags.append(parsed[1])
+                elif parsed:
+                    branches.append((parsed[1], ref))
+        return cls(tags, branches, stamp)
+
+    @classmethod
+    def load(cls, repo):
+        """
+        Read the catalog saved in the repository, rebuilding and saving it if it is missing or out of date.
+        :param repo: The repository object.
+        :return: A `VersionCatalog`.
+        """
+        catalog = cls.read(repo)
+        if catalog is None:
+            catalog = cls.scan(repo)
+            catalog.save(repo)
+        return catalog
+
+    @classmethod
+    def read(cls, repo):
+        """
+        Read the catalog saved in the repository without ever scanning refs.
+        :param repo: The repository object.
+        :return: A `VersionCatalog`, or None if it is missing or out of date.
+        """
+        path = git_operations.state_path(repo, CATALOG_FILE)
+        try:
+            with open(path) as file:
+                data = json.load(file)
+            if data.get('format') == CATALOG_FORMAT and data.get('stamp') == ref_stamp(repo):
+                return cls([tuple(version) for version in data['tags']],
+                           [(tuple(entry[:3]), entry[3]) for entry in data['branches']], data['stamp'])
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        return None
+
+    def is_fresh(self, repo):
+        """
+        :param repo: The repository object.
+        :return: True if no release tag or branch was created or deleted since the catalog was built.
+        """
+        return self.stamp == ref_stamp(repo)
+
+    def save(self, repo):
+        """
+        Write the catalog atomically to `.git/rflow/catalog.json`.
+        :param repo: The repository object.
+        """
+        path = git_operations.state_path(repo, CATALOG_FILE)
+        data = {'format': CATALOG_FORMAT, 'stamp': self.stamp, 'tags': self.tags,
+                'branches': [[*version, ref] for version, ref in self.branches]}
+        with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), prefix='.catalog.', delete=False) as file:
+            json.dump(data, file, separators=(',', ':'))
+        os.replace(file.name, path)
+
+    def record(self, repo, refs):
+        """
+        Apply ref changes made by rflow itself, then take a new stamp, so they do not force a rebuild.
+        Only call this when the catalog was fresh right before the changes were made.
+        :param repo: The repository object.
+        :param refs: (ref, exists) tuples: the full name of every created, updated or deleted ref and whether it
+                     exists afterwards.
+        """
+        tags, branches = set(self.tags), set(self.branches)
+        for ref, exists in refs:
+            parsed = parse_ref(ref)
+            if not parsed:
+                continue
+            kind, version = parsed
+            entries, entry = (tags, version) if kind == 'tag' else (branches, (version, ref))
+            if exists:
+                entries.add(entry)
+            else:
+                entries.discard(entry)
+        self.tags, self.branches = sorted(tags), sorted(branches)
+        self.stamp = ref_stamp(repo)
+        self.save(repo)
+
+    def has_tag(self, version):
+        """
+        :param version: A version string such as '1.4.3'.
+        :return: True if the release tag v<version> exists, None if the version is not of the form
+                 <major>.<minor>.<patch> and thus not in the catalog.
+        """
+        key = parse_version(version)
+        if key is None:
+            return None
+        index = bisect.bisect_left(self.tags, key)
+        return index < len(self.tags) and self.tags[index] == key
+
+    def latest_tag(self, major=None, minor=None):
+        """
+        :param major: Restrict the search to one major version, e.g. 2 for the latest 2.x tag.
+        :param minor: Restrict the search further to one release line, e.g. 2 and 1 for the latest 2.1.x tag.
+        :return: The highest tagged version as a string, or None.
+        """
+        if minor is not None:
+            index = bisect.bisect_left(self.tags, (major, minor + 1))
+            if index and self.tags[index - 1][:2] == (major, minor):
+                return _format(self.tags[index - 1])
+            return None
+        return _format(_latest(self.tags, major))
+
+    def latest_branch(self, major=None):
+        """
+        :param major: Restrict the search to one major version.
+        :return: The highest release branch version as a string, or None.
+        """
+        return _format(_latest([version for version, _ in self.branches], major))
+
+    def next_free_patch(self, major, minor):
+        """
+        :param major: The major version of the release line.
+        :param minor: The minor version of the release line.
+        :return: The first version of the line above every tag of the line, e.g. '1.4.4' when v1.4.3 is the latest.
+        """
+        index = bisect.bisect_left(self.tags, (major, minor + 1))
+        if index and self.tags[index - 1][:2] == (major, minor):
+            return _format((major, minor, self.tags[index - 1][2] + 1))
+        return _format((major, minor, 0))
+
+
+def _latest(versions, major):
+    if major is None:
+        return versions[-1] if versions else None
+    index = bisect.bisect_left(versions, (major + 1,))
+    if index and versions[index - 1][0] == major:
+        return versions[index - 1]
+    return None
+
+
+def _format(version):
+    return '.'.join(str(part) for part in version) if version else None
@@ -0,0 +1,261 @@
+"""
+Release notes generated from the commit history, in the layout of RELEASE_TEMPLATE.md.
+
+The log of a range is consumed as a stream: `git log` output is parsed record by record, classified and appended to
+one spooled temporary file per section, which stays in memory for small ranges and moves to disk for large ones.
+A range spanning several release tags is cut at every tag into segments rendered as one version block each.
+Rendered blocks are cached under `.git/rflow/changelog/`, keyed by the commit ids of the segment ends, so
+regenerating cumulative notes only walks the commits added since the last run.
+"""
+import datetime
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from rflow import git_operations
+from rflow import history
+from rflow import trace
+
+TEMPLATE_FILE = 'RELEASE_TEMPLATE.md'
+CACHE_DIR = 'changelog'
+# The template used when the repository has no RELEASE_TEMPLATE.md
+DEFAULT_TEMPLATE = """# Release Notes
+
+## Version [Version Number] - [Release Date]
+
+### 🌟 Release Highlights:
+- [Highlight 1]
+
+### 🐞 Bug Fixes:
+- [Bug Fix 1]
+
+### 📚 Documentation Updates:
+- [Update 1]
+
+---
+"""
+# Section headings of the template are matched against these keywords, in order
+SECTION_KEYWORDS = (('fixes', ('bug', 'fix')), ('docs', ('doc',)), ('highlights', ('highlight', 'feature', 'change')))
+DOCS_SUBJECT_RE = re.compile(r'^docs?\b|\b(readme|manual|documentation)\b', re.IGNORECASE)
+SKIPPED_SUBJECT_RE = re.compile(r'^Update version\.info on ')
+RELEASE_TAG_RE = re.compile(r'^v(\d+)\.(\d+)\.(\d+)$')
+PLACEHOLDER_RE = re.compile(r'^\s*- \[.*\]\s*$')
+SPOOL_SIZE = 1024 * 1024
+# Bump when the rendering changes, to invalidate cached blocks
+CACHE_FORMAT = 1
+
+
+def iter_commits(repo, revision_range):
+    """
+    :param repo: The repository object.
+    :param revision_range: A range such as 'v1.3.0..v1.4.0'.
+    :return: A generator of `history.Commit` tuples, newest first, merges excluded.
+    """
+    for record in git_operations.stream_records(repo, 'log', '--no-merges', '--format=%H%x1f%s%x1e', revision_range):
+        sha, _, subject = record.strip('\n').partition('\x1f')
+        if sha:
+            yield history.Commit(sha, subject)
+
+
+def classify(commits):
+    """
+    :param commits: `history.Commit` tuples.
+    :return: A generator of (section, commit) tuples, where section is 'highlights', 'fixes' or 'docs'. The
+             version.info bumps made by rflow are left out.
+    """
+    for commit in commits:
+        if SKIPPED_SUBJECT_RE.match(commit.subject):
+            continue
+        if history.is_fix(commit.subject):
+            yield 'fixes', commit
+        elif DOCS_SUBJECT_RE.search(commit.subject):
+            yield 'docs', commit
+        else:
+            yield 'highlights', commit
+
+
+def spool_sections(entries):
+    """
+    Write classified commits as Markdown bullets into one spooled temporary file per section.
+    :param entries: (section, commit) tuples.
+    :return: A dict mapping section names to files positioned at their start. The caller closes them.
+    """
+    sections = {}
+    for section, commit in entries:
+        if section not in sections:
+            sections[section] = tempfile.SpooledTemporaryFile(SPOOL_SIZE, mode='w+', encoding='utf-8')
+        sections[section].write(f'- {commit.subject} ({commit.sha[:7]})\n')
+    for file in sections.values():
+        file.seek(0)
+    return sections
+
+
+def split_template(template):
+    """
+    Split a release notes template into the part before the version block, the version block and the part after it.
+    The version block starts at the '## Version' heading and ends before the next '---' line.
+    :param template: The text of the template.
+    :return: A (head, block, tail) tuple of strings.
+    """
+    lines = template.splitlines(keepends=True)
+    start = next((index for index, line in enumerate(lines) if line.startswith('## Version')), len(lines))
+    end = next((index for index in range(start, len(lines)) if lines[index].strip() == '---'), len(lines))
+    return ''.join(lines[:start]), ''.join(lines[start:end]), ''.join(lines[end:])
+
+
+def section_of(heading):
+    """
+    :param heading: A '### ' heading line of the template.
+    :return: The name of the section the heading stands for, or None.
+    """
+    text = heading.lower()
+    for section, keywords in SECTION_KEYWORDS:
+        if any(keyword in text for keyword in keywords):
+            return section
+    return None
+
+
+def render_block(block, version, date, sections, out):
+    """
+    Render the version block of the template: fill in the version and the date and replace the placeholder bullets
+    under every section heading with the bullets of the section.
+    :param block: The version block of the template.
+    :param version: The version the block describes.
+    :param date: The release date.
+    :param sections: A dict mapping section names to files of bullets, as returned by `spool_sections`.
+    :param out: The text stream the block is written to.
+    """
+    section = None
+    for line in block.splitlines(keepends=True):
+        if line.startswith('### '):
+            section = section_of(line)
+            out.write(line)
+            if section:
+                if section in sections:
+                    shutil.copyfileobj(sections[section], out)
+                else:
+                    out.write('- No changes.\n')
+            continue
+        if section and PLACEHOLDER_RE.match(line):
+            continue
+        if not line.strip():
+            section = None
+        out.write(line.replace('[Version Number]', version).replace('[Release Date]', date))
+
+
+def release_segments(repo, start, end):
+    """
+    Cut a range at the release tags it contains.
+    :param repo: The repository object.
+    :param start: The revision the range starts after.
+    :param end: The revision the range ends at.
+    :return: A list of (start, end, tag) tuples, oldest first, where tag is the release tag at the end of the
+             segment or None for commits after the last tag.
+    """
+    tags = []
+    for tag_name in git_operations.list_refs(repo, f'--merged={end}', f'--no-merged={start}', 'refs/tags/v*',
+                                             fmt='%(refname:strip=2)'):
+        match = RELEASE_TAG_RE.match(tag_name)
+        if match:
+            tags.append((tuple(int(part) for part in match.groups()), tag_name))
+    end_commit = git_operations.resolve_commit(repo, end)
+    segments, previous = [], start
+    for _, tag_name in sorted(tags):
+        segments.append((previous, tag_name, tag_name))
+        previous = tag_name
+    if git_operations.resolve_commit(repo, previous) != end_commit:
+        segments.append((previous, end, None))
+    return segments
+
+
+def generate(repo, start, end, out, version=None, template=None, use_cache=True):
+    """
+    Write the release notes of the commits after `start` up to `end`, newest version first.
+    :param repo: The repository object.
+    :param start: The revision the notes start after, e.g. 'v1.3.0'.
+    :param end: The revision the notes end at, e.g. 'v1.4.0' or 'HEAD'.
+    :param out: The text stream the notes are written to.
+    :param version: The version of commits after the last release tag of the range, by default the name of `end`.
+    :param template: The text of the template, by default RELEASE_TEMPLATE.md of the working tree if present.
+    :param use_cache: Whether to reuse and store rendered blocks under `.git/rflow/changelog/`.
+    :return: The number of segments that had to be computed from the log.
+    """
+    if template is None:
+        template = load_template(repo)
+    head, block, tail = split_template(template)
+    template_key = hashlib.sha1(f'{CACHE_FORMAT}\n{template}'.encode('utf-8')).hexdigest()[:12]
+    segments = release_segments(repo, start, end)
+    computed = 0
+    out.write(head)
+    for segment_start, segment_end, tag_name in reversed(segments):
+        segment_version = tag_name[1:] if tag_name else (version or end)
+        ends = '-'.join(git_operations.resolve_commit(repo, revision) for revision in (segment_start, segment_end))
+        key = f'{ends}-{template_key}-{hashlib.sha1(segment_version.encode("utf-8")).hexdigest()[:8]}'
+        cache_path = os.path.join(git_operations.state_path(repo, CACHE_DIR), f'{key}.md') if use_cache else None
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, encoding='utf-8') as cached:
+                shutil.copyfileobj(cached, out)
+            continue
+        computed += 1
+        with trace.span('render changelog segment', range=f'{segment_start}..{segment_end}'):
+            with tempfile.SpooledTemporaryFile(SPOOL_SIZE, mode='w+', encoding='utf-8') as rendered:
+                sections = spool_sections(classify(iter_commits(repo, f'{segment_start}..{segment_end}')))
+                try:
+                    render_block(block, segment_version, commit_date(repo, segment_end), sections, rendered)
+                finally:
+                    for file in sections.values():
+                        file.close()
+                rendered.seek(0)
+                if cache_path:
+                    _store(cache_path, rendered)
+                    rendered.seek(0)
+                shutil.copyfileobj(rendered, out)
+    out.write(tail)
+    return computed
+
+
+def load_template(repo):
+    """
+    :param repo: The repository object.
+    :return: The text of RELEASE_TEMPLATE.md in the working tree, or `DEFAULT_TEMPLATE`.
+    """
+    try:
+        with open(os.path.join(repo.working_dir, TEMPLATE_FILE), encoding='utf-8') as file:
+            return file.read()
+    except FileNotFoundError:
+        return DEFAULT_TEMPLATE
+
+
+def commit_date(repo, revision):
+    """
+    :param repo: The repository object.
+    :param revision: A revision.
+    :return: The committer date of the revision as YYYY-MM-DD.
+    """
+    timestamp = int(repo.git.log('-1', '--format=%ct', revision))
+    return datetime.date.fromtimestamp(timestamp).isoformat()
+
+
+def latest_release_tag(repo, revision='HEAD'):
+    """
+    :param repo: The repository object.
+    :param revision: The revision to start from.
+    :return: The closest release tag reachable from the revision, snapshot tags excluded, or None.
+    """
+    from rflow.backend import GitCommandError
+    try:
+        return repo.git.describe('--tags', '--abbrev=0', '--match', 'v[0-9]*.[0-9]*.[0-9]*', '--exclude', 'v*-*',
+                                 revision)
+    except GitCommandError:
+        return None
+
+
+def _store(path, source):
+    # Written to a temporary file first so that a concurrent reader never sees a partial block
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.segment.', delete=False, encoding='utf-8') as file:
+        shutil.copyfileobj(source, file)
+    os.replace(file.name, path)
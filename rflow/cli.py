@@ -1,174 +1,177 @@
 import os
-import datetime
+import time
+
 import click
+from rflow import flows
 from rflow import git_operations
+from rflow import history
+from rflow import snapshots
+from rflow import trace
 from rflow import version_operations
-from git.exc import GitError
+from rflow.context import RflowContext
 
 
 @click.group(invoke_without_command=True)
+@click.option('--trace', 'trace_file', envvar=trace.TRACE_ENV, type=click.Path(dir_okay=False),
+              help='Record every git command and write a Chrome trace to this file (or set RFLOW_TRACE).')
 @click.pass_context
-def cli(ctx):
+def cli(ctx, trace_file):
     """
     :param ctx: the click Context object
+    :param trace_file: (str) The file a Chrome trace of the invocation is written to, or None.
     :return: None
     This method is a click command group with the `invoke_without_command=True` option. It allows the CLI to be invoked
     without any subcommand. If no subcommand is provided, it will display a message using `click.echo()`.
+    The subcommands share one `RflowContext` holding the repository handle and the parsed version.info, which are
+    loaded only when a subcommand first needs them.
     Example usage:
         cli()
     """
+    if trace_file:
+        trace.start(trace_file)
+        ctx.call_on_close(trace.finish)
+    ctx.ensure_object(RflowContext)
     if ctx.invoked_subcommand is None:
         click.echo("rflow: try 'rflow --help' for more information")
-    git_operations.check_if_git_repo()
 
 
-@cli.command()
-def release():
+def multi_repo_options(command):
     """
-    Release Method
-    This method is used to create and push a release branch on a Git repository.
+    Decorator adding the options that run a command across the repositories listed in a manifest.
+    :param command: The click command function.
+    :return: The decorated function.
+    """
+    command = click.option('--per-host', type=click.IntRange(min=1), default=4, show_default=True,
+                           help='Repositories processed in parallel per remote host with --repos.')(command)
+    command = click.option('--jobs', type=click.IntRange(min=1), default=8, show_default=True,
+                           help='Repositories processed in parallel with --repos.')(command)
+    command = click.option('--repos', type=click.Path(exists=True, dir_okay=False),
+                           help='Run in every repository listed in this manifest file, one path per line.')(command)
+    return command
+
+
+def run_flow(rctx, flow, repos=None, jobs=8, per_host=4, **flow_kwargs):
+    """
+    Run a flow in the current repository, or in every repository of a manifest.
+    :param rctx: The `RflowContext` of the current repository.
+    :param flow: A function from `rflow.flows`.
+    :param repos: The path of a manifest file, or None to run in the current repository only.
+    :param jobs: The maximum number of repositories processed in parallel.
+    :param per_host: The maximum number of repositories processed in parallel per remote host.
+    :param flow_kwargs: Keyword arguments passed to the flow.
     :return: None
     """
+    from rflow.backend import GitError
+    if repos:
+        from rflow import orchestration
+        paths = orchestration.read_manifest(repos)
+        results = orchestration.run_across_repos(flow, paths, jobs, per_host, flow_kwargs)
+        click.echo(orchestration.format_summary(results))
+        failed = sum(1 for result in results if not result.ok)
+        if failed:
+            raise click.ClickException(f'{failed} of {len(results)} repositories failed.')
+        return
     try:
-        repo = git_operations.initialize_repo()
-        main_branch_name = git_operations.get_main_branch_name(repo)
-        git_operations.check_active_branch(repo, main_branch_name)
-        target_version = version_operations.read_next_version()
-        # Update version.info on main branch
-        current_version = target_version
-        next_version = version_operations.increment_minor_version(target_version)
-        version_operations.update_version_info('version.info', current_version, next_version)
-        repo.git.add('version.info')
-        repo.git.commit('-m', 'Update version.info on main branch')
-        # Push changes to main branch
-        repo.git.push('--set-upstream', 'origin', main_branch_name)
-        # Create and switch to release branch
-        release_branch = f'release/v{target_version}'
-        repo.git.checkout(main_branch_name, b=release_branch)
-        # Update version.info on release branch
-        next_version = version_operations.increment_patch_version(target_version)
-        version_operations.update_version_info('version.info', current_version, next_version)
-        repo.git.add('version.info')
-        repo.git.commit('-m', 'Update version.info on release branch')
-        # Push release branch
-        repo.git.push('--set-upstream', 'origin', release_branch)
-        click.echo(f'Release branch {release_branch} created and pushed.')
+        with trace.span(f'flow {flow.__name__}'):
+            flow(rctx, **flow_kwargs)
     except GitError as e:
         git_operations.handle_git_error(e)
 
 
 @cli.command()
-def major():
+@click.option('--dry-run', is_flag=True, help='Print the planned ref updates and pushes without applying them.')
+@click.option('--async-push', is_flag=True, help='Queue the push for a background worker and return right away.')
+@multi_repo_options
+@click.pass_obj
+def release(rctx, dry_run, async_push, repos, jobs, per_host):
+    """
+    Release Method
+    This method is used to create and push a release branch on a Git repository.
+    :return: None
+    """
+    run_flow(rctx, flows.release, repos, jobs, per_host, dry_run=dry_run, async_push=async_push)
+
+
+@cli.command()
+@click.option('--dry-run', is_flag=True, help='Print the planned ref updates and pushes without applying them.')
+@click.option('--async-push', is_flag=True, help='Queue the push for a background worker and return right away.')
+@multi_repo_options
+@click.pass_obj
+def major(rctx, dry_run, async_push, repos, jobs, per_host):
     """
     Create and push a major release branch.
     :return: None
     """
-    try:
-        repo = git_operations.initialize_repo()
-        main_branch_name = git_operations.get_main_branch_name(repo)
-        git_operations.check_active_branch(repo, main_branch_name)
-        current_version = version_operations.read_current_version()
-        major_version = version_operations.increment_major_version(current_version)
-        # Update version.info on main branch
-        next_minor_version = version_operations.increment_minor_version(major_version)
-        version_operations.update_version_info('version.info', major_version, next_minor_version)
-        repo.git.add('version.info')
-        repo.git.commit('-m', 'Update version.info on main branch')
-        # Push changes to main branch
-        repo.git.push('--set-upstream', 'origin', main_branch_name)
-        # Create and switch to major release branch
-        major_release_branch = f'release/v{major_version}'
-        repo.git.checkout(main_branch_name, b=major_release_branch)
-        # Update version.info on major release branch
-        next_patch_version = version_operations.increment_patch_version(major_version)
-        version_operations.update_version_info('version.info', major_version, next_patch_version)
-        repo.git.add('version.info')
-        repo.git.commit('-m', 'Update version.info on major release branch')
-        # Push major release branch
-        repo.git.push('--set-upstream', 'origin', major_release_branch)
-        click.echo(f'Major release branch {major_release_branch} created and pushed.')
-    except GitError as e:
-        git_operations.handle_git_error(e)
+    run_flow(rctx, flows.major, repos, jobs, per_host, dry_run=dry_run, async_push=async_push)
 
 
 @cli.command()
-@click.argument('tag_version', type=str)
-@click.argument('bug_description', type=str)
-def fix(tag_version, bug_description):
+@click.argument('tag_version', type=str, required=False)
+@click.argument('bug_description', type=str, required=False)
+@click.option('--to', 'lines', help='Comma-separated release lines or tags to fix at once, e.g. 1.2,1.3,2.0.')
+@click.option('--jobs', type=click.IntRange(min=1), default=8, show_default=True,
+              help='Release lines prepared in parallel with --to.')
+@click.option('--checkout', is_flag=True, help='Switch to the fix branch once it has been pushed.')
+@click.option('--dry-run', is_flag=True, help='Print the planned ref updates and pushes without applying them.')
+@click.option('--async-push', is_flag=True, help='Queue the push for a background worker and return right away.')
+@click.pass_obj
+def fix(rctx, tag_version, bug_description, lines, jobs, checkout, dry_run, async_push):
     """
     :param tag_version: The version number of the tag to fix the bug from.
     :param bug_description: A description of the bug that is being fixed.
+    :param lines: (str) The release lines to fix at once, separated by commas, or None.
+    :param jobs: (int) How many release lines are prepared in parallel.
+    :param checkout: (boolean) Whether to switch to the fix branch at the end.
+    :param dry_run: (boolean) Whether to only print the planned steps.
+    :param async_push: (boolean) Whether to queue the push for a background worker.
     :return: None
     This method creates a new fix branch and pushes it to the remote repository.
     The fix branch is created from a release branch corresponding to the provided tag version.
+    Branches are updated without checking them out, so the working tree is left untouched.
+    With `--to`, a fix branch is created on every listed release line, from its latest tag, and all branches are
+    pushed together.
     Example usage:
     rflow fix 1.0.3 bug-fix
+    rflow fix --to 1.2,1.3,2.0 bug-fix
     """
-    try:
-        repo = git_operations.initialize_repo()
-        tag = f'v{tag_version}'
-        if tag not in repo.tags:
-            click.echo(f"Tag {tag} not found.", err=True)
-            raise click.Abort()
-        repo.git.checkout(tag)
-        current_version = version_operations.read_next_version()
-        release_branch_name = f"release/v{current_version[:-2]}.0"
-        if release_branch_name not in repo.branches:
-            click.echo(f"Release branch {release_branch_name} does not exist for tag {tag}. Creating it.")
-            repo.git.checkout('-b', release_branch_name)
-        repo.git.checkout(release_branch_name)
-        next_patch_version = version_operations.increment_patch_version(current_version)
-        version_operations.update_version_info('version.info', current_version, next_patch_version)
-        repo.git.add('version.info')
-        repo.git.commit('-m', 'Update version.info on release branch')
-        repo.git.push('--set-upstream', 'origin', release_branch_name)
-        click.echo(f'Release branch {release_branch_name} updated and pushed.')
-        fix_branch_name = f'fix/{bug_description}-from-{tag_version}'
-        repo.git.checkout(tag, b=fix_branch_name)
-        version_operations.update_version_info('version.info', current_version, next_patch_version)
-        repo.git.add('version.info')
-        repo.git.commit('-m', 'Update version.info on fix branch')
-        repo.git.push('--set-upstream', 'origin', fix_branch_name)
-        click.echo(f'Fix branch {fix_branch_name} created and pushed.')
-    except GitError as e:
-        git_operations.handle_git_error(e)
+    if lines:
+        # The only positional argument is then the description
+        if bug_description is not None or tag_version is None:
+            raise click.UsageError('With --to, pass only the bug description: rflow fix --to 1.2,1.3 DESCRIPTION')
+        if checkout:
+            raise click.UsageError('--checkout cannot be combined with --to.')
+        versions = [version.strip() for version in lines.split(',') if version.strip()]
+        run_flow(rctx, flows.fix_lines, versions=versions, bug_description=tag_version, max_workers=jobs,
+                 dry_run=dry_run, async_push=async_push)
+        return
+    if bug_description is None:
+        raise click.UsageError('Missing argument: pass TAG_VERSION and BUG_DESCRIPTION.')
+    run_flow(rctx, flows.fix, tag_version=tag_version, bug_description=bug_description, checkout=checkout,
+             dry_run=dry_run, async_push=async_push)
 
 
 @cli.command()
-def init():
+@click.pass_obj
+def init(rctx):
     """
     Initializes the repository and creates a version.info file with the current and next versions.
     :return: None
     """
     try:
-        repo = git_operations.initialize_repo()
-        main_branch_name = git_operations.get_main_branch_name(repo)
-        git_operations.check_active_branch(repo, main_branch_name)
-        if os.path.exists('version.info'):
-            click.echo("version.info file already exists. Initialization aborted.")
-            return
-        latest_version = version_operations.get_latest_release_version(repo)
-        if latest_version:
-            current_version = latest_version
-            next_version = version_operations.increment_minor_version(latest_version)
-        else:
-            current_version = version_operations.init_version()
-            next_version = current_version
-        # Update version.info file
-        version_operations.update_version_info('version.info', current_version, next_version)
-        click.echo(f"Initialized version.info with version: {current_version}")
-    except (GitError, Exception) as e:
+        flows.init(rctx)
+    except Exception as e:
         git_operations.handle_git_error(e)
 
 
 @cli.command()
-def version():
+@click.pass_obj
+def version(rctx):
     """
     Get the current version from the 'version.info' file.
     :return: None
     """
     try:
-        current_version = version_operations.read_current_version()
+        current_version = rctx.version_info.current_version
         click.echo(f"Current version: {current_version}")
     except Exception as e:
         click.echo(f'Error: {str(e)}', err=True)
@@ -176,62 +179,274 @@ def version():
 
 
 @cli.command()
-def snap():
+@click.option('--all', 'all_lines', is_flag=True, help='Show the versions of every release branch and tag.')
+@click.pass_obj
+def versions(rctx, all_lines):
     """
-    Create a snapshot tag and push it to the remote repository.
+    :param all_lines: (boolean) Whether to report every release line instead of the working tree only.
     :return: None
+    This method shows the current and next versions. With `--all`, version.info is read from every release branch
+    and release tag through one batched object reader, and mismatches between tags and branches are flagged.
     """
+    from rflow.backend import GitError
+    if not all_lines:
+        click.echo(f'{rctx.version_info.current_version} (next {rctx.version_info.next_version})')
+        return
     try:
-        repo = git_operations.initialize_repo()
-        active_branch = repo.active_branch.name
-        main_branch_name = git_operations.get_main_branch_name(repo)
-        if active_branch == main_branch_name:
-            version = version_operations.read_next_version()
-        else:
-            version = version_operations.read_current_version()
-        timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        snapshot_tag = f'v{version}-{timestamp}'
-        repo.create_tag(snapshot_tag)
-        repo.git.push('origin', snapshot_tag)
-        click.echo(f'Snapshot tag {snapshot_tag} created and pushed.')
+        release_lines = version_operations.collect_release_lines(rctx.repo)
     except GitError as e:
-        click.echo(f'Error: {str(e)}', err=True)
-        raise click.Abort()
+        git_operations.handle_git_error(e)
+    click.echo(f"{'LINE':<8} {'BRANCH':<28} {'CURRENT':<10} {'NEXT':<10} {'LATEST TAG':<12} STATUS")
+    for release_line in release_lines:
+        info = release_line.branch_info
+        click.echo(f"{release_line.line:<8} {release_line.branch or '-':<28} "
+                   f"{info.current_version if info else '-':<10} {info.next_version if info else '-':<10} "
+                   f"{release_line.tag or '-':<12} {'; '.join(release_line.problems) or 'ok'}")
+    mismatches = sum(1 for release_line in release_lines if release_line.problems)
+    click.echo(f'{len(release_lines)} release line(s), {mismatches} with mismatches.')
 
 
 @cli.command()
-@click.option('-f', '--force', is_flag=True, help='Force tag creation, overwriting if it already exists.')
-def tag(force):
+@click.option('-v', '--verbose', is_flag=True, help='List the fixes missing on every release line.')
+@click.option('--write-commit-graph', is_flag=True, help='Write the commit-graph file first to speed up the walk.')
+@click.pass_obj
+def status(rctx, verbose, write_commit_graph):
     """
-    :param force: (boolean) Whether to force tag creation, overwriting if it already exists.
+    :param verbose: (boolean) Whether to list the missing fixes instead of only counting them.
+    :param write_commit_graph: (boolean) Whether to run `git commit-graph write` before the walk.
     :return: None
-    This method is for creating and pushing tags. The optional `--force` flag can be used to overwrite the tag.
+    This method shows, for every release branch, how many commits landed since its latest tag and how many fixes
+    on main have not been backported to it. All lines are computed from a single walk of the commit graph.
+    """
+    from rflow.backend import GitError
+    try:
+        repo = rctx.repo
+        if write_commit_graph:
+            repo.git.commit_graph('write', '--reachable')
+        statuses = history.release_status(repo, git_operations.get_main_branch_name(repo))
+    except GitError as e:
+        git_operations.handle_git_error(e)
+    click.echo(f"{'LINE':<8} {'BRANCH':<28} {'LATEST TAG':<12} {'SINCE TAG':>9} {'MISSING FIXES':>13}")
+    for line_status in statuses:
+        click.echo(f"{line_status.line:<8} {line_status.branch:<28} {line_status.tag or '-':<12} "
+                   f"{line_status.commits_since_tag:>9} {len(line_status.missing_fixes):>13}")
+        if verbose:
+            for commit in line_status.missing_fixes:
+                click.echo(f'         missing {commit.sha[:10]} {commit.subject}')
+
+
+@cli.command()
+@click.argument('revision_range', required=False)
+@click.option('--since-last-tag', is_flag=True, help='Describe the commits since the latest release tag.')
+@click.option('-o', '--output', type=click.File('w', encoding='utf-8'), default='-',
+              help='Write the notes to this file instead of the standard output.')
+@click.option('--no-cache', is_flag=True, help='Render every section from the log instead of reusing cached ones.')
+@click.pass_obj
+def changelog(rctx, revision_range, since_last_tag, output, no_cache):
     """
+    :param revision_range: (str) The commits to describe, e.g. 'v1.3.0..v1.4.0'.
+    :param since_last_tag: (boolean) Whether to describe the commits from the latest release tag to HEAD.
+    :param output: The file the notes are written to.
+    :param no_cache: (boolean) Whether to skip the cache of rendered sections.
+    :return: None
+    This method writes release notes in the layout of RELEASE_TEMPLATE.md, with one version section per release tag
+    in the range. The log is streamed, and the sections of past tag ranges are cached under .git/rflow/changelog.
+    Example usage:
+    rflow changelog v1.3.0..v1.4.0 -o NOTES.md
+    """
+    from rflow.backend import GitError
+    from rflow import changelog as changelog_notes
+    if bool(revision_range) == since_last_tag:
+        raise click.UsageError('Pass either a revision range such as v1.3.0..v1.4.0 or --since-last-tag.')
     try:
-        repo = git_operations.initialize_repo()
-        branch_name = repo.active_branch.name
-        if not git_operations.is_release_branch(branch_name):
-            click.echo("Tag command must be run from a release branch.")
-            raise click.Abort()
-        target_version = version_operations.read_current_version()
-        tag_name = f'v{target_version}'
-        if tag_name in repo.tags:
-            if force:
-                click.echo(f"Tag {tag_name} already exists. Overwriting due to --force option.")
-                repo.delete_tag(tag_name)
-                repo.create_tag(tag_name)
-                repo.git.push('origin', '--delete', tag_name)
-                repo.git.push('origin', tag_name)
-            else:
-                click.echo(f"Tag {tag_name} already exists. Use --force to overwrite.")
-                return
+        repo = rctx.repo
+        version = None
+        if since_last_tag:
+            start = changelog_notes.latest_release_tag(repo)
+            if start is None:
+                click.echo('Error: No release tag found before HEAD.', err=True)
+                raise click.Abort()
+            end = 'HEAD'
+            version = rctx.version_info.current_version
         else:
-            repo.create_tag(tag_name)
-            repo.git.push('origin', tag_name)
-        click.echo(f'Tag {tag_name} {"overwritten" if force else "created"} and pushed.')
+            start, separator, end = revision_range.partition('..')
+            if not separator or not start or not end or end.startswith('.'):
+                raise click.BadParameter('Expected a range such as v1.3.0..v1.4.0.', param_hint='REVISION_RANGE')
+            version = end[1:] if changelog_notes.RELEASE_TAG_RE.match(end) else None
+        changelog_notes.generate(repo, start, end, output, version=version, use_cache=not no_cache)
+    except GitError as e:
+        git_operations.handle_git_error(e)
+
+
+@cli.command()
+@click.option('--unique', is_flag=True, help='Add microseconds and a random token to the tag name.')
+@click.option('--defer', is_flag=True, help='Only create the tag locally; push it later with --push-deferred.')
+@click.option('--push-deferred', is_flag=True, help='Push all deferred snapshot tags in one push.')
+@click.option('--retries', type=click.IntRange(min=0), default=3, show_default=True,
+              help='How many times a tag name collision is retried under a unique name.')
+@click.option('--dry-run', is_flag=True, help='Print the planned ref updates and pushes without applying them.')
+@click.option('--async-push', is_flag=True, help='Queue the push for a background worker and return right away.')
+@multi_repo_options
+@click.pass_obj
+def snap(rctx, unique, defer, push_deferred, retries, dry_run, async_push, repos, jobs, per_host):
+    """
+    Create a snapshot tag and push it to the remote repository.
+    :param unique: (boolean) Whether to give the tag a unique name, for many concurrent snapshots of one version.
+    :param defer: (boolean) Whether to only create the tag locally.
+    :param push_deferred: (boolean) Whether to push the deferred snapshot tags instead of creating one.
+    :param retries: (int) How many times a name collision is retried.
+    :param dry_run: (boolean) Whether to only print the planned steps.
+    :param async_push: (boolean) Whether to queue the push for a background worker.
+    :return: None
+    """
+    if push_deferred:
+        if unique or defer or dry_run or async_push:
+            raise click.UsageError('--push-deferred cannot be combined with --unique, --defer, --dry-run or '
+                                   '--async-push.')
+        run_flow(rctx, flows.push_deferred_snapshots, repos, jobs, per_host, retries=retries)
+        return
+    run_flow(rctx, flows.snap, repos, jobs, per_host, unique=unique, defer=defer, retries=retries, dry_run=dry_run,
+             async_push=async_push)
+
+
+@cli.command('prune-snapshots')
+@click.option('--keep', type=click.IntRange(min=0), help='Keep the N most recent snapshot tags of every version.')
+@click.option('--older-than', help='Delete snapshot tags older than an age such as 30d, 12h or 2w.')
+@click.option('--local-only', is_flag=True, help='Only delete local tags, leave the remote untouched.')
+@click.option('--dry-run', is_flag=True, help='Show which tags would be deleted without deleting them.')
+@click.pass_obj
+def prune_snapshots(rctx, keep, older_than, local_only, dry_run):
+    """
+    :param keep: (int) How many snapshot tags to keep per version.
+    :param older_than: (str) Delete snapshot tags created longer ago than this age.
+    :param local_only: (boolean) Whether to leave the remote untouched.
+    :param dry_run: (boolean) Whether to only list the tags that would be deleted.
+    :return: None
+    This method deletes the snapshot tags created by `rflow snap` according to the retention policies. Local tags
+    are deleted in one ref transaction, remote tags through batched pushes of delete refspecs.
+    Example usage:
+    rflow prune-snapshots --keep 5 --older-than 30d
+    """
+    from rflow.backend import GitError
+    if keep is None and older_than is None:
+        raise click.UsageError('Specify at least one retention policy: --keep or --older-than.')
+    try:
+        age = snapshots.parse_age(older_than) if older_than is not None else None
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--older-than')
+    try:
+        remote = None if local_only else 'origin'
+        pruned_local, pruned_remote = snapshots.prune_snapshots(rctx.repo, keep, age, remote, dry_run)
+        for name in sorted(set(pruned_local) | set(pruned_remote)):
+            click.echo(f'{"Would delete" if dry_run else "Deleted"} {name}')
+        click.echo(f'{len(pruned_local)} local and {len(pruned_remote)} remote snapshot tag(s) '
+                   f'{"would be " if dry_run else ""}deleted.')
     except GitError as e:
         git_operations.handle_git_error(e)
 
 
+@cli.command('push-status')
+@click.option('--clear-failed', is_flag=True, help='Forget the pushes that failed.')
+@click.pass_obj
+def push_status(rctx, clear_failed):
+    """
+    :param clear_failed: (boolean) Whether to remove the failed pushes from the queue.
+    :return: None
+    This method shows the pushes queued with `--async-push` that are still in flight or have failed, and whether a
+    background worker is running. It exits with an error while failed pushes remain.
+    """
+    from rflow import push_queue
+    repo = rctx.repo
+    if clear_failed:
+        click.echo(f'{push_queue.clear_failed(repo)} failed push(es) removed.')
+    queue = [queued for queued in push_queue.read_queue(repo) if queued.status != 'done']
+    if queue:
+        click.echo(f"{'ID':<12} {'STATUS':<8} {'AGE':>6} {'TRIES':>5}  {'REMOTE':<8} REFSPECS")
+    for queued in queue:
+        click.echo(f"{queued.id:<12} {queued.status:<8} {format_age(time.time() - queued.created):>6} "
+                   f"{queued.attempts:>5}  {queued.remote:<8} {' '.join(map(describe_refspec, queued.refspecs))}")
+        if queued.error:
+            click.echo(f"{'':<12} last error: {queued.error}")
+    pending = sum(1 for queued in queue if queued.status == 'pending')
+    failed = len(queue) - pending
+    worker_running = push_queue.worker_running(repo)
+    click.echo(f"{pending} pending, {failed} failed push(es); background worker "
+               f"{'running' if worker_running else 'not running'}.")
+    if pending and not worker_running:
+        push_queue.start_worker_process(repo)
+        click.echo('Started a background worker for the pending pushes.')
+    if failed:
+        raise click.ClickException("Some pushes failed. Push them by hand, then run 'rflow push-status "
+                                   "--clear-failed'.")
+
+
+def describe_refspec(refspec):
+    """
+    :param refspec: A queued refspec such as '<sha>:refs/heads/main'.
+    :return: The short name of the destination and the abbreviated object, e.g. 'main@1a2b3c4d5e'.
+    """
+    if ':' not in refspec:
+        return refspec
+    source, _, destination = refspec.lstrip('+').rpartition(':')
+    name = destination.split('/', 2)[-1] if destination.startswith('refs/') else destination
+    return f'{name}@{source[:10]}' if source else f'{name} (delete)'
+
+
+def format_age(seconds):
+    """
+    :param seconds: A duration in seconds.
+    :return: The duration in the largest fitting unit, e.g. '42s', '5m' or '3h'.
+    """
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            return f'{int(seconds // size)}{unit}'
+    return f'{int(seconds)}s'
+
+
+@cli.command()
+@click.option('--socket', 'socket_file', type=click.Path(dir_okay=False),
+              help='The socket to listen on. Defaults to RFLOW_SOCKET, then rflow.sock in XDG_RUNTIME_DIR.')
+def serve(socket_file):
+    """
+    :param socket_file: (str) The path of the Unix socket to listen on, or None for the default.
+    :return: None
+    This method runs a daemon that executes the commands forwarded by the `rflow` entry point, keeping the repository
+    and the parsed version.info of every working tree in memory between commands. Stop it with Ctrl+C.
+    Example usage:
+    rflow serve &
+    """
+    from rflow import client
+    from rflow.daemon import RflowDaemon
+    path = socket_file or client.socket_path()
+    if not socket_file and not os.environ.get(client.SOCKET_ENV):
+        try:
+            client.private_directory(path)
+        except PermissionError as e:
+            raise click.ClickException(str(e))
+    with RflowDaemon(path, cli) as server:
+        click.echo(f'rflow daemon listening on {path}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+@cli.command()
+@click.option('-f', '--force', is_flag=True, help='Force tag creation, overwriting if it already exists.')
+@click.option('--dry-run', is_flag=True, help='Print the planned ref updates and pushes without applying them.')
+@click.option('--async-push', is_flag=True, help='Queue the push for a background worker and return right away.')
+@multi_repo_options
+@click.pass_obj
+def tag(rctx, force, dry_run, async_push, repos, jobs, per_host):
+    """
+    :param force: (boolean) Whether to force tag creation, overwriting if it already exists.
+    :param dry_run: (boolean) Whether to only print the planned steps.
+    :param async_push: (boolean) Whether to queue the push for a background worker.
+    :return: None
+    This method is for creating and pushing tags. The optional `--force` flag can be used to overwrite the tag.
+    """
+    run_flow(rctx, flows.tag, repos, jobs, per_host, force=force, dry_run=dry_run, async_push=async_push)
+
+
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,119 @@
+"""
+The `rflow` entry point.
+When an `rflow serve` daemon is listening, the command line of a command that does not push is forwarded to it over a
+Unix socket and its output is replayed here, which skips importing click, GitPython and parsing version.info in every
+call. Otherwise, or when RFLOW_NO_DAEMON is set, the command runs in this process as usual.
+This module only imports the standard library modules it needs to talk to the daemon.
+"""
+import json
+import os
+import socket
+import sys
+
+SOCKET_ENV = 'RFLOW_SOCKET'
+NO_DAEMON_ENV = 'RFLOW_NO_DAEMON'
+TIMEOUT_ENV = 'RFLOW_DAEMON_TIMEOUT'
+CONNECT_TIMEOUT = 1.0
+# How long a forwarded command may run, in seconds, before the daemon is considered stuck
+DEFAULT_TIMEOUT = 300.0
+# Environment variables forwarded to the daemon for the duration of a command
+FORWARDED_ENV_PREFIXES = ('RFLOW_', 'GIT_')
+# The commands the daemon runs: none of them pushes or starts the push worker, so none needs the caller's SSH agent or
+# credentials, and all are quick enough to run one at a time
+FORWARDED_COMMANDS = ('version', 'versions', 'status', 'changelog')
+
+
+def socket_path():
+    """
+    :return: The path of the daemon socket: RFLOW_SOCKET, else rflow.sock in XDG_RUNTIME_DIR, else rflow.sock in a
+             per-user directory of the temporary directory, see `private_directory`.
+    """
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'rflow.sock')
+    return os.path.join('/tmp', f'rflow-{os.getuid()}', 'rflow.sock')
+
+
+def private_directory(path):
+    """
+    Create the directory of the default socket path with mode 0700 if it is missing.
+    :param path: The path of the socket.
+    :raises PermissionError: If the directory belongs to another user or other users may access it.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    stat = os.stat(directory)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        raise PermissionError(f'{directory} must belong to the current user and be closed to other users.')
+
+
+def is_own_socket(path):
+    """
+    :param path: The path of the daemon socket.
+    :return: Whether the socket belongs to the current user, in a directory of the current user or of root, so that
+             the command line and the environment are never sent to a daemon run by someone else.
+    """
+    try:
+        directory_owner = os.stat(os.path.dirname(os.path.abspath(path))).st_uid
+        return os.stat(path).st_uid == os.getuid() and directory_owner in (os.getuid(), 0)
+    except OSError:
+        return False
+
+
+def forward(args, cwd, path=None, timeout=None):
+    """
+    Run a command line in the daemon.
+    :param args: The command line arguments, without the program name.
+    :param cwd: The directory the command runs in.
+    :param path: The path of the daemon socket, `socket_path()` by default.
+    :param timeout: How many seconds to wait for the output, RFLOW_DAEMON_TIMEOUT or `DEFAULT_TIMEOUT` by default.
+    :return: A (stdout, stderr, exit_code) tuple, or None if no daemon of the current user is listening.
+    """
+    path = path or socket_path()
+    if not hasattr(socket, 'AF_UNIX') or not is_own_socket(path):
+        return None
+    if timeout is None:
+        timeout = float(os.environ.get(TIMEOUT_ENV) or DEFAULT_TIMEOUT)
+    env = {name: value for name, value in os.environ.items() if name.startswith(FORWARDED_ENV_PREFIXES)}
+    request = json.dumps({'args': args, 'cwd': cwd, 'env': env}) + '\n'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(CONNECT_TIMEOUT)
+        try:
+            connection.connect(path)
+        except OSError:
+            return None  # Stale socket file left by a daemon that is gone, or one that does not accept anymore
+        connection.settimeout(timeout)
+        try:
+            connection.sendall(request.encode('utf-8'))
+            with connection.makefile('rb') as reader:
+                line = reader.readline()
+        except socket.timeout:
+            return '', f'Error: The rflow daemon on {path} did not answer within {timeout:g} seconds.\n', 1
+    if not line:
+        return None
+    response = json.loads(line)
+    return response['stdout'], response['stderr'], response['exit_code']
+
+
+def main(args=None):
+    """
+    Run rflow, through the daemon when one is listening and the command is one of `FORWARDED_COMMANDS`.
+    :param args: The command line arguments, `sys.argv[1:]` by default.
+    """
+    args = sys.argv[1:] if args is None else args
+    if not os.environ.get(NO_DAEMON_ENV) and args[:1] and args[0] in FORWARDED_COMMANDS:
+        result = forward(args, os.getcwd())
+        if result is not None:
+            stdout, stderr, exit_code = result
+            sys.stdout.write(stdout)
+            sys.stderr.write(stderr)
+            sys.exit(exit_code)
+    from rflow.cli import cli
+    cli.main(args, prog_name='rflow')
+
+
+if __name__ == '__main__':
+    main()
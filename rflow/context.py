@@ -0,0 +1,227 @@
+import os
+
+import click
+
+from rflow import git_operations
+from rflow import preflight
+from rflow import propagation
+from rflow import trace
+from rflow.catalog import VersionCatalog
+from rflow.plan import CommitSpec, apply
+from rflow.version_operations import VERSION_INFO_FILE, VersionInfo
+
+
+class RflowContext:
+    """
+    Per-invocation state shared by the rflow commands through the click context object.
+    The repository is opened once and version.info is parsed once; both are loaded on first use.
+    """
+
+    def __init__(self, path='.', echo=click.echo):
+        """
+        :param path: The root of the working tree the command operates on.
+        :param echo: The function messages are reported with, called as `echo(message, err=False)`.
+        """
+        self.path = os.path.abspath(path)
+        self.echo = echo
+        self._repo = None
+        self._version_info = None
+        self._version_info_dirty = False
+        self._catalog = None
+
+    @property
+    def repo(self):
+        """
+        :return: The `git.Repo` handle of the working tree, opened on first access.
+        :raises click.Abort: If the working tree is not a git repository.
+        """
+        if self._repo is None:
+            with trace.span('open repository'):
+                self._repo = git_operations.open_repo(self.path, echo=self.echo)
+        return self._repo
+
+    @property
+    def version_info_path(self):
+        return os.path.join(self.path, VERSION_INFO_FILE)
+
+    @property
+    def version_info(self):
+        """
+        :return: The parsed `VersionInfo` of the working tree, read from disk on first access.
+        :raises click.Abort: If version.info does not exist.
+        """
+        if self._version_info is None:
+            with trace.span('read version.info'):
+                self._version_info = VersionInfo.load(self.version_info_path, echo=self.echo)
+        return self._version_info
+
+    @property
+    def catalog(self):
+        """
+        :return: The `VersionCatalog` of the repository, loaded on first access and refreshed when refs changed.
+        """
+        if self._catalog is None or not self._catalog.is_fresh(self.repo):
+            with trace.span('load version catalog'):
+                self._catalog = VersionCatalog.load(self.repo)
+        return self._catalog
+
+    def update_version_info(self, current_version, next_version):
+        """
+        Change the versions in the cached model. Nothing is written until `flush` is called.
+        :param current_version: The current version.
+        :param next_version: The next version.
+        """
+        if self._version_info is None and not os.path.exists(self.version_info_path):
+            self._version_info = VersionInfo({'currentVersion': current_version, 'nextVersion': next_version})
+        self.version_info.update(current_version, next_version)
+        self._version_info_dirty = True
+
+    def flush(self):
+        """
+        Write the cached version.info model to disk if it has been changed.
+        """
+        if self._version_info_dirty:
+            self._version_info.save(self.version_info_path)
+            self._version_info_dirty = False
+
+    def read_version_info(self, revision):
+        """
+        Parse version.info as stored in a revision, without checking it out.
+        :param revision: The commit, branch or tag to read from.
+        :return: A `VersionInfo` instance.
+        :raises ValueError: If the revision has no valid version.info.
+        """
+        content = git_operations.read_file(self.repo, revision, VERSION_INFO_FILE)
+        if content is None:
+            raise ValueError(f"version.info not found in {revision}")
+        return VersionInfo.from_json(content)
+
+    def plan_version_info(self, plan, branch, current_version, next_version, message, start_point=None):
+        """
+        Plan a version.info bump on a branch without checking the branch out.
+        The commit goes on top of the branch tip, or of what the plan already puts there, and the branch ref is
+        updated with a compare-and-swap on its current value. The files version.info declares under `propagate` are
+        rewritten in the same commit. When the branch is the one checked out, the changed files are refreshed in the
+        index and the working tree with one checkout once the plan is applied.
+        :param plan: The `Plan` to add the steps to.
+        :param branch: The short name of the branch, e.g. 'release/v1.2.0'.
+        :param current_version: The current version to record.
+        :param next_version: The next version to record.
+        :param message: The commit message.
+        :param start_point: The branch or revision a missing branch is created from.
+        :return: The planned `CommitSpec`.
+        :raises ValueError: If the branch is missing and the start point cannot be found, or a propagate rule is
+                            malformed.
+        """
+        repo = self.repo
+        ref = f'refs/heads/{branch}'
+        tip = git_operations.resolve_commit(repo, ref)
+        old_value = tip or ''
+        parent = plan.pending(ref) or tip
+        if parent is None:
+            # A branch that only exists on the remote continues from its remote-tracking branch
+            parent = git_operations.resolve_commit(repo, git_operations.tracking_ref(ref))
+        if parent is None:
+            parent = plan.pending(f'refs/heads/{start_point}') or git_operations.resolve_commit(repo, start_point)
+            if parent is None:
+                raise ValueError(f"Cannot create {branch}: {start_point} not found.")
+        checked_out = git_operations.current_branch(repo) == branch
+        if checked_out and not plan.pending(ref):
+            version_info = VersionInfo(dict(self.version_info.data))
+        else:
+            content = parent.read(repo, VERSION_INFO_FILE) if isinstance(parent, CommitSpec) \
+                else git_operations.read_file(repo, parent, VERSION_INFO_FILE)
+            if content is None:
+                raise ValueError(f"version.info not found in {start_point if tip is None else branch}")
+            version_info = VersionInfo.from_json(content)
+        version_info.update(current_version, next_version)
+        files = {VERSION_INFO_FILE: version_info.to_json()}
+        files.update(propagation.propagate(repo, parent, version_info))
+        spec = plan.commit(ref, parent, files, message, old_value)
+        if checked_out:
+            plan.refresh_paths += [path for path in files if path not in plan.refresh_paths]
+        return spec
+
+    def run_plan(self, plan, dry_run=False, async_push=False):
+        """
+        Apply a plan and report its messages, or only print its steps.
+        The refs the plan pushes are checked against the remote first, see `preflight`.
+        :param plan: The `Plan` to run.
+        :param dry_run: Whether to print the plan instead of applying it.
+        :param async_push: Whether to queue the pushes for the background worker instead of waiting for them.
+        :raises PreflightError: If the remote has conflicting refs, in which case nothing is changed.
+        :raises click.ClickException: If files the plan refreshes have uncommitted changes, in which case nothing is
+                                      changed.
+        """
+        if dry_run:
+            self.echo('Dry run, nothing was changed. Planned steps:')
+            for line in plan.describe():
+                self.echo(f'  {line}')
+            return
+        from rflow.backend import GitCommandError
+        repo = self.repo
+        # version.info is planned from the working tree, the other refreshed files from the branch tip
+        dirty = git_operations.dirty_paths(repo, [path for path in plan.refresh_paths if path != VERSION_INFO_FILE])
+        if dirty:
+            raise click.ClickException(f"Uncommitted changes to {', '.join(dirty)} would be overwritten; commit or "
+                                       f"stash them first.")
+        self.preflight(plan, async_push)
+        # Changes to a catalog that is up to date are recorded in place instead of forcing a rebuild later
+        catalog = self._catalog if self._catalog and self._catalog.is_fresh(repo) else VersionCatalog.read(repo)
+        with trace.span('apply plan'):
+            try:
+                results = apply(repo, plan, push=not async_push)
+            except GitCommandError:
+                # A rejected push leaves the remote in an unknown state
+                for target in preflight.push_targets(plan):
+                    preflight.record(repo, target.remote, {target.destination: ...})
+                raise
+        for remote, values in preflight.pushed_values(plan, results).items():
+            preflight.record(repo, remote, values)
+        if catalog is not None:
+            changed = [(update.ref, update.new is not None) for update in plan.ref_updates]
+            changed += [(git_operations.tracking_ref(ref.destination, result.remote), True)
+                        for result in results for ref in result.refs if ref.flag != '!']
+            catalog.record(repo, changed)
+            self._catalog = catalog
+        if plan.refresh_paths or plan.checkout:
+            self.discard_version_info()
+        messages = plan.report(queued=async_push and bool(plan.pushes))
+        for message in messages:
+            self.echo(message)
+        if async_push and plan.pushes:
+            from rflow import push_queue
+            push_queue.enqueue(repo, preflight.pinned_pushes(repo, plan),
+                               description=messages[0] if messages else '')
+            for target in preflight.push_targets(plan):
+                preflight.record(repo, target.remote, {target.destination: ...})
+            self.echo("Push queued in the background; run 'rflow push-status' to follow it.")
+
+    def preflight(self, plan, async_push=False):
+        """
+        Check the refs a plan pushes against the remote before anything is changed locally.
+        :param plan: The `Plan` about to be applied.
+        :param async_push: Whether the pushes will be queued. A remote that cannot be reached is then not an error,
+                           since the background worker retries the push later.
+        :raises PreflightError: If the remote has conflicting refs.
+        """
+        from rflow.backend import GitCommandError
+        if not plan.pushes:
+            return
+        try:
+            with trace.span('preflight'):
+                conflicts = preflight.check(self.repo, plan)
+        except GitCommandError:
+            if not async_push:
+                raise
+            self.echo('Could not reach the remote to check the push beforehand; queueing it anyway.', err=True)
+            return
+        if conflicts:
+            raise preflight.PreflightError(conflicts)
+
+    def discard_version_info(self):
+        """
+        Forget the cached model, e.g. after a checkout replaced version.info in the working tree.
+        """
+        self._version_info = None
+        self._version_info_dirty = False
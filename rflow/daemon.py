@@ -0,0 +1,167 @@
+"""
+The `rflow serve` daemon.
+It runs the commands forwarded by `rflow.client` one at a time in a single process, keeping one `RflowContext`, and
+with it one open repository and its parsed version.info, per working tree. The parsed version.info is dropped when
+version.info, HEAD or a ref changed on disk since the previous command, e.g. after a commit or a checkout made outside
+rflow. Only the commands of `client.FORWARDED_COMMANDS` are run: they never push nor start the push worker, so they
+need neither the caller's credentials nor to run in parallel with each other.
+"""
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import traceback
+
+import click
+
+from rflow.catalog import ref_stamp
+from rflow.client import FORWARDED_COMMANDS
+from rflow.context import RflowContext
+
+
+class RflowDaemon(socketserver.UnixStreamServer):
+    """
+    A Unix socket server answering one JSON request per connection with the output and exit code of the command.
+    """
+
+    def __init__(self, path, cli):
+        """
+        :param path: The path of the socket to listen on.
+        :param cli: The click command group that runs the commands.
+        """
+        self.cli = cli
+        self.contexts = {}
+        remove_stale_socket(path)
+        old_umask = os.umask(0o177)  # Only the owner may connect
+        try:
+            super().__init__(path, RequestHandler)
+        finally:
+            os.umask(old_umask)
+
+    def server_close(self):
+        super().server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.server_address)
+
+    def context_for(self, cwd):
+        """
+        :param cwd: The directory a command runs in.
+        :return: The cached `RflowContext` of the directory, with stale cached data dropped.
+        """
+        rctx, stamp = self.contexts.get(cwd, (None, None))
+        if rctx is None:
+            rctx = RflowContext(cwd)
+        current_stamp = file_stamp(rctx)
+        if stamp is not None and stamp != current_stamp:
+            rctx.discard_version_info()
+        self.contexts[cwd] = (rctx, current_stamp)
+        return rctx
+
+    def run(self, args, cwd, env):
+        """
+        Run one command line.
+        :param args: The command line arguments.
+        :param cwd: The directory the command runs in.
+        :param env: Environment variables set for the duration of the command.
+        :return: A dict with the `stdout`, `stderr` and `exit_code` of the command.
+        """
+        if not args[:1] or args[0] not in FORWARDED_COMMANDS:
+            return {'stdout': '', 'stderr': f"Error: The daemon does not run '{' '.join(args[:1])}'.\n", 'exit_code': 2}
+        rctx = self.context_for(cwd)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        saved_env = {name: os.environ.get(name) for name in env}
+        saved_cwd = os.getcwd()
+        os.environ.update(env)
+        try:
+            os.chdir(cwd)
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                exit_code = self.invoke(args, rctx)
+        finally:
+            os.chdir(saved_cwd)
+            for name, value in saved_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+        if exit_code:
+            rctx.discard_version_info()  # Do not keep a model a failed command may have changed
+        # The command may have changed version.info or HEAD itself
+        self.contexts[cwd] = (rctx, file_stamp(rctx))
+        return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'exit_code': exit_code}
+
+    def invoke(self, args, rctx):
+        # Mirrors click's standalone mode, which would otherwise exit the daemon
+        try:
+            result = self.cli.main(args, prog_name='rflow', obj=rctx, standalone_mode=False)
+            return result if isinstance(result, int) else 0
+        except click.ClickException as e:
+            e.show()
+            return e.exit_code
+        except click.Abort:
+            click.echo('Aborted!', err=True)
+            return 1
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            return 1
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        response = self.server.run(request['args'], request['cwd'], request.get('env', {}))
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+def file_stamp(rctx):
+    """
+    :param rctx: An `RflowContext`.
+    :return: The modification times and sizes of version.info and, once the repository has been opened, of HEAD, the
+             branch it points to and the refs the version catalog watches. They change whenever the cached data may be
+             stale.
+    """
+    paths = [rctx.version_info_path]
+    repo = rctx._repo  # A repository no command opened yet has nothing cached
+    if repo is not None:
+        head = os.path.join(repo.git_dir, 'HEAD')
+        paths.append(head)
+        try:
+            with open(head) as file:
+                target = file.read().strip()
+        except OSError:
+            target = ''
+        if target.startswith('ref: '):
+            paths.append(os.path.join(repo.common_dir, target[5:]))
+    stamp = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamp.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamp.append(None)
+    if repo is not None:
+        stamp.append(json.dumps(ref_stamp(repo), sort_keys=True))
+    return tuple(stamp)
+
+
+def remove_stale_socket(path):
+    """
+    Remove a socket file no daemon listens on anymore.
+    :param path: The path of the socket.
+    :raises click.ClickException: If a daemon is already listening on it.
+    """
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            os.remove(path)
+            return
+    raise click.ClickException(f'An rflow daemon is already listening on {path}.')
@@ -0,0 +1,398 @@
+"""
+The rflow commands as library functions.
+Every flow works on an `RflowContext`, reports through `rctx.echo` and raises `click.Abort` or `GitError` on failure,
+so it can be driven by the CLI as well as by other code such as the multi-repository orchestration.
+Flows that change refs first build a `Plan`, then apply it or, with `dry_run`, only print it.
+"""
+import os
+
+import click
+
+from rflow import git_operations
+from rflow import snapshots
+from rflow import version_operations
+from rflow.catalog import parse_version
+from rflow.plan import Plan
+from rflow.preflight import PreflightError
+
+
+def echo_pushed(plan, action):
+    """
+    Record the message of a change the plan pushes, worded for both a push and a queued push.
+    :param plan: The `Plan`.
+    :param action: What happened locally, e.g. 'Release branch release/v1.2.0 created'.
+    """
+    plan.echo(f'{action} and pushed.', queued=f'{action} and queued for push.')
+
+
+def release(rctx, dry_run=False, async_push=False):
+    """
+    Create and push a release branch.
+    :param rctx: The `RflowContext` of the repository.
+    :param dry_run: Whether to only print the planned steps.
+    :param async_push: Whether to queue the push for the background worker.
+    :return: None
+    """
+    rctx.run_plan(plan_release(rctx), dry_run, async_push)
+
+
+def plan_release(rctx):
+    """
+    :param rctx: The `RflowContext` of the repository.
+    :return: The `Plan` of `release`.
+    """
+    repo = rctx.repo
+    plan = Plan()
+    main_branch_name = git_operations.get_main_branch_name(repo)
+    git_operations.check_active_branch(repo, main_branch_name, echo=rctx.echo)
+    target_version = rctx.version_info.next_version
+    # Update version.info on main branch
+    current_version = target_version
+    next_version = version_operations.increment_minor_version(target_version)
+    rctx.plan_version_info(plan, main_branch_name, current_version, next_version, 'Update version.info on main branch')
+    # Create release branch from the new main commit without checking it out
+    release_branch = f'release/v{target_version}'
+    next_version = version_operations.increment_patch_version(target_version)
+    rctx.plan_version_info(plan, release_branch, current_version, next_version,
+                           'Update version.info on release branch', start_point=main_branch_name)
+    # Push main and release branch together
+    plan.push([main_branch_name, release_branch], set_upstream=True)
+    echo_pushed(plan, f'Release branch {release_branch} created')
+    return plan
+
+
+def major(rctx, dry_run=False, async_push=False):
+    """
+    Create and push a major release branch.
+    :param rctx: The `RflowContext` of the repository.
+    :param dry_run: Whether to only print the planned steps.
+    :param async_push: Whether to queue the push for the background worker.
+    :return: None
+    """
+    rctx.run_plan(plan_major(rctx), dry_run, async_push)
+
+
+def plan_major(rctx):
+    """
+    :param rctx: The `RflowContext` of the repository.
+    :return: The `Plan` of `major`.
+    """
+    repo = rctx.repo
+    plan = Plan()
+    main_branch_name = git_operations.get_main_branch_name(repo)
+    git_operations.check_active_branch(repo, main_branch_name, echo=rctx.echo)
+    current_version = rctx.version_info.current_version
+    major_version = version_operations.increment_major_version(current_version)
+    # Update version.info on main branch
+    next_minor_version = version_operations.increment_minor_version(major_version)
+    rctx.plan_version_info(plan, main_branch_name, major_version, next_minor_version,
+                           'Update version.info on main branch')
+    # Create major release branch from the new main commit without checking it out
+    major_release_branch = f'release/v{major_version}'
+    next_patch_version = version_operations.increment_patch_version(major_version)
+    rctx.plan_version_info(plan, major_release_branch, major_version, next_patch_version,
+                           'Update version.info on major release branch', start_point=main_branch_name)
+    # Push main and major release branch together
+    plan.push([main_branch_name, major_release_branch], set_upstream=True)
+    echo_pushed(plan, f'Major release branch {major_release_branch} created')
+    return plan
+
+
+def fix(rctx, tag_version, bug_description, checkout=False, dry_run=False, async_push=False):
+    """
+    Update the release branch of a tag and create a fix branch from the tag, then push both.
+    :param rctx: The `RflowContext` of the repository.
+    :param tag_version: The version number of the tag to fix the bug from.
+    :param bug_description: A description of the bug that is being fixed.
+    :param checkout: Whether to switch to the fix branch at the end.
+    :param dry_run: Whether to only print the planned steps.
+    :param async_push: Whether to queue the push for the background worker.
+    :return: None
+    """
+    rctx.run_plan(plan_fix(rctx, tag_version, bug_description, checkout, dry_run), dry_run, async_push)
+
+
+def plan_fix(rctx, tag_version, bug_description, checkout=False, dry_run=False):
+    """
+    :param rctx: The `RflowContext` of the repository.
+    :param tag_version: The version number of the tag to fix the bug from.
+    :param bug_description: A description of the bug that is being fixed.
+    :param checkout: Whether to switch to the fix branch at the end.
+    :param dry_run: Whether the plan is only described, in which case nothing is fetched.
+    :return: The `Plan` of `fix`.
+    """
+    repo = rctx.repo
+    plan = Plan()
+    tag = f'v{tag_version}'
+    if not dry_run:
+        git_operations.fetch_missing_refs(repo, [f'refs/tags/{tag}'])
+    exists = rctx.catalog.has_tag(tag_version)
+    if exists is None:
+        exists = git_operations.tag_exists(repo, tag)
+    if not exists:
+        rctx.echo(f"Tag {tag} not found.", err=True)
+        raise click.Abort()
+    fix_branch_name = f'fix/{bug_description}-from-{tag_version}'
+    if git_operations.branch_exists(repo, fix_branch_name):
+        rctx.echo(f"Fix branch {fix_branch_name} already exists.", err=True)
+        raise click.Abort()
+    current_version, release_branch_name = fix_release_line(rctx, tag)
+    if not dry_run:
+        git_operations.fetch_missing_refs(repo, [f'refs/heads/{release_branch_name}'])
+    if not git_operations.remote_branch_exists(repo, release_branch_name):
+        rctx.echo(f"Release branch {release_branch_name} does not exist for tag {tag}. Creating it.")
+    next_patch_version = version_operations.increment_patch_version(current_version)
+    rctx.plan_version_info(plan, release_branch_name, current_version, next_patch_version,
+                           'Update version.info on release branch', start_point=tag)
+    rctx.plan_version_info(plan, fix_branch_name, current_version, next_patch_version,
+                           'Update version.info on fix branch', start_point=tag)
+    plan.push([release_branch_name, fix_branch_name], set_upstream=True)
+    echo_pushed(plan, f'Release branch {release_branch_name} updated')
+    echo_pushed(plan, f'Fix branch {fix_branch_name} created')
+    if checkout:
+        plan.checkout = fix_branch_name
+    return plan
+
+
+def fix_release_line(rctx, tag):
+    """
+    :param rctx: The `RflowContext` of the repository.
+    :param tag: The release tag a fix starts from, e.g. 'v1.2.3'.
+    :return: A (current_version, release_branch_name) tuple: the version the fix will have and its release branch.
+    """
+    current_version = rctx.read_version_info(tag).next_version
+    return current_version, f"release/v{current_version[:-2]}.0"
+
+
+def fix_lines(rctx, versions, bug_description, max_workers=8, dry_run=False, async_push=False):
+    """
+    Create fix branches for one bug on several release lines and push them all together.
+    :param rctx: The `RflowContext` of the repository.
+    :param versions: The release lines ('1.2') or tags ('1.2.3') to fix; a line stands for its latest tag.
+    :param bug_description: A description of the bug that is being fixed.
+    :param max_workers: How many release lines are prepared in parallel.
+    :param dry_run: Whether to only print the planned steps.
+    :param async_push: Whether to queue the push for the background worker.
+    :return: None
+    """
+    rctx.run_plan(plan_fix_lines(rctx, versions, bug_description, max_workers, dry_run), dry_run, async_push)
+
+
+def plan_fix_lines(rctx, versions, bug_description, max_workers=8, dry_run=False):
+    """
+    Every release line is planned and its commits are written in a worker thread; all of that is plumbing on the
+    shared object database, so neither the working tree nor any checkout is involved and the lines do not wait for
+    each other. The merged plan moves every ref in one transaction and pushes every branch in one atomic push.
+    :param rctx: The `RflowContext` of the repository.
+    :param versions: The release lines ('1.2') or tags ('1.2.3') to fix.
+    :param bug_description: A description of the bug that is being fixed.
+    :param max_workers: How many release lines are prepared in parallel.
+    :param dry_run: Whether the plan is only described, in which case nothing is fetched and no object is written.
+    :return: The merged `Plan` of all lines.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    repo = rctx.repo
+    tag_versions = [line_tag_version(rctx, version) for version in versions]
+    if len(set(tag_versions)) != len(tag_versions):
+        rctx.echo(f"Release lines {', '.join(versions)} resolve to the same tag more than once.", err=True)
+        raise click.Abort()
+    if not dry_run:
+        # Fetch what shallow or narrow clones lack in two round trips up front, so the workers never fetch
+        git_operations.fetch_missing_refs(repo, [f'refs/tags/v{tag_version}' for tag_version in tag_versions])
+        release_branches = []
+        for tag_version in tag_versions:
+            if git_operations.ref_exists(repo, f'refs/tags/v{tag_version}'):
+                release_branches.append(f'refs/heads/{fix_release_line(rctx, f"v{tag_version}")[1]}')
+        git_operations.fetch_missing_refs(repo, release_branches)
+    rctx.catalog  # Loaded once here instead of by the first workers at the same time
+
+    def plan_line(tag_version):
+        line_plan = plan_fix(rctx, tag_version, bug_description, dry_run=dry_run)
+        if not dry_run:
+            line_plan.write_commits(repo)
+        return line_plan
+
+    plan = Plan()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(tag_versions)) or 1) as executor:
+        for line_plan in executor.map(plan_line, tag_versions):
+            try:
+                plan.merge(line_plan)
+            except ValueError as e:
+                rctx.echo(f'Error: {e}', err=True)
+                raise click.Abort()
+    # One atomic push for all lines instead of one push per line
+    plan.pushes = plan.grouped_pushes()
+    return plan
+
+
+def line_tag_version(rctx, version):
+    """
+    :param rctx: The `RflowContext` of the repository.
+    :param version: A release line such as '1.2', or a full version such as '1.2.3'.
+    :return: The full version of the tag to fix: the version itself, or the latest tag of the line.
+    :raises click.Abort: If the line has no release tag.
+    """
+    parts = version.lstrip('v').split('.')
+    if len(parts) != 2:
+        return version.lstrip('v')
+    try:
+        major_version, minor_version = int(parts[0]), int(parts[1])
+    except ValueError:
+        rctx.echo(f"Invalid release line {version}.", err=True)
+        raise click.Abort()
+    latest = rctx.catalog.latest_tag(major_version, minor_version)
+    if latest is None and git_operations.is_incomplete_clone(rctx.repo):
+        advertised = git_operations.ls_remote(rctx.repo, 'origin', f'refs/tags/v{major_version}.{minor_version}.*')
+        found = [key for key in (parse_version(ref[len('refs/tags/v'):]) for ref in advertised) if key]
+        latest = '.'.join(str(part) for part in max(found)) if found else None
+    if latest is None:
+        rctx.echo(f"No release tag found for line {version}.", err=True)
+        raise click.Abort()
+    return latest
+
+
+def init(rctx):
+    """
+    Create version.info with the current and next versions derived from the existing release branches.
+    :param rctx: The `RflowContext` of the repository.
+    :return: None
+    """
+    repo = rctx.repo
+    main_branch_name = git_operations.get_main_branch_name(repo)
+    git_operations.check_active_branch(repo, main_branch_name, echo=rctx.echo)
+    if os.path.exists(rctx.version_info_path):
+        rctx.echo("version.info file already exists. Initialization aborted.")
+        return
+    # Clones that do not track every branch ask the remote for its release branches instead
+    if git_operations.is_incomplete_clone(repo):
+        latest_version = version_operations.get_latest_release_version(repo, 'origin')
+    else:
+        latest_version = rctx.catalog.latest_branch()
+    if latest_version:
+        current_version = latest_version
+        next_version = version_operations.increment_minor_version(latest_version)
+    else:
+        current_version = version_operations.init_version()
+        next_version = current_version
+    # Update version.info file
+    rctx.update_version_info(current_version, next_version)
+    rctx.flush()
+    rctx.echo(f"Initialized version.info with version: {current_version}")
+
+
+def snap(rctx, unique=False, defer=False, retries=3, dry_run=False, async_push=False):
+    """
+    Create a snapshot tag and push it to the remote repository.
+    When a tag of the same name already exists, locally or on the remote, the snapshot is retried under a unique name.
+    :param rctx: The `RflowContext` of the repository.
+    :param unique: Whether to give the tag a unique name right away, for many concurrent snapshots of one version.
+    :param defer: Whether to only create the tag locally, to be pushed later by `push_deferred_snapshots`.
+    :param retries: How many times a name collision is retried.
+    :param dry_run: Whether to only print the planned steps.
+    :param async_push: Whether to queue the push for the background worker. Name collisions on the remote are then
+                       reported by `rflow push-status` instead of being retried.
+    :return: The name of the snapshot tag.
+    """
+    from rflow.backend import GitCommandError
+    repo = rctx.repo
+    active_branch = git_operations.current_branch(repo)
+    main_branch_name = git_operations.get_main_branch_name(repo)
+    if active_branch == main_branch_name:
+        version = rctx.version_info.next_version
+    else:
+        version = rctx.version_info.current_version
+    head = git_operations.resolve_commit(repo, 'HEAD')
+    for attempt in range(retries + 1):
+        snapshot_tag = snapshots.snapshot_tag_name(version, unique=unique or attempt > 0)
+        tag_ref = f'refs/tags/{snapshot_tag}'
+        plan = Plan()
+        plan.update_ref(tag_ref, head, '')
+        if defer:
+            plan.echo(f'Snapshot tag {snapshot_tag} created, push deferred.')
+        else:
+            plan.push([tag_ref])
+            echo_pushed(plan, f'Snapshot tag {snapshot_tag} created')
+        try:
+            rctx.run_plan(plan, dry_run, async_push)
+        except GitCommandError + (PreflightError,) as e:
+            if attempt == retries or not snapshots.is_name_collision(e):
+                raise
+            if git_operations.resolve_commit(repo, tag_ref) == head:
+                # Only the remote has a tag of that name and the local one is still there: drop it before retrying
+                git_operations.update_refs(repo, [(tag_ref, None, head)])
+            rctx.echo(f'Snapshot tag {snapshot_tag} already exists, retrying with a unique name.')
+            continue
+        if defer and not dry_run:
+            snapshots.defer_snapshot(repo, snapshot_tag)
+        return snapshot_tag
+
+
+def push_deferred_snapshots(rctx, retries=3):
+    """
+    Push every snapshot tag created with `snap(defer=True)` in one push and report the throughput.
+    :param rctx: The `RflowContext` of the repository.
+    :param retries: How many times tags rejected because of a name collision are renamed and pushed again.
+    :return: None
+    """
+    repo = rctx.repo
+    tag_names = snapshots.take_deferred_snapshots(repo)
+    if not tag_names:
+        rctx.echo('No deferred snapshot tags to push.')
+        return
+    try:
+        result = snapshots.push_snapshots(repo, tag_names, retries=retries)
+    except Exception:
+        for tag_name in tag_names:
+            snapshots.defer_snapshot(repo, tag_name)
+        raise
+    rate = len(result.pushed) / result.seconds if result.seconds else 0
+    rctx.echo(f'Pushed {len(result.pushed)} snapshot tag(s) in {result.seconds:.2f}s ({rate:.1f} tags/s).')
+    if result.failed:
+        for tag_name in result.failed:
+            snapshots.defer_snapshot(repo, tag_name)
+        rctx.echo(f"{len(result.failed)} snapshot tag(s) were rejected and stay deferred: "
+                  f"{', '.join(result.failed)}", err=True)
+        raise click.Abort()
+
+
+def tag(rctx, force=False, dry_run=False, async_push=False):
+    """
+    Tag the release branch with its current version and push the tag.
+    :param rctx: The `RflowContext` of the repository.
+    :param force: Whether to overwrite the tag if it already exists.
+    :param dry_run: Whether to only print the planned steps.
+    :param async_push: Whether to queue the push for the background worker.
+    :return: None
+    """
+    repo = rctx.repo
+    plan = Plan()
+    branch_name = git_operations.current_branch(repo) or ''
+    if not git_operations.is_release_branch(branch_name):
+        rctx.echo("Tag command must be run from a release branch.")
+        raise click.Abort()
+    target_version = rctx.version_info.current_version
+    tag_name = f'v{target_version}'
+    head = git_operations.resolve_commit(repo, 'HEAD')
+    tag_ref = f'refs/tags/{tag_name}'
+    exists = rctx.catalog.has_tag(target_version)
+    if exists is None:
+        exists = git_operations.tag_exists(repo, tag_name)
+    if not exists and git_operations.is_incomplete_clone(repo):
+        # Tags are not fetched into shallow or single-branch clones, so ask the remote
+        exists = bool(git_operations.ls_remote(repo, 'origin', tag_ref))
+    if exists:
+        if not force:
+            rctx.echo(f"Tag {tag_name} already exists. Use --force to overwrite.")
+            version = parse_version(target_version)
+            if version:
+                rctx.echo(f"The next free patch version is {rctx.catalog.next_free_patch(*version[:2])}.")
+            return
+        rctx.echo(f"Tag {tag_name} already exists. Overwriting due to --force option.")
+        plan.update_ref(tag_ref, head)
+        # A forced refspec replaces the remote tag in the same push instead of delete + push
+        plan.push([f'+refs/tags/{tag_name}'])
+    else:
+        plan.update_ref(tag_ref, head, '')
+        plan.push([f'refs/tags/{tag_name}'])
+    echo_pushed(plan, f'Tag {tag_name} {"overwritten" if force else "created"}')
+    rctx.run_plan(plan, dry_run, async_push)
@@ -1,6 +1,14 @@
+import os
+import tempfile
+import threading
+from collections import namedtuple
+
 import click
-import git
-from git import GitError
+
+from rflow import trace
+
+PushedRef = namedtuple('PushedRef', ['flag', 'source', 'destination', 'summary'])
+PushResult = namedtuple('PushResult', ['remote', 'refs'])
 
 
 def is_release_branch(branch_name):
@@ -14,42 +22,51 @@ def is_release_branch(branch_name):
 
 def get_main_branch_name(repo):
     """
-    Get the name of the main branch in the given repository.
+    Get the name of the main branch in the given repository, looking both candidates up directly instead of listing
+    every local branch.
     :param repo: The repository object.
     :type repo: Repository
     :return: The name of the main branch.
     :rtype: str
     :raises ValueError: If 'main' or 'master' branch is not found in the repository.
     """
-    if 'main' in repo.branches:
+    if branch_exists(repo, 'main'):
         return 'main'
-    elif 'master' in repo.branches:
+    elif branch_exists(repo, 'master'):
         return 'master'
     else:
         raise ValueError("'main' or 'master' not found in repository.")
 
 
-def initialize_repo():
+def open_repo(path='.', echo=click.echo):
     """
-    Initializes a git repository in the current directory.
-    :return: A `git.Repo` object representing the initialized repository.
+    Open the git repository at the given path.
+    :param path: The root of the working tree.
+    :param echo: The function used to report the problem.
+    :return: A `git.Repo`, or a `SlimRepo` when RFLOW_BACKEND selects the slim backend (see `rflow.backend`).
+    :raises click.Abort: If the path is not a git repository.
     """
+    from rflow.backend import GitError, InvalidRepositoryError, open_repository
     try:
-        return git.Repo('.')
+        return open_repository(path)
+    except InvalidRepositoryError:
+        echo("Error: The current directory is not a Git repository.", err=True)
+        raise click.Abort()
     except GitError as e:
         handle_git_error(e)
 
 
-def check_active_branch(repo, main_branch_name):
+def check_active_branch(repo, main_branch_name, echo=click.echo):
     """
     Checks if the active branch in the given repository matches the provided main branch name.
     :param repo: The repository to check.
     :param main_branch_name: The name of the main branch.
+    :param echo: The function used to report the problem.
     :return: None.
     :raises click.Abort: If the active branch does not match the main branch name.
     """
-    if repo.active_branch.name != main_branch_name:
-        click.echo(f"Command must be run from the {main_branch_name} branch.")
+    if current_branch(repo) != main_branch_name:
+        echo(f"Command must be run from the {main_branch_name} branch.")
         raise click.Abort()
 
 
@@ -62,13 +79,515 @@ def handle_git_error(e):
     raise click.Abort()
 
 
-def check_if_git_repo():
+def push(repo, refspecs, remote='origin', set_upstream=False, atomic=True, check=True, leases=None):
     """
-    Check if the current directory is a git repository.
-    Raises an error and aborts if it's not a git repository.
+    Push several refspecs to a remote with a single `git push` invocation.
+    All ref updates travel over one connection and, when `atomic` is set, either all of them are accepted by the
+    remote or none is.
+    :param repo: The repository object.
+    :param refspecs: The refspecs to push, e.g. ['main', 'release/v1.2.0', '+refs/tags/v1.2.0'].
+    :param remote: The name of the remote to push to.
+    :param set_upstream: Whether to set the upstream of the pushed branches.
+    :param atomic: Whether to request an atomic transaction on the remote side.
+    :param check: Whether to raise when some refs are rejected. When False, the rejected refs are reported in the
+                  result with the '!' flag and only a push that reports no ref at all raises.
+    :param leases: A dict mapping destination refs to the object id they must have on the remote for the push to
+                   happen, '' when they must not exist, as for `--force-with-lease`.
+    :return: A `PushResult` with one `PushedRef` per updated ref.
+    :raises GitError: If the push is rejected or fails.
     """
+    from rflow.backend import GitCommandError
+    args = ['--porcelain']
+    if atomic:
+        args.append('--atomic')
+    if set_upstream:
+        args.append('--set-upstream')
+    args += [f'--force-with-lease={ref}:{old}' for ref, old in (leases or {}).items()]
     try:
-        git.Repo('.')
-    except git.InvalidGitRepositoryError:
-        click.echo("Error: The current directory is not a Git repository.", err=True)
-        raise click.Abort()
+        output = repo.git.push(*args, remote, *refspecs)
+    except GitCommandError as e:
+        refs = parse_push_output(e.stdout)
+        if check or not refs:
+            raise
+        return PushResult(remote, refs)
+    return PushResult(remote, parse_push_output(output))
+
+
+def parse_push_output(output):
+    """
+    Parse the output of `git push --porcelain`.
+    :param output: The standard output of the push command.
+    :return: A list of `PushedRef` tuples, one per ref reported by git.
+    """
+    refs = []
+    for line in output.splitlines():
+        parts = line.split('\t')
+        if len(parts) != 3 or len(parts[0]) != 1:
+            continue
+        source, _, destination = parts[1].partition(':')
+        refs.append(PushedRef(parts[0], source, destination, parts[2]))
+    return refs
+
+
+def list_refs(repo, *patterns, fmt='%(refname)'):
+    """
+    List the refs matching some patterns with a single `git for-each-ref` pass.
+    git only iterates the refs below the common prefix of the patterns, so the cost follows the number of matching
+    refs rather than the total number of refs.
+    :param repo: The repository object.
+    :param patterns: Ref patterns such as 'refs/heads/release/v*' or 'refs/remotes/*/release/v*'.
+    :param fmt: The `--format` of every output line.
+    :return: A list with one formatted line per matching ref.
+    """
+    output = repo.git.for_each_ref(f'--format={fmt}', *patterns)
+    return output.splitlines() if output else []
+
+
+def ref_exists(repo, ref):
+    """
+    Check whether a fully qualified ref exists, looking it up directly instead of listing all refs.
+    :param repo: The repository object.
+    :param ref: The full name of the ref, e.g. 'refs/tags/v1.2.0'.
+    :return: True if the ref exists, False otherwise.
+    """
+    from rflow.backend import GitCommandError
+    try:
+        repo.git.show_ref('--verify', '--quiet', ref)
+        return True
+    except GitCommandError:
+        return False
+
+
+def tag_exists(repo, tag_name):
+    """
+    :param repo: The repository object.
+    :param tag_name: The name of the tag, e.g. 'v1.2.0'.
+    :return: True if the tag exists locally, False otherwise.
+    """
+    return ref_exists(repo, f'refs/tags/{tag_name}')
+
+
+def branch_exists(repo, branch_name):
+    """
+    :param repo: The repository object.
+    :param branch_name: The short name of the branch, e.g. 'release/v1.2.0'.
+    :return: True if the branch exists locally, False otherwise.
+    """
+    return ref_exists(repo, f'refs/heads/{branch_name}')
+
+
+def remote_branch_exists(repo, branch_name, remote='origin'):
+    """
+    :param repo: The repository object.
+    :param branch_name: The short name of the branch, e.g. 'release/v1.2.0'.
+    :param remote: The name of the remote.
+    :return: True if the branch exists locally or as a remote-tracking branch, False otherwise.
+    """
+    return branch_exists(repo, branch_name) or ref_exists(repo, f'refs/remotes/{remote}/{branch_name}')
+
+
+def ls_remote(repo, remote='origin', *patterns):
+    """
+    List the refs advertised by a remote in a single round trip.
+    :param repo: The repository object.
+    :param remote: The name of the remote.
+    :param patterns: Optional ref patterns to filter the advertisement, e.g. 'refs/tags/v*'.
+    :return: A dict mapping full ref names to object ids.
+    """
+    refs = {}
+    for line in repo.git.ls_remote(remote, *patterns).splitlines():
+        sha, _, refname = line.partition('\t')
+        if refname and not refname.endswith('^{}'):
+            refs[refname] = sha
+    return refs
+
+
+def is_shallow(repo):
+    """
+    :param repo: The repository object.
+    :return: True if the repository was cloned or fetched with a limited depth.
+    """
+    return repo.git.rev_parse('--is-shallow-repository') == 'true'
+
+
+def is_incomplete_clone(repo, remote='origin'):
+    """
+    Detect the clones CI runners typically make, which lack history, objects or refs of the remote:
+    shallow clones, partial clones and clones whose fetch refspec does not cover every branch.
+    :param repo: The repository object.
+    :param remote: The name of the remote.
+    :return: True if refs or objects of the remote may be missing locally, False for complete clones and for
+             repositories without that remote, where there is nothing to fetch from.
+    """
+    from rflow.backend import GitCommandError
+    try:
+        config = repo.git.config('--get-regexp',
+                                 rf'^(remote\.{remote}\.(url|fetch|promisor)|extensions\.partialclone)$')
+    except GitCommandError:
+        return False  # Not even the remote is configured
+    entries = [line.partition(' ')[::2] for line in config.splitlines()]
+    if f'remote.{remote}.url' not in {key for key, _ in entries}:
+        return False
+    if is_shallow(repo):
+        return True
+    fetch_refspecs = []
+    for key, value in entries:
+        if key == f'remote.{remote}.fetch':
+            fetch_refspecs.append(value.lstrip('+'))
+        elif key != f'remote.{remote}.url':
+            return True  # Partial clone
+    return f'refs/heads/*:refs/remotes/{remote}/*' not in fetch_refspecs
+
+
+def tracking_ref(ref, remote='origin'):
+    """
+    :param ref: The full name of a ref on the remote, e.g. 'refs/heads/release/v1.2.0'.
+    :param remote: The name of the remote.
+    :return: The local ref a fetch of it is stored in: remote-tracking for branches, the same name for tags.
+    """
+    if ref.startswith('refs/heads/'):
+        return f'refs/remotes/{remote}/{ref[len("refs/heads/"):]}'
+    return ref
+
+
+def fetch_refs(repo, refs, remote='origin'):
+    """
+    Fetch a few refs and only the objects they need, in one round trip.
+    A shallow repository stays shallow: the refs are fetched with depth 1.
+    :param repo: The repository object.
+    :param refs: The full names of the refs on the remote.
+    :param remote: The name of the remote.
+    """
+    if not refs:
+        return
+    args = ['--no-tags']
+    if is_shallow(repo):
+        args.append('--depth=1')
+    repo.git.fetch(*args, remote, *[f'+{ref}:{tracking_ref(ref, remote)}' for ref in refs])
+
+
+def fetch_missing_refs(repo, refs, remote='origin'):
+    """
+    Make refs available locally in shallow, partial or single-branch clones by fetching those that are missing.
+    Nothing is fetched from complete clones, where a missing ref does not exist on the remote either.
+    :param repo: The repository object.
+    :param refs: The full names of the refs on the remote, e.g. 'refs/tags/v1.2.0'.
+    :param remote: The name of the remote.
+    :return: The refs that were fetched.
+    """
+    missing = []
+    for ref in refs:
+        local = tracking_ref(ref, remote)
+        if not ref_exists(repo, local) and (local == ref or not ref_exists(repo, ref)):
+            missing.append(ref)
+    if not missing or not is_incomplete_clone(repo, remote):
+        return []
+    advertised = ls_remote(repo, remote, *missing)
+    fetched = [ref for ref in missing if ref in advertised]
+    with trace.span('fetch missing refs', count=len(fetched)):
+        fetch_refs(repo, fetched, remote)
+    return fetched
+
+
+def remote_url(repo, remote='origin'):
+    """
+    :param repo: The repository object.
+    :param remote: The name of the remote.
+    :return: The fetch URL of the remote.
+    """
+    return repo.git.remote('get-url', remote)
+
+
+def set_upstream(repo, branch, remote='origin'):
+    """
+    Make a remote branch of the same name the upstream of a local branch, as `git push --set-upstream` does.
+    :param repo: The repository object.
+    :param branch: The short name of the branch.
+    :param remote: The name of the remote.
+    """
+    repo.git.config(f'branch.{branch}.remote', remote)
+    repo.git.config(f'branch.{branch}.merge', f'refs/heads/{branch}')
+
+
+def resolve_commit(repo, revision):
+    """
+    Resolve a revision to the id of the commit it points to.
+    :param repo: The repository object.
+    :param revision: A branch, tag, ref or commit id.
+    :return: The commit id, or None if the revision does not exist.
+    """
+    from rflow.backend import GitCommandError
+    try:
+        return repo.git.rev_parse('--verify', '--quiet', f'{revision}^{{commit}}')
+    except GitCommandError:
+        return None
+
+
+def is_ancestor(repo, ancestor, descendant):
+    """
+    :param repo: The repository object.
+    :param ancestor: A commit id.
+    :param descendant: A commit id.
+    :return: True if `descendant` contains `ancestor`; False otherwise, also when `ancestor` is not known locally.
+    """
+    from rflow.backend import GitCommandError
+    try:
+        repo.git.merge_base('--is-ancestor', ancestor, descendant)
+        return True
+    except GitCommandError:
+        return False
+
+
+def current_branch(repo):
+    """
+    :param repo: The repository object.
+    :return: The short name of the checked out branch, or None on a detached HEAD.
+    """
+    from rflow.backend import GitCommandError
+    try:
+        return repo.git.symbolic_ref('--quiet', '--short', 'HEAD')
+    except GitCommandError:
+        return None
+
+
+def read_file(repo, revision, path):
+    """
+    Read a file as it is stored in a revision, without touching the working tree.
+    :param repo: The repository object.
+    :param revision: The commit, branch or tag to read from.
+    :param path: The path of the file relative to the repository root.
+    :return: The content of the file, or None if it does not exist in that revision.
+    """
+    from rflow.backend import GitCommandError
+    try:
+        return repo.git.cat_file('blob', f'{revision}:{path}', strip_newline_in_stdout=False)
+    except GitCommandError:
+        return None
+
+
+def read_files(repo, names):
+    """
+    Read many objects through the persistent `git cat-file --batch` process GitPython keeps per repository, so that
+    any number of reads costs a single git process. Reads from several threads take turns on that process.
+    :param repo: The repository object.
+    :param names: Object names such as 'release/v1.2.0:version.info'.
+    :return: A dict mapping every name to the object content as a string, or None if the object does not exist.
+    """
+    contents = {}
+    with trace.span('cat-file --batch', objects=len(names)), _object_reader_lock:
+        for name in names:
+            try:
+                contents[name] = repo.git.get_object_data(name)[3].decode('utf-8')
+            except ValueError:
+                contents[name] = None
+    return contents
+
+
+def stream_records(repo, *args, separator='\x1e', chunk_size=65536):
+    """
+    Run a git command and yield its output record by record while it is still running, so that arbitrarily long
+    output such as a `git log` over 100k commits is processed with bounded memory.
+    :param repo: The repository object.
+    :param args: The git command and its arguments, e.g. ('log', '--format=%H%x1e').
+    :param separator: The string that terminates every record.
+    :param chunk_size: How many bytes are read from the process at a time.
+    :return: A generator of records, without the separator.
+    :raises GitError: If the command fails.
+    """
+    process = repo.git.execute(['git', *args], as_process=True)
+    pending = b''
+    marker = separator.encode('utf-8')
+    try:
+        while True:
+            chunk = process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            records = (pending + chunk).split(marker)
+            pending = records.pop()
+            for record in records:
+                yield record.decode('utf-8', errors='replace')
+        if pending.strip():
+            yield pending.decode('utf-8', errors='replace')
+        process.wait()
+    finally:
+        process.proc.stdout.close()
+
+
+def write_blob(repo, content):
+    """
+    Store content in the object database.
+    :param repo: The repository object.
+    :param content: The file content as a string.
+    :return: The id of the blob.
+    """
+    return repo.git.hash_object('-w', '--stdin', istream=_stdin(content))
+
+
+def write_blobs(repo, contents):
+    """
+    Store many contents in the object database with a single `git hash-object --stdin-paths` process.
+    :param repo: The repository object.
+    :param contents: A dict mapping keys, such as paths, to file contents as strings.
+    :return: A dict mapping the same keys to the ids of the blobs.
+    """
+    if len(contents) < 2:
+        return {key: write_blob(repo, content) for key, content in contents.items()}
+    with tempfile.TemporaryDirectory(prefix='rflow-blobs-') as directory:
+        names = []
+        for number, content in enumerate(contents.values()):
+            names.append(os.path.join(directory, str(number)))
+            with open(names[-1], 'wb') as file:
+                file.write(content.encode('utf-8'))
+        ids = repo.git.hash_object('-w', '--no-filters', '--stdin-paths', istream=_stdin('\n'.join(names) + '\n'))
+    return dict(zip(contents, ids.split()))
+
+
+def write_tree(repo, base_tree, files):
+    """
+    Build a tree that equals `base_tree` with some files replaced.
+    Only the trees on the paths of the changed files are read and rewritten, so the cost does not depend on the size
+    of the repository.
+    :param repo: The repository object.
+    :param base_tree: The tree (or commit) to start from, or None to start from an empty tree.
+    :param files: A dict mapping paths relative to the tree to blob ids.
+    :return: The id of the new tree.
+    """
+    entries = {}
+    if base_tree:
+        for line in repo.git.ls_tree('-z', base_tree).split('\0'):
+            if line:
+                meta, name = line.split('\t', 1)
+                mode, kind, sha = meta.split(' ')
+                entries[name] = (mode, kind, sha)
+    subtrees = {}
+    for path, blob in files.items():
+        name, _, rest = path.partition('/')
+        if rest:
+            subtrees.setdefault(name, {})[rest] = blob
+        else:
+            mode, kind, _ = entries.get(name, ('100644', 'blob', None))
+            entries[name] = (mode if kind == 'blob' else '100644', 'blob', blob)
+    for name, subtree_files in subtrees.items():
+        _, kind, sha = entries.get(name, (None, None, None))
+        entries[name] = ('040000', 'tree', write_tree(repo, sha if kind == 'tree' else None, subtree_files))
+    listing = ''.join(f'{mode} {kind} {sha}\t{name}\0' for name, (mode, kind, sha) in entries.items())
+    return repo.git.mktree('-z', istream=_stdin(listing))
+
+
+def commit_files(repo, parent, files, message):
+    """
+    Create a commit on top of `parent` that changes the given files, using plumbing only.
+    Neither the index nor the working tree is touched and no branch is moved; see `update_ref`.
+    :param repo: The repository object.
+    :param parent: The id of the parent commit.
+    :param files: A dict mapping paths relative to the repository root to their new content.
+    :param message: The commit message.
+    :return: The id of the new commit.
+    """
+    blobs = write_blobs(repo, files)
+    tree = write_tree(repo, parent, blobs)
+    return repo.git.commit_tree(tree, '-p', parent, '-m', message)
+
+
+def update_ref(repo, ref, new_value, old_value=None, message=None):
+    """
+    Point a ref at a new commit.
+    :param repo: The repository object.
+    :param ref: The full name of the ref, e.g. 'refs/heads/release/v1.2.0'.
+    :param new_value: The commit id the ref should point to.
+    :param old_value: The commit id the ref is expected to point to, or '' if it must not exist yet.
+                      When None the current value is not verified.
+    :param message: The reflog message.
+    :raises GitError: If the ref does not have the expected old value.
+    """
+    args = ['-m', message] if message else []
+    args += [ref, new_value]
+    if old_value is not None:
+        args.append(old_value)
+    repo.git.update_ref(*args)
+
+
+def update_refs(repo, updates, message=None):
+    """
+    Apply many ref changes in one `git update-ref --stdin` transaction: either all of them happen or none does.
+    :param repo: The repository object.
+    :param updates: (ref, new_value, old_value) tuples. A new value of None deletes the ref; an old value of ''
+                    requires the ref not to exist yet and an old value of None skips the verification.
+    :param message: The reflog message.
+    :raises GitError: If any ref does not have its expected old value, in which case no ref is changed.
+    """
+    if not updates:
+        return
+    commands = ['start']
+    for ref, new_value, old_value in updates:
+        if new_value is None:
+            commands.append(f'delete {ref} {old_value or ""}'.rstrip())
+        elif old_value == '':
+            commands.append(f'create {ref} {new_value}')
+        else:
+            commands.append(f'update {ref} {new_value} {old_value or ""}'.rstrip())
+    commands += ['prepare', 'commit']
+    args = ['-m', message] if message else []
+    repo.git.update_ref(*args, '--stdin', istream=_stdin('\n'.join(commands) + '\n'))
+
+
+def delete_refs(repo, refs):
+    """
+    Delete many refs in one `git update-ref --stdin` transaction: either all of them are removed or none is.
+    :param repo: The repository object.
+    :param refs: The full names of the refs to delete.
+    """
+    update_refs(repo, [(ref, None, None) for ref in refs])
+
+
+def dirty_paths(repo, paths):
+    """
+    :param repo: The repository object.
+    :param paths: The paths to check.
+    :return: The paths among them with uncommitted changes in the index or the working tree.
+    """
+    if not paths:
+        return []
+    output = repo.git.status('--porcelain', '-z', '--untracked-files=no', '--', *paths)
+    return [entry[3:] for entry in output.split('\0') if len(entry) > 3 and entry[2] == ' ']
+
+
+def checkout_paths(repo, paths, revision='HEAD'):
+    """
+    Refresh some paths of the index and the working tree from a revision, leaving every other file untouched.
+    :param repo: The repository object.
+    :param paths: The paths to refresh.
+    :param revision: The revision to take the content from.
+    """
+    repo.git.checkout(revision, '--', *paths)
+
+
+def state_path(repo, name):
+    """
+    Locate a file rflow keeps inside the git directory, shared by all worktrees of the repository.
+    :param repo: The repository object.
+    :param name: The name of the file.
+    :return: The path of `.git/rflow/<name>`; its directory is created if needed.
+    """
+    directory = os.path.join(repo.common_dir, 'rflow')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, name)
+
+
+_object_reader_lock = threading.Lock()
+
+
+def _stdin(content):
+    # GitPython hands `istream` to the subprocess as its standard input, which needs a real file
+    file = tempfile.TemporaryFile()
+    file.write(content.encode('utf-8'))
+    file.seek(0)
+    return file
+
+
+def __getattr__(name):
+    # GitPython is imported on first use so that commands which never touch git start quickly
+    if name == 'git':
+        import git
+        return git
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -0,0 +1,119 @@
+"""
+Release-line status computed from a single walk of the commit graph.
+
+All release branches, their latest tags and the main branch are walked together by one `git log --topo-order`.
+Every commit carries a bitmask of the tips it is reachable from; because children are listed before their parents,
+a commit's mask is complete when it is reached and is simply OR-ed into its parents. Reachability is thus computed
+once and shared by all release lines instead of running `git log` for every branch pair.
+"""
+import re
+from collections import namedtuple
+
+from rflow import git_operations
+from rflow import trace
+from rflow import version_operations
+
+FIX_SUBJECT_RE = re.compile(r'^(fix|hotfix|bugfix)\b|\bfix/', re.IGNORECASE)
+CHERRY_PICK_RE = re.compile(r'\(cherry picked from commit ([0-9a-f]{7,64})\)')
+LOG_FORMAT = '--format=%H %P%x1f%s%x1f%b%x1e'
+
+Commit = namedtuple('Commit', ['sha', 'subject'])
+LineStatus = namedtuple('LineStatus', ['line', 'branch', 'tag', 'commits_since_tag', 'missing_fixes'])
+
+
+def iter_set_bits(mask):
+    """
+    :param mask: A non-negative integer.
+    :return: A generator of the positions of the bits set in `mask`.
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def is_fix(subject):
+    """
+    :param subject: The subject line of a commit.
+    :return: True if the commit looks like a bug fix, e.g. 'fix: ...', 'Hotfix ...' or a merge of a fix/ branch.
+    """
+    return bool(FIX_SUBJECT_RE.search(subject))
+
+
+def release_status(repo, main_branch_name):
+    """
+    Compute, for every release line, the commits landed since its latest tag and the fixes on main it is missing.
+    A fix counts as backported when a commit of the release branch records it with `cherry-pick -x` or has the
+    same subject.
+    :param repo: The repository object.
+    :param main_branch_name: The name of the main branch.
+    :return: A list of `LineStatus` tuples sorted by version. When a line has no tag yet, `tag` is None and
+             `commits_since_tag` counts the commits since the branch left main.
+    """
+    branches = version_operations.release_branches_by_line(repo)
+    latest_tags = {}
+    for tag_name, version in version_operations.list_release_tags(repo):
+        line = (version.major, version.minor)
+        if line in branches and (line not in latest_tags or version > latest_tags[line][0]):
+            latest_tags[line] = (version, tag_name)
+    lines = sorted(branches)
+    if not lines:
+        return []
+    # Bit 0 is main; release line i uses bit 1 + 2i for its branch and bit 2 + 2i for its latest tag
+    tips = [f'refs/heads/{main_branch_name}']
+    for line in lines:
+        tips.append(branches[line])
+        tips.append(f'refs/tags/{latest_tags[line][1]}' if line in latest_tags else tips[0])
+    shas = repo.git.rev_parse(*tips).splitlines()
+    masks = {}
+    for bit, sha in enumerate(shas):
+        masks[sha] = masks.get(sha, 0) | (1 << bit)
+    branch_bits = sum(1 << (1 + 2 * index) for index in range(len(lines)))
+
+    since_tag = [0] * len(lines)
+    picked = [set() for _ in lines]
+    picked_subjects = [set() for _ in lines]
+    main_fixes = []
+    args = ['log', '--topo-order', LOG_FORMAT, *sorted(set(shas))]
+    # Commits reachable from every tip cannot change any count, so the walk stops at their common ancestor
+    base = _common_ancestor(repo, sorted(set(shas)))
+    if base:
+        args.append(f'^{base}')
+    with trace.span('commit graph walk', tips=len(shas)):
+        for record in git_operations.stream_records(repo, *args):
+            ids, subject, body = record.lstrip('\n').split('\x1f', 2)
+            sha, *parents = ids.split()
+            mask = masks.pop(sha, 0)
+            for parent in parents:
+                masks[parent] = masks.get(parent, 0) | mask
+            # Branch bits whose tag bit (one position higher) is not set: commits landed since the tag
+            for bit in iter_set_bits(mask & branch_bits & ~(mask >> 1)):
+                since_tag[(bit - 1) // 2] += 1
+            if mask & 1:
+                if is_fix(subject):
+                    main_fixes.append((Commit(sha, subject), mask))
+            else:
+                for bit in iter_set_bits(mask & branch_bits):
+                    index = (bit - 1) // 2
+                    picked[index].update(CHERRY_PICK_RE.findall(body))
+                    picked_subjects[index].add(subject)
+
+    statuses = []
+    for index, line in enumerate(lines):
+        branch_bit = 1 << (1 + 2 * index)
+        missing = [commit for commit, mask in main_fixes
+                   if not mask & branch_bit and commit.subject not in picked_subjects[index]
+                   and not any(commit.sha.startswith(source) for source in picked[index])]
+        statuses.append(LineStatus(f'{line[0]}.{line[1]}', branches[line].split('/', 2)[-1],
+                                   latest_tags[line][1] if line in latest_tags else None, since_tag[index], missing))
+    return statuses
+
+
+def _common_ancestor(repo, shas):
+    from rflow.backend import GitCommandError
+    if len(shas) < 2:
+        return None
+    try:
+        return repo.git.merge_base('--octopus', *shas) or None
+    except GitCommandError:
+        return None
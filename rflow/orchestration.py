@@ -0,0 +1,126 @@
+"""
+Run rflow flows over many repositories at once.
+Repositories are processed by a bounded pool of worker threads, and the number of repositories talking to the same
+remote host at the same time is limited separately so that one git server is not flooded.
+"""
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+
+from rflow import git_operations
+from rflow.context import RflowContext
+
+RepoResult = namedtuple('RepoResult', ['path', 'ok', 'seconds', 'messages'])
+
+
+def read_manifest(manifest_path):
+    """
+    Read a manifest listing one repository path per line. Blank lines and lines starting with '#' are ignored and
+    relative paths are resolved against the directory of the manifest.
+    :param manifest_path: The path of the manifest file.
+    :return: The list of absolute repository paths, in manifest order.
+    """
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, 'r') as file:
+        lines = [line.strip() for line in file]
+    return [os.path.normpath(os.path.join(base, line)) for line in lines if line and not line.startswith('#')]
+
+
+def remote_host(url):
+    """
+    Extract the host from a remote URL.
+    :param url: A remote URL such as 'https://host/org/repo.git', 'ssh://git@host:22/repo' or 'git@host:org/repo'.
+    :return: The host name, or 'local' for filesystem remotes.
+    """
+    if url.startswith('file://'):
+        return 'local'
+    match = re.match(r'^[a-z][a-z0-9+.-]*://(?:[^@/]*@)?([^:/]+)', url)
+    if match:
+        return match.group(1)
+    match = re.match(r'^(?:[^@/]+@)?([^:/]+):', url)
+    if match and not os.path.exists(url):
+        return match.group(1)
+    return 'local'
+
+
+def run_across_repos(flow, paths, jobs=8, per_host=4, flow_kwargs=None):
+    """
+    Run a flow in every repository.
+    :param flow: A function from `rflow.flows`, called as `flow(rctx, **flow_kwargs)`.
+    :param paths: The root directories of the repositories.
+    :param jobs: The maximum number of repositories processed at the same time.
+    :param per_host: The maximum number of repositories processed at the same time per remote host.
+    :param flow_kwargs: Keyword arguments passed to the flow.
+    :return: One `RepoResult` per repository, in the order of `paths`.
+    """
+    from rflow.backend import GitError
+    host_slots = {}
+    host_slots_lock = threading.Lock()
+
+    def slots_for(host):
+        with host_slots_lock:
+            return host_slots.setdefault(host, threading.BoundedSemaphore(per_host))
+
+    def run_one(path):
+        messages = []
+        start = time.perf_counter()
+        ok = False
+        try:
+            rctx = RflowContext(path, echo=lambda message, err=False: messages.append(str(message)))
+            with slots_for(remote_host(git_operations.remote_url(rctx.repo))):
+                flow(rctx, **(flow_kwargs or {}))
+            ok = True
+        except (click.ClickException, click.Abort, ValueError, OSError) + GitError as e:
+            # A flow reports the reason before aborting, so an Abort only needs a note when nothing was reported
+            if not isinstance(e, click.Abort) or not messages:
+                messages.append(describe_error(e))
+        return RepoResult(path, ok, time.perf_counter() - start, messages)
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(run_one, paths))
+
+
+def describe_error(e):
+    """
+    :param e: An exception raised by a flow.
+    :return: A one-line description, preferring the first `fatal:` or `error:` line git wrote to stderr, else its
+             last line.
+    """
+    stderr = getattr(e, 'stderr', None)
+    if isinstance(stderr, str) and stderr.strip():
+        # GitPython formats the captured stderr as "stderr: '<text>'"
+        text = stderr.strip()
+        if text.startswith("stderr: '") and text.endswith("'"):
+            text = text[len("stderr: '"):-1]
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        for line in lines:
+            if line.startswith(('fatal:', 'error:')):
+                return line
+        if lines:
+            return lines[-1]
+    if isinstance(e, click.ClickException):
+        return e.format_message()
+    return str(e).strip().splitlines()[0] if str(e).strip() else 'Aborted.'
+
+
+def format_summary(results):
+    """
+    Render the results of `run_across_repos` as a table.
+    :param results: The `RepoResult` tuples.
+    :return: The table as a string.
+    """
+    width = max([len('REPOSITORY')] + [len(result.path) for result in results])
+    lines = [f'{"REPOSITORY":<{width}}  {"STATUS":<6}  {"TIME":>8}  DETAILS']
+    for result in results:
+        details = result.messages[-1] if result.messages else ''
+        status = 'ok' if result.ok else 'FAILED'
+        lines.append(f'{result.path:<{width}}  {status:<6}  {result.seconds:7.2f}s  {details}')
+    failed = sum(1 for result in results if not result.ok)
+    lines.append(f'{len(results)} repositories, {len(results) - failed} succeeded, {failed} failed, '
+                 f'{sum(result.seconds for result in results):.2f}s total work.')
+    return '\n'.join(lines)
@@ -0,0 +1,267 @@
+"""
+Declarative execution plans for the rflow commands.
+A flow first records the commits, ref updates and pushes it needs in a `Plan`, which can be printed for `--dry-run`.
+`apply` then writes the new objects, moves every local ref in one `git update-ref --stdin` transaction and sends all
+pushes to a remote in a single atomic push, so a command either fully happens locally or not at all; a rejected
+push reverts the local ref transaction.
+"""
+import json
+from collections import namedtuple
+
+from rflow import git_operations
+from rflow import trace
+
+RefUpdate = namedtuple('RefUpdate', ['ref', 'new', 'old'])
+PushStep = namedtuple('PushStep', ['remote', 'refspecs', 'set_upstream'])
+
+
+class CommitSpec:
+    """
+    A commit that does not exist yet: some files replaced on top of a parent, which may itself be planned.
+    """
+
+    def __init__(self, parent, files, message):
+        """
+        :param parent: The id of the parent commit, or the `CommitSpec` of a planned parent.
+        :param files: A dict mapping paths to their new content.
+        :param message: The commit message.
+        """
+        self.parent = parent
+        self.files = files
+        self.message = message
+        self.sha = None
+
+    def read(self, repo, path):
+        """
+        Read a file as it will be in this commit.
+        :param repo: The repository object.
+        :param path: The path of the file.
+        :return: The content of the file, or None if it does not exist.
+        """
+        if path in self.files:
+            return self.files[path]
+        if isinstance(self.parent, CommitSpec):
+            return self.parent.read(repo, path)
+        return git_operations.read_file(repo, self.parent, path)
+
+    def write(self, repo):
+        """
+        Create the commit object, and its planned parents first.
+        :param repo: The repository object.
+        :return: The id of the new commit.
+        """
+        if self.sha is None:
+            parent = self.parent.write(repo) if isinstance(self.parent, CommitSpec) else self.parent
+            self.sha = git_operations.commit_files(repo, parent, self.files, self.message)
+        return self.sha
+
+
+class Plan:
+    """
+    The ordered side effects of one command: ref updates, pushes, paths to refresh and messages to report.
+    """
+
+    def __init__(self):
+        self.ref_updates = []
+        self.pushes = []
+        self.refresh_paths = []
+        self.checkout = None
+        self.messages = []
+        self.queued_messages = {}
+
+    def __bool__(self):
+        return bool(self.ref_updates or self.pushes or self.checkout)
+
+    def pending(self, ref):
+        """
+        :param ref: The full name of a ref.
+        :return: The value the plan gives the ref, or None if the plan leaves it alone.
+        """
+        for update in reversed(self.ref_updates):
+            if update.ref == ref:
+                return update.new
+        return None
+
+    def update_ref(self, ref, new, old=None):
+        """
+        Plan a ref update.
+        :param ref: The full name of the ref.
+        :param new: The commit id or `CommitSpec` the ref should point to.
+        :param old: The commit id the ref is expected to point to, '' if it must not exist yet, None to skip the check.
+        """
+        self.ref_updates.append(RefUpdate(ref, new, old))
+
+    def commit(self, ref, parent, files, message, old=None):
+        """
+        Plan a commit replacing some files on top of a parent, and point a ref at it.
+        :param ref: The full name of the ref to update.
+        :param parent: The id or `CommitSpec` of the parent commit.
+        :param files: A dict mapping paths to their new content.
+        :param message: The commit message.
+        :param old: The expected old value of the ref, as for `update_ref`.
+        :return: The `CommitSpec` of the planned commit.
+        """
+        spec = CommitSpec(parent, files, message)
+        self.update_ref(ref, spec, old)
+        return spec
+
+    def push(self, refspecs, remote='origin', set_upstream=False):
+        """
+        Plan a push. Pushes to the same remote are sent together when the plan is applied.
+        :param refspecs: The refspecs to push.
+        :param remote: The name of the remote.
+        :param set_upstream: Whether to set the upstream of pushed branches.
+        """
+        self.pushes.append(PushStep(remote, list(refspecs), set_upstream))
+
+    def echo(self, message, queued=None):
+        """
+        Record a message reported once the plan has been applied.
+        :param message: The message.
+        :param queued: The message reported instead when the pushes are queued for the background worker.
+        """
+        self.messages.append(message)
+        if queued is not None:
+            self.queued_messages[message] = queued
+
+    def report(self, queued=False):
+        """
+        :param queued: Whether the pushes of the plan have been queued instead of sent.
+        :return: The messages to report once the plan has been applied.
+        """
+        return [self.queued_messages.get(message, message) for message in self.messages] if queued \
+            else list(self.messages)
+
+    def merge(self, other):
+        """
+        Append the steps of another plan, e.g. one prepared for another release line.
+        :param other: The `Plan` to merge into this one.
+        :raises ValueError: If both plans update the same ref.
+        """
+        shared = {update.ref for update in self.ref_updates} & {update.ref for update in other.ref_updates}
+        if shared:
+            raise ValueError(f"Plans both update {', '.join(sorted(shared))}.")
+        self.ref_updates += other.ref_updates
+        self.pushes += other.pushes
+        self.refresh_paths += [path for path in other.refresh_paths if path not in self.refresh_paths]
+        self.checkout = self.checkout or other.checkout
+        self.messages += other.messages
+        self.queued_messages.update(other.queued_messages)
+
+    def write_commits(self, repo):
+        """
+        Create the objects of every planned commit now, so that it can be done ahead of `apply`, e.g. in a worker
+        thread. `apply` then only moves the refs.
+        :param repo: The repository object.
+        """
+        for update in self.ref_updates:
+            if isinstance(update.new, CommitSpec):
+                update.new.write(repo)
+
+    def grouped_pushes(self):
+        """
+        :return: One `PushStep` per remote, in the order the remotes were first planned, with the refspecs of all
+                 pushes to that remote.
+        """
+        grouped = {}
+        for remote, refspecs, set_upstream in self.pushes:
+            previous = grouped.get(remote, ([], False))
+            grouped[remote] = (previous[0] + [refspec for refspec in refspecs if refspec not in previous[0]],
+                               previous[1] or set_upstream)
+        return [PushStep(remote, refspecs, set_upstream) for remote, (refspecs, set_upstream) in grouped.items()]
+
+    def describe(self):
+        """
+        :return: The steps of the plan as human readable lines.
+        """
+        lines = []
+        names = {}
+        for update in self.ref_updates:
+            new = update.new
+            if isinstance(new, CommitSpec):
+                names[id(new)] = f'<new commit {len(names) + 1}>'
+                parent = new.parent
+                parent = names.get(id(parent), '<planned commit>') if isinstance(parent, CommitSpec) else parent[:10]
+                lines.append(f'commit {names[id(new)]} on {parent}: {new.message}')
+                for path, content in sorted(new.files.items()):
+                    lines.append(f'  write {path} {_summarize(content)}')
+                new = names[id(new)]
+            else:
+                new = new[:10]
+            if update.old == '':
+                lines.append(f'create {update.ref} -> {new}')
+            else:
+                old = f'{update.old[:10]} ' if update.old else ''
+                lines.append(f'update {update.ref} {old}-> {new}')
+        for path in self.refresh_paths:
+            lines.append(f'refresh {path} in the working tree')
+        for remote, refspecs, set_upstream in self.grouped_pushes():
+            lines.append(f'push {remote} {" ".join(refspecs)} (atomic{", set upstream" if set_upstream else ""})')
+        if self.checkout:
+            lines.append(f'checkout {self.checkout}')
+        return lines
+
+
+def apply(repo, plan, message='rflow', push=True):
+    """
+    Apply a plan: write the planned commits, move every ref in one transaction, refresh the working tree, then push.
+    When the push is rejected before any remote accepted it, the ref transaction is reverted, so that the repository
+    is left as it was.
+    :param repo: The repository object.
+    :param plan: The `Plan` to apply.
+    :param message: The reflog message of the ref transaction.
+    :param push: Whether to run the planned pushes, False when the caller queues them instead.
+    :return: The list of `PushResult`, one per remote.
+    :raises GitError: If a ref moved since the plan was made, in which case no local ref is changed, or if a push
+                      fails.
+    """
+    from rflow.backend import GitError
+    with trace.span('write objects'):
+        updates = [(update.ref, update.new.write(repo) if isinstance(update.new, CommitSpec) else update.new,
+                    update.old) for update in plan.ref_updates]
+    # The values the refs had, to revert the transaction with; unverified updates do not record them in the plan
+    previous = [(ref, old if old is not None else git_operations.resolve_commit(repo, ref) or '')
+                for ref, _, old in updates]
+    with trace.span('update refs', count=len(updates)):
+        git_operations.update_refs(repo, updates, message)
+    if plan.refresh_paths:
+        git_operations.checkout_paths(repo, plan.refresh_paths)
+    results = []
+    try:
+        for remote, refspecs, set_upstream in plan.grouped_pushes() if push else []:
+            results.append(git_operations.push(repo, refspecs, remote, set_upstream=set_upstream))
+    except GitError:
+        if not results:
+            revert(repo, plan, updates, previous, message)
+        raise
+    if plan.checkout:
+        repo.git.checkout(plan.checkout)
+    return results
+
+
+def revert(repo, plan, updates, previous, message='rflow'):
+    """
+    Undo the ref transaction of `apply` in one transaction and refresh the working tree again.
+    :param repo: The repository object.
+    :param plan: The applied `Plan`.
+    :param updates: The (ref, new_value, old_value) tuples the transaction applied.
+    :param previous: (ref, value) tuples with the value every ref had before, '' for refs it created.
+    :param message: The reflog message.
+    """
+    reverse = []
+    for (ref, new, _), (_, old) in zip(reversed(updates), reversed(previous)):
+        if new is None:
+            reverse.append((ref, old, ''))
+        else:
+            reverse.append((ref, old or None, new))
+    with trace.span('revert refs', count=len(reverse)):
+        git_operations.update_refs(repo, reverse, f'{message} (reverted)')
+    if plan.refresh_paths:
+        git_operations.checkout_paths(repo, plan.refresh_paths)
+
+
+def _summarize(content):
+    try:
+        return json.dumps(json.loads(content))
+    except ValueError:
+        return f'({len(content)} bytes)'
@@ -0,0 +1,222 @@
+"""
+Checks of a plan against the remote before anything is changed locally.
+
+One filtered `git ls-remote` per remote returns the current value of every ref the plan will push. A tag that
+already exists there, or a branch that moved to a commit the planned update does not build on, is reported as a
+conflict before any object is written or any ref is moved, instead of surfacing as a rejected push at the end.
+The advertisement is kept in `.git/rflow/ls-remote.json` for `CACHE_SECONDS`, so commands run back to back skip the
+round trip; the refs a command pushes are recorded there with their new values.
+"""
+import json
+import os
+import tempfile
+import time
+from collections import namedtuple
+
+import click
+
+from rflow import git_operations
+from rflow import trace
+from rflow.plan import CommitSpec
+
+CACHE_FILE = 'ls-remote.json'
+CACHE_SECONDS = 30
+
+PushTarget = namedtuple('PushTarget', ['remote', 'source', 'destination', 'force'])
+Conflict = namedtuple('Conflict', ['remote', 'ref', 'message'])
+
+
+class PreflightError(click.ClickException):
+    """
+    The remote has refs that conflict with a plan. Nothing has been changed.
+    """
+
+    def __init__(self, conflicts):
+        """
+        :param conflicts: The `Conflict` tuples found.
+        """
+        self.conflicts = conflicts
+        super().__init__(' '.join(conflict.message for conflict in conflicts))
+
+
+def parse_refspec(refspec):
+    """
+    :param refspec: A push refspec as planned by the flows, e.g. 'main', 'refs/tags/v1.2.0' or '+refs/tags/v1.2.0'.
+    :return: A (force, source, destination) tuple with full ref names; short names are branches. The source is ''
+             for a deletion.
+    """
+    force = refspec.startswith('+')
+    source, _, destination = refspec.lstrip('+').partition(':')
+    destination = destination or source
+
+    def full(name):
+        return name if not name or name.startswith('refs/') else f'refs/heads/{name}'
+
+    return force, full(source), full(destination)
+
+
+def push_targets(plan):
+    """
+    :param plan: A `Plan`.
+    :return: One `PushTarget` per ref the plan pushes.
+    """
+    targets = []
+    for remote, refspecs, _ in plan.grouped_pushes():
+        for refspec in refspecs:
+            force, source, destination = parse_refspec(refspec)
+            targets.append(PushTarget(remote, source, destination, force))
+    return targets
+
+
+def advertised_refs(repo, remote, refs, max_age=CACHE_SECONDS, now=None):
+    """
+    Look up the values of some refs on a remote, from the cache when all of them were seen recently.
+    :param repo: The repository object.
+    :param remote: The name of the remote.
+    :param refs: The full names of the refs.
+    :param max_age: How old, in seconds, a cached value may be.
+    :param now: The current time, for tests.
+    :return: A dict mapping every ref to its object id on the remote, or None if the remote does not have it.
+    """
+    now = time.time() if now is None else now
+    cache = _read_cache(repo)
+    url = git_operations.remote_url(repo, remote)
+    entry = cache.get(remote)
+    if entry is None or entry.get('url') != url:
+        entry = cache[remote] = {'url': url, 'refs': {}}
+    cached = entry['refs']
+    if all(ref in cached and now - cached[ref][1] <= max_age for ref in refs):
+        return {ref: cached[ref][0] for ref in refs}
+    with trace.span('preflight ls-remote', refs=len(refs)):
+        advertised = git_operations.ls_remote(repo, remote, *refs)
+    for ref in refs:
+        cached[ref] = [advertised.get(ref), now]
+    _write_cache(repo, cache)
+    return {ref: cached[ref][0] for ref in refs}
+
+
+def record(repo, remote, values, now=None):
+    """
+    Record the values refs have on a remote after a push, or forget them when they are unknown.
+    :param repo: The repository object.
+    :param remote: The name of the remote.
+    :param values: A dict mapping full ref names to their new object id, None once deleted, or `...` when unknown.
+    :param now: The current time, for tests.
+    """
+    now = time.time() if now is None else now
+    cache = _read_cache(repo)
+    entry = cache.get(remote)
+    if entry is None:
+        return
+    for ref, value in values.items():
+        if value is ...:
+            entry['refs'].pop(ref, None)
+        else:
+            entry['refs'][ref] = [value, now]
+    _write_cache(repo, cache)
+
+
+def check(repo, plan):
+    """
+    Check the refs a plan pushes against the remote, with one `ls-remote` per remote at most.
+    :param repo: The repository object.
+    :param plan: The `Plan` about to be applied.
+    :return: The list of `Conflict` tuples, empty when the plan can be pushed.
+    """
+    by_remote = {}
+    for target in push_targets(plan):
+        if target.source and not target.force:
+            by_remote.setdefault(target.remote, []).append(target)
+    conflicts = []
+    for remote, targets in by_remote.items():
+        remote_values = advertised_refs(repo, remote, [target.destination for target in targets])
+        for target in targets:
+            remote_value = remote_values[target.destination]
+            if remote_value is None:
+                continue
+            planned = plan.pending(target.source) or git_operations.resolve_commit(repo, target.source)
+            base = planned
+            while isinstance(base, CommitSpec):
+                base = base.parent
+            if remote_value == base:
+                continue
+            short_name = target.destination.split('/', 2)[-1]
+            if target.destination.startswith('refs/tags/'):
+                conflicts.append(Conflict(remote, target.destination,
+                                          f'Tag {short_name} already exists on {remote}.'))
+            elif not base or not git_operations.is_ancestor(repo, remote_value, base):
+                conflicts.append(Conflict(remote, target.destination,
+                                          f'{short_name} on {remote} is at {remote_value[:10]}, which the planned '
+                                          f'update does not build on; fetch and retry.'))
+    return conflicts
+
+
+def pinned_pushes(repo, plan):
+    """
+    Pin the pushes of an applied plan for the background push queue, so that draining the queue later pushes exactly
+    what the command created, wherever the branches have moved since, and only over the remote values the command
+    built on.
+    :param repo: The repository object.
+    :param plan: A `Plan` that has been applied.
+    :return: One (remote, refspecs, set_upstream, leases) tuple per remote. The refspecs name the pushed objects, e.g.
+             '<sha>:refs/heads/main'; leases map destinations to the value expected on the remote, '' when the ref
+             must not exist there, as for `--force-with-lease`.
+    """
+    local_values = {update.ref: update.new.sha if isinstance(update.new, CommitSpec) else update.new
+                    for update in plan.ref_updates}
+    pinned = []
+    for remote, refspecs, set_upstream in plan.grouped_pushes():
+        cache = _read_cache(repo).get(remote) or {}
+        cached = cache.get('refs', {}) if cache.get('url') == git_operations.remote_url(repo, remote) else {}
+        exact, leases = [], {}
+        for refspec in refspecs:
+            force, source, destination = parse_refspec(refspec)
+            value = local_values.get(source) if source in local_values else \
+                git_operations.resolve_commit(repo, source) if source else None
+            exact.append(f"{'+' if force else ''}{value or ''}:{destination}")
+            if destination in cached and time.time() - cached[destination][1] <= CACHE_SECONDS:
+                leases[destination] = cached[destination][0] or ''
+            elif destination.startswith('refs/heads/'):
+                leases[destination] = git_operations.resolve_commit(
+                    repo, git_operations.tracking_ref(destination, remote)) or ''
+            elif not force:
+                leases[destination] = ''
+        pinned.append((remote, exact, set_upstream, leases))
+    return pinned
+
+
+def pushed_values(plan, results):
+    """
+    :param plan: A `Plan` that has been applied.
+    :param results: The `PushResult` list returned by `apply`.
+    :return: A dict per remote mapping the pushed refs to their new object id, `...` for the rejected ones.
+    """
+    local_values = {update.ref: update.new.sha if isinstance(update.new, CommitSpec) else update.new
+                    for update in plan.ref_updates}
+    values = {}
+    for result in results:
+        for ref in result.refs:
+            source = parse_refspec(ref.source)[1] if ref.source else ''
+            if ref.flag == '!':
+                value = ...
+            elif not source:
+                value = None
+            else:
+                value = local_values.get(source, ...)
+            values.setdefault(result.remote, {})[ref.destination] = value
+    return values
+
+
+def _read_cache(repo):
+    try:
+        with open(git_operations.state_path(repo, CACHE_FILE)) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_cache(repo, cache):
+    path = git_operations.state_path(repo, CACHE_FILE)
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), prefix='.ls-remote.', delete=False) as file:
+        json.dump(cache, file)
+    os.replace(file.name, path)
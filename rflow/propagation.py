@@ -0,0 +1,203 @@
+"""
+Propagation of the version recorded in version.info to the other files that carry it.
+
+The locations are declared in version.info itself, under a `propagate` key::
+
+    "propagate": [
+        {"files": "pyproject.toml", "pattern": "version = \"{version}\""},
+        {"files": ["charts/*/Chart.yaml"], "pattern": "appVersion: \"{version}\""},
+        {"files": "**/package.json", "pattern": "\"version\": \"{version}\""}
+    ]
+
+`files` are glob patterns relative to the repository root, where `*` stays within a directory and `**/` spans any
+number of them. In a `pattern`, `{version}` stands for the current version and `{next_version}` for the next one;
+the rest of the pattern is matched literally and kept as it is.
+
+Matching paths are looked up in a pattern index kept in `.git/rflow/propagate-index.json`: the paths of one tree that
+match the globs. For another tree the index is brought up to date from `git diff-tree` between the two, so a bump
+only lists the tree once per set of rules instead of walking it every time.
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+from rflow import git_operations
+from rflow import trace
+from rflow.plan import CommitSpec
+from rflow.version_operations import VERSION_INFO_FILE
+
+INDEX_FILE = 'propagate-index.json'
+
+VERSION_PATTERN = r'[0-9]+\.[0-9]+\.[0-9]+(?:-[0-9A-Za-z.-]+)?(?:\+[0-9A-Za-z.-]+)?'
+PLACEHOLDERS = ('version', 'next_version')
+
+
+class Rule:
+    """
+    One declared version location: the files it applies to and the text the version appears in.
+    """
+
+    def __init__(self, files, pattern):
+        """
+        :param files: A glob pattern or a list of them.
+        :param pattern: The text around the version, with `{version}` or `{next_version}` placeholders.
+        :raises ValueError: If the rule has no files or its pattern has no placeholder.
+        """
+        self.globs = [files] if isinstance(files, str) else list(files or [])
+        if not self.globs or not all(isinstance(glob, str) and glob for glob in self.globs):
+            raise ValueError("Invalid propagate rule: 'files' must be a glob or a list of globs")
+        self.pattern = pattern
+        self.parts = re.split(r'\{(' + '|'.join(PLACEHOLDERS) + r')\}', pattern or '')
+        if len(self.parts) < 3:
+            raise ValueError(f"Invalid propagate rule {pattern!r}: the pattern needs a {{version}} placeholder")
+        self.regex = re.compile(''.join(re.escape(part) if index % 2 == 0 else f'(?:{VERSION_PATTERN})'
+                                        for index, part in enumerate(self.parts)))
+        self.path_regex = re.compile('|'.join(f'(?:{glob_regex(glob)})' for glob in self.globs))
+
+    def matches(self, path):
+        """
+        :param path: A path relative to the repository root.
+        :return: Whether the rule applies to the file.
+        """
+        return self.path_regex.fullmatch(path) is not None
+
+    def rewrite(self, content, version_info):
+        """
+        :param content: The content of a file the rule applies to.
+        :param version_info: The `VersionInfo` with the versions to write.
+        :return: The content with every occurrence of the pattern carrying the new versions.
+        """
+        values = {'version': version_info.current_version, 'next_version': version_info.next_version}
+        replacement = ''.join(part if index % 2 == 0 else values[part] for index, part in enumerate(self.parts))
+        return self.regex.sub(lambda match: replacement, content)
+
+
+def glob_regex(glob):
+    """
+    :param glob: A glob pattern such as 'charts/*/Chart.yaml' or '**/package.json'.
+    :return: An equivalent regular expression, where `*` does not cross directories and `**/` matches any number of
+             them.
+    """
+    regex = ''
+    for segment in glob.strip('/').split('/'):
+        if segment == '**':
+            regex += '(?:[^/]+/)*'
+            continue
+        for token in re.findall(r'\[!?[^]]+\]|.', segment):
+            if token == '*':
+                regex += '[^/]*'
+            elif token == '?':
+                regex += '[^/]'
+            elif len(token) > 2 and token.startswith('['):
+                regex += '[^' + token[2:] if token[1] == '!' else token
+            else:
+                regex += re.escape(token)
+        regex += '/'
+    return regex[:-1]
+
+
+def load_rules(version_info):
+    """
+    :param version_info: A `VersionInfo`.
+    :return: The `Rule` list declared under its `propagate` key, empty when there is none.
+    :raises ValueError: If a rule is malformed.
+    """
+    rules = version_info.data.get('propagate') or []
+    if not isinstance(rules, list) or not all(isinstance(rule, dict) for rule in rules):
+        raise ValueError("Invalid propagate setting in version.info: expected a list of rules")
+    return [Rule(rule.get('files'), rule.get('pattern')) for rule in rules]
+
+
+def matching_paths(repo, rules, tree):
+    """
+    Find the files of a tree at least one rule applies to, through the pattern index.
+    :param repo: The repository object.
+    :param rules: The `Rule` list.
+    :param tree: The id of a tree, or of a commit.
+    :return: The sorted list of matching paths.
+    """
+    tree = repo.git.rev_parse(f'{tree}^{{tree}}')
+    key = hashlib.sha1('\0'.join(glob for rule in rules for glob in rule.globs).encode('utf-8')).hexdigest()
+    index = _read_index(repo)
+    entry = index.get(key)
+    if entry and entry['tree'] == tree:
+        return entry['paths']
+
+    def matches(path):
+        return any(rule.matches(path) for rule in rules)
+
+    from rflow.backend import GitCommandError
+    paths = None
+    if entry:
+        try:
+            with trace.span('propagate diff-tree'):
+                paths = set(entry['paths'])
+                changes = git_operations.stream_records(repo, 'diff-tree', '-r', '-z', '--no-renames',
+                                                        '--name-status', entry['tree'], tree, separator='\0')
+                for status, path in zip(changes, changes):
+                    if status == 'D':
+                        paths.discard(path)
+                    elif matches(path):
+                        paths.add(path)
+        except GitCommandError:
+            paths = None  # The indexed tree is gone; list the new one instead
+    if paths is None:
+        with trace.span('propagate ls-tree'):
+            paths = {path for path in git_operations.stream_records(repo, 'ls-tree', '-r', '-z', '--name-only',
+                                                                     tree, separator='\0') if matches(path)}
+    index[key] = {'tree': tree, 'paths': sorted(paths)}
+    _write_index(repo, index)
+    return index[key]['paths']
+
+
+def propagate(repo, parent, version_info):
+    """
+    Compute the changes that carry the versions of version.info into every declared location, in one pass.
+    :param repo: The repository object.
+    :param parent: The commit the changes apply to: an object id or a planned `CommitSpec`.
+    :param version_info: The updated `VersionInfo`, whose `propagate` key declares the locations.
+    :return: A dict mapping the paths of the files that change to their new content.
+    :raises ValueError: If a rule is malformed.
+    """
+    rules = load_rules(version_info)
+    if not rules:
+        return {}
+    # The files planned commits change are laid over the blobs of the commit they build on, read in one batch
+    overlay, base = {}, parent
+    while isinstance(base, CommitSpec):
+        for path, content in base.files.items():
+            overlay.setdefault(path, content)
+        base = base.parent
+    paths = set(matching_paths(repo, rules, base))
+    paths.update(path for path in overlay if any(rule.matches(path) for rule in rules))
+    names = {path: f'{base}:{path}' for path in sorted(paths) if path not in overlay}
+    blobs = git_operations.read_files(repo, list(names.values()))
+    contents = {path: overlay[path] if path in overlay else blobs[names[path]] for path in sorted(paths)}
+    files = {}
+    for path, content in contents.items():
+        if content is None or path == VERSION_INFO_FILE:
+            continue
+        rewritten = content
+        for rule in rules:
+            if rule.matches(path):
+                rewritten = rule.rewrite(rewritten, version_info)
+        if rewritten != content:
+            files[path] = rewritten
+    return files
+
+
+def _read_index(repo):
+    try:
+        with open(git_operations.state_path(repo, INDEX_FILE)) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _write_index(repo, index):
+    path = git_operations.state_path(repo, INDEX_FILE)
+    with tempfile.NamedTemporaryFile('w', dir=os.path.dirname(path), prefix='.propagate-index.', delete=False) as file:
+        json.dump(index, file)
+    os.replace(file.name, path)
@@ -0,0 +1,259 @@
+"""
+The background push queue used by `--async-push`.
+Pushes are recorded in a journal, `.git/rflow/push-queue.jsonl`, and the command returns right away. Each one names
+the exact objects to push and the values the remote refs are expected to have (see `preflight.pinned_pushes`), so
+the worker never pushes commits made after the command and a remote that moved meanwhile rejects the push.
+A detached worker process drains the journal: the pending pushes to a remote are coalesced into one push, retried with
+exponential backoff on network errors and marked as failed when the remote rejects them or the retries run out.
+Every state change is appended to the journal as one JSON line, so the queue survives crashes and reboots.
+`rflow push-status` folds the journal into the current state of every queued push.
+"""
+import contextlib
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import namedtuple
+
+from rflow import git_operations
+from rflow.orchestration import describe_error
+
+JOURNAL_FILE = 'push-queue.jsonl'
+JOURNAL_LOCK_FILE = 'push-queue.lock'
+WORKER_LOCK_FILE = 'push-worker.lock'
+MAX_ATTEMPTS = 6
+BACKOFF_SECONDS = 1
+MAX_BACKOFF_SECONDS = 60
+
+QueuedPush = namedtuple('QueuedPush', ['id', 'remote', 'refspecs', 'set_upstream', 'leases', 'description',
+                                       'created', 'status', 'attempts', 'error'])
+
+
+@contextlib.contextmanager
+def _locked(repo, name, blocking=True):
+    # Yields whether the lock was acquired; a non-blocking attempt on a held lock yields False
+    with open(git_operations.state_path(repo, name), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def append(repo, *records):
+    """
+    Append records to the journal.
+    :param repo: The repository object.
+    :param records: Dicts with at least an `id` and an `op` key.
+    """
+    if not records:
+        return
+    lines = ''.join(json.dumps(record) + '\n' for record in records)
+    with _locked(repo, JOURNAL_LOCK_FILE):
+        with open(git_operations.state_path(repo, JOURNAL_FILE), 'a') as journal:
+            journal.write(lines)
+            journal.flush()
+            os.fsync(journal.fileno())
+
+
+def read_queue(repo):
+    """
+    Fold the journal into the current state of every queued push.
+    :param repo: The repository object.
+    :return: A list of `QueuedPush` in the order they were queued. `status` is 'pending', 'done' or 'failed'.
+    """
+    pushes = {}
+    try:
+        with open(git_operations.state_path(repo, JOURNAL_FILE)) as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by a crash
+                if record['op'] == 'enqueue':
+                    pushes[record['id']] = QueuedPush(record['id'], record['remote'], record['refspecs'],
+                                                      record['set_upstream'], record.get('leases', {}),
+                                                      record.get('description', ''), record['time'], 'pending',
+                                                      record.get('attempts', 0), None)
+                elif record['id'] in pushes:
+                    queued = pushes[record['id']]
+                    if record['op'] == 'attempt':
+                        pushes[record['id']] = queued._replace(attempts=queued.attempts + 1, error=record.get('error'))
+                    elif record['op'] in ('done', 'failed'):
+                        pushes[record['id']] = queued._replace(status=record['op'], error=record.get('error'))
+    except FileNotFoundError:
+        pass
+    return list(pushes.values())
+
+
+def enqueue(repo, pushes, description='', start_worker=True):
+    """
+    Queue pushes and make sure a worker is draining the queue.
+    :param repo: The repository object.
+    :param pushes: (remote, refspecs, set_upstream, leases) tuples as returned by `preflight.pinned_pushes`; the
+                   leases may be left out.
+    :param description: What the pushes are for, shown by `rflow push-status`.
+    :param start_worker: Whether to start a background worker.
+    :return: The ids of the queued pushes.
+    """
+    now = time.time()
+    records = [{'op': 'enqueue', 'id': uuid.uuid4().hex[:12], 'remote': remote, 'refspecs': list(refspecs),
+                'set_upstream': set_upstream, 'leases': dict(leases[0]) if leases else {},
+                'description': description, 'time': now}
+               for remote, refspecs, set_upstream, *leases in pushes]
+    if not records:
+        return []
+    append(repo, *records)
+    if start_worker:
+        start_worker_process(repo)
+    return [record['id'] for record in records]
+
+
+def start_worker_process(repo):
+    """
+    Start a detached worker process draining the queue of a repository. It exits right away if another worker is
+    already running.
+    :param repo: The repository object.
+    """
+    subprocess.Popen([sys.executable, '-m', 'rflow.push_queue', repo.working_dir],
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                     start_new_session=True)
+
+
+def worker_running(repo):
+    """
+    :param repo: The repository object.
+    :return: True if a worker is currently draining the queue.
+    """
+    with _locked(repo, WORKER_LOCK_FILE, blocking=False) as acquired:
+        return not acquired
+
+
+def drain(repo, sleep=time.sleep):
+    """
+    Push everything pending, as the only worker of the repository. Returns when the queue is empty or another worker
+    holds the lock.
+    :param repo: The repository object.
+    :param sleep: The function used to wait between retries.
+    """
+    while True:
+        with _locked(repo, WORKER_LOCK_FILE, blocking=False) as acquired:
+            if not acquired:
+                return
+            while _drain_once(repo, sleep):
+                pass
+            _compact(repo)
+        # A push queued while the lock was being released may have seen the lock held and not started a worker
+        if not any(queued.status == 'pending' for queued in read_queue(repo)):
+            return
+
+
+def _drain_once(repo, sleep):
+    # One round: one coalesced push per remote. Returns whether pushes are still pending afterwards.
+    pending = [queued for queued in read_queue(repo) if queued.status == 'pending']
+    if not pending:
+        return False
+    by_remote = {}
+    for queued in pending:
+        by_remote.setdefault(queued.remote, []).append(queued)
+    backoff = None
+    for remote, queued_pushes in by_remote.items():
+        delay = _push_coalesced(repo, remote, queued_pushes)
+        if delay is not None:
+            backoff = delay if backoff is None else min(backoff, delay)
+    if backoff is not None:
+        sleep(backoff)
+    return True
+
+
+def _push_coalesced(repo, remote, queued_pushes):
+    # Returns the backoff delay before the next attempt, or None when no push needs to be retried
+    from rflow.backend import GitCommandError
+    from rflow.preflight import parse_refspec
+    by_destination, leases, set_upstream = {}, {}, False
+    for queued in queued_pushes:
+        for refspec in queued.refspecs:
+            # The latest update of a ref wins; the remote must still have the value the first one built on
+            by_destination[parse_refspec(refspec)[2]] = refspec
+        for ref, old in queued.leases.items():
+            leases.setdefault(ref, old)
+        set_upstream = set_upstream or queued.set_upstream
+    try:
+        git_operations.push(repo, list(by_destination.values()), remote, leases=leases)
+    except GitCommandError as e:
+        error = describe_error(e)
+        rejected = any(ref.flag == '!' for ref in git_operations.parse_push_output(e.stdout))
+        if rejected and len(queued_pushes) > 1:
+            # One rejected update must not hold back the others: push them one by one
+            delays = [_push_coalesced(repo, remote, [queued]) for queued in queued_pushes]
+            delays = [delay for delay in delays if delay is not None]
+            return min(delays) if delays else None
+        records = []
+        for queued in queued_pushes:
+            records.append({'op': 'attempt', 'id': queued.id, 'error': error, 'time': time.time()})
+            if rejected or queued.attempts + 1 >= MAX_ATTEMPTS:
+                records.append({'op': 'failed', 'id': queued.id, 'error': error, 'time': time.time()})
+        append(repo, *records)
+        if rejected or all(queued.attempts + 1 >= MAX_ATTEMPTS for queued in queued_pushes):
+            return None
+        attempts = min(queued.attempts for queued in queued_pushes) + 1
+        return min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+    if set_upstream:
+        for destination in by_destination:
+            branch = destination[len('refs/heads/'):]
+            if destination.startswith('refs/heads/') and git_operations.branch_exists(repo, branch):
+                git_operations.set_upstream(repo, branch, remote)
+    append(repo, *[{'op': 'done', 'id': queued.id, 'time': time.time()} for queued in queued_pushes])
+    return None
+
+
+def _compact(repo):
+    # Drop finished pushes from the journal, keeping failed ones for `rflow push-status`
+    with _locked(repo, JOURNAL_LOCK_FILE):
+        queue = read_queue(repo)
+        if any(queued.status == 'pending' for queued in queue):
+            return
+        path = git_operations.state_path(repo, JOURNAL_FILE)
+        with open(f'{path}.tmp', 'w') as journal:
+            for queued in queue:
+                if queued.status == 'failed':
+                    journal.write(json.dumps({'op': 'enqueue', 'id': queued.id, 'remote': queued.remote,
+                                              'refspecs': queued.refspecs, 'set_upstream': queued.set_upstream,
+                                              'leases': queued.leases, 'description': queued.description,
+                                              'time': queued.created, 'attempts': queued.attempts}) + '\n')
+                    journal.write(json.dumps({'op': 'failed', 'id': queued.id, 'error': queued.error,
+                                              'time': queued.created}) + '\n')
+        os.replace(f'{path}.tmp', path)
+
+
+def clear_failed(repo):
+    """
+    Forget the failed pushes.
+    :param repo: The repository object.
+    :return: The number of failed pushes removed.
+    """
+    with _locked(repo, WORKER_LOCK_FILE):
+        failed = [queued for queued in read_queue(repo) if queued.status == 'failed']
+        append(repo, *[{'op': 'done', 'id': queued.id, 'time': time.time()} for queued in failed])
+        _compact(repo)
+    return len(failed)
+
+
+def main(argv=None):
+    """
+    Entry point of the worker process: `python -m rflow.push_queue <working tree>`.
+    """
+    from rflow.backend import open_repository
+    argv = sys.argv[1:] if argv is None else argv
+    drain(open_repository(argv[0]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import datetime
+import os
+import re
+import secrets
+import time
+from collections import namedtuple
+
+from rflow import git_operations
+
+# Unique snapshot tags append microseconds and a random token to the timestamp, e.g. v1.2.0-20240131120000123456-a1b2
+SNAPSHOT_TAG_RE = re.compile(r'^v(?P<version>\d+\.\d+\.\d+)-(?P<timestamp>\d{14})(?P<microseconds>\d{6})?'
+                             r'(?:-(?P<token>[0-9a-f]{4}))?$')
+TIMESTAMP_FORMAT = '%Y%m%d%H%M%S'
+# Tags created with `snap --defer`, one name per line, until `snap --push-deferred` pushes them
+DEFERRED_FILE = 'deferred-snapshots'
+AGE_UNITS = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days', 'w': 'weeks'}
+# Number of delete refspecs sent per push, to stay well below the command line length limit
+PUSH_BATCH_SIZE = 1000
+
+Snapshot = namedtuple('Snapshot', ['name', 'version', 'created'])
+SnapshotPush = namedtuple('SnapshotPush', ['pushed', 'failed', 'seconds'])
+
+
+def snapshot_tag_name(version, now=None, unique=False):
+    """
+    Build the name of a snapshot tag.
+    :param version: The version the snapshot belongs to.
+    :param now: The creation time, defaults to the current time.
+    :param unique: Whether to append microseconds and a random token, so that concurrent snapshots of the same
+                   version get different names.
+    :return: The tag name, e.g. 'v1.2.0-20240131120000', or 'v1.2.0-20240131120000123456-a1b2' when unique.
+    """
+    now = now or datetime.datetime.now()
+    name = f'v{version}-{now.strftime(TIMESTAMP_FORMAT)}'
+    if unique:
+        name += f'{now.microsecond:06d}-{secrets.token_hex(2)}'
+    return name
+
+
+def is_name_collision(error):
+    """
+    :param error: A `GitCommandError` raised while creating or pushing a tag, or a `PreflightError`.
+    :return: True if it failed because a tag of the same name already exists, locally or on the remote.
+    """
+    return 'already exists' in str(error)
+
+
+def parse_snapshot_tag(tag_name):
+    """
+    :param tag_name: A tag name such as 'v1.2.0-20240131120000'.
+    :return: A `Snapshot`, or None if the tag is not a snapshot tag.
+    """
+    match = SNAPSHOT_TAG_RE.match(tag_name)
+    if not match:
+        return None
+    try:
+        created = datetime.datetime.strptime(match.group('timestamp'), TIMESTAMP_FORMAT)
+    except ValueError:
+        return None
+    created = created.replace(microsecond=int(match.group('microseconds') or 0))
+    return Snapshot(tag_name, match.group('version'), created)
+
+
+def parse_age(age):
+    """
+    Parse an age such as '30d', '12h' or '2w'.
+    :param age: A positive number followed by one of the units s, m, h, d or w.
+    :return: The age as a `datetime.timedelta`.
+    :raises ValueError: If the age has an invalid format.
+    """
+    match = re.fullmatch(r'(\d+)([smhdw])', age.strip())
+    if not match:
+        raise ValueError(f"Invalid age '{age}', expected a number followed by one of s, m, h, d, w.")
+    return datetime.timedelta(**{AGE_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def list_snapshot_tags(tag_names):
+    """
+    :param tag_names: Tag names, short or fully qualified.
+    :return: The `Snapshot` of every snapshot tag among them.
+    """
+    snapshots = []
+    for name in tag_names:
+        snapshot = parse_snapshot_tag(name[len('refs/tags/'):] if name.startswith('refs/tags/') else name)
+        if snapshot:
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def select_for_pruning(snapshots, keep=None, older_than=None, now=None):
+    """
+    Apply the retention policies to a set of snapshot tags.
+    A snapshot is pruned when it is not among the `keep` most recent snapshots of its version, or when it was created
+    more than `older_than` ago. Policies that are None are not applied.
+    :param snapshots: The `Snapshot` tuples to consider.
+    :param keep: How many snapshots to keep per version.
+    :param older_than: A `datetime.timedelta`; older snapshots are pruned.
+    :param now: The reference time for `older_than`, defaults to the current time.
+    :return: The names of the snapshot tags to delete, sorted.
+    """
+    pruned = set()
+    if keep is not None:
+        by_version = {}
+        for snapshot in snapshots:
+            by_version.setdefault(snapshot.version, []).append(snapshot)
+        for version_snapshots in by_version.values():
+            version_snapshots.sort(key=lambda snapshot: snapshot.created, reverse=True)
+            pruned.update(snapshot.name for snapshot in version_snapshots[keep:])
+    if older_than is not None:
+        cutoff = (now or datetime.datetime.now()) - older_than
+        pruned.update(snapshot.name for snapshot in snapshots if snapshot.created < cutoff)
+    return sorted(pruned)
+
+
+def prune_snapshots(repo, keep=None, older_than=None, remote='origin', dry_run=False):
+    """
+    Delete the snapshot tags selected by the retention policies, locally and on the remote.
+    Local tags are removed in a single ref transaction and remote tags through batched pushes of delete refspecs.
+    :param repo: The repository object.
+    :param keep: How many snapshots to keep per version.
+    :param older_than: A `datetime.timedelta`; older snapshots are pruned.
+    :param remote: The remote to prune as well, or None to only prune local tags.
+    :param dry_run: Only compute what would be deleted.
+    :return: A tuple (local, remote) with the names of the tags deleted locally and on the remote.
+    """
+    local_tags = set(git_operations.list_refs(repo, 'refs/tags/v*', fmt='%(refname:strip=2)'))
+    remote_tags = set()
+    if remote:
+        remote_tags = {ref[len('refs/tags/'):] for ref in git_operations.ls_remote(repo, remote, 'refs/tags/v*')}
+    pruned = select_for_pruning(list_snapshot_tags(local_tags | remote_tags), keep, older_than)
+    pruned_local = [name for name in pruned if name in local_tags]
+    pruned_remote = [name for name in pruned if name in remote_tags]
+    if not dry_run:
+        git_operations.delete_refs(repo, [f'refs/tags/{name}' for name in pruned_local])
+        for start in range(0, len(pruned_remote), PUSH_BATCH_SIZE):
+            batch = pruned_remote[start:start + PUSH_BATCH_SIZE]
+            git_operations.push(repo, [f':refs/tags/{name}' for name in batch], remote=remote, atomic=False)
+    return pruned_local, pruned_remote
+
+
+def defer_snapshot(repo, tag_name):
+    """
+    Remember a snapshot tag created locally, to push it later with other ones.
+    :param repo: The repository object.
+    :param tag_name: The name of the tag.
+    """
+    # A single short append is atomic, so concurrent jobs sharing the repository do not lose names
+    with open(git_operations.state_path(repo, DEFERRED_FILE), 'a') as file:
+        file.write(tag_name + '\n')
+
+
+def take_deferred_snapshots(repo):
+    """
+    Take the deferred snapshot tags. Tags deferred meanwhile go to a new list.
+    :param repo: The repository object.
+    :return: The names of the deferred tags, in creation order.
+    """
+    path = git_operations.state_path(repo, DEFERRED_FILE)
+    taken = f'{path}.{os.getpid()}'
+    try:
+        os.replace(path, taken)
+    except FileNotFoundError:
+        return []
+    with open(taken) as file:
+        names = [line.strip() for line in file if line.strip()]
+    os.remove(taken)
+    return list(dict.fromkeys(names))
+
+
+def push_snapshots(repo, tag_names, remote='origin', retries=3):
+    """
+    Push snapshot tags in one push. A tag rejected because the remote already has one of the same name is renamed to
+    a unique name and pushed again, up to `retries` times.
+    :param repo: The repository object.
+    :param tag_names: The names of local snapshot tags.
+    :param remote: The name of the remote.
+    :param retries: How many times rejected tags are renamed and pushed again.
+    :return: A `SnapshotPush` with the names of the pushed and failed tags and the time it took.
+    """
+    start = time.perf_counter()
+    pushed, pending = [], list(tag_names)
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        result = git_operations.push(repo, [f'refs/tags/{name}' for name in pending], remote=remote, atomic=False,
+                                     check=False)
+        rejected = {ref.destination[len('refs/tags/'):] for ref in result.refs if ref.flag == '!'}
+        pushed += [name for name in pending if name not in rejected]
+        pending = sorted(rejected)
+        if pending and attempt < retries:
+            pending = rename_snapshots(repo, pending)
+    return SnapshotPush(pushed, pending, time.perf_counter() - start)
+
+
+def rename_snapshots(repo, tag_names):
+    """
+    Give snapshot tags new unique names, in one ref transaction.
+    :param repo: The repository object.
+    :param tag_names: The names of local snapshot tags.
+    :return: The new names, in the same order.
+    """
+    updates, new_names = [], []
+    for name in tag_names:
+        snapshot = parse_snapshot_tag(name)
+        commit = git_operations.resolve_commit(repo, f'refs/tags/{name}')
+        new_name = snapshot_tag_name(snapshot.version, unique=True)
+        updates += [(f'refs/tags/{new_name}', commit, ''), (f'refs/tags/{name}', None, commit)]
+        new_names.append(new_name)
+    git_operations.update_refs(repo, updates, 'rflow: rename snapshot')
+    return new_names
@@ -0,0 +1,169 @@
+"""
+Opt-in tracing of the git commands and phases of an rflow invocation.
+
+Enabled with `rflow --trace FILE ...` or the RFLOW_TRACE=FILE environment variable. Every git command run through
+GitPython or the slim backend is recorded with its duration, exit code and output size, next to the phases marked
+with `span`. When the command finishes a summary table is printed to stderr and FILE receives the events in the
+Chrome trace event format, which can be loaded in chrome://tracing, Perfetto or speedscope.
+"""
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+TRACE_ENV = 'RFLOW_TRACE'
+
+_tracer = None
+
+
+class Tracer:
+    """
+    Collects trace events in memory. Safe to use from several threads.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The file the Chrome trace is written to.
+        """
+        self.path = path
+        self.origin = time.perf_counter()
+        self.events = []
+        self.lock = threading.Lock()
+
+    def record(self, name, category, start, duration, **args):
+        """
+        Add a completed event.
+        :param name: The event name, e.g. the git command line.
+        :param category: 'git' for git commands, 'phase' for spans.
+        :param start: The `time.perf_counter()` value at the start of the event.
+        :param duration: The duration in seconds.
+        :param args: Extra data shown with the event, e.g. exit_code and output_bytes.
+        """
+        event = {'name': name, 'cat': category, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                 'ts': round((start - self.origin) * 1e6), 'dur': round(duration * 1e6), 'args': args}
+        with self.lock:
+            self.events.append(event)
+
+    def summary(self):
+        """
+        :return: A table with one row per recorded event, in start order, followed by the totals.
+        """
+        events = sorted(self.events, key=lambda event: event['ts'])
+        git_events = [event for event in events if event['cat'] == 'git']
+        lines = [f"{'START':>9} {'DURATION':>10} {'EXIT':>4} {'BYTES':>8}  EVENT"]
+        for event in events:
+            exit_code = event['args'].get('exit_code', '')
+            output_bytes = event['args'].get('output_bytes', '')
+            name = event['name'] if event['cat'] == 'git' else f"[{event['name']}]"
+            lines.append(f"{event['ts'] / 1000:8.1f}ms {event['dur'] / 1000:8.1f}ms {exit_code!s:>4} "
+                         f"{output_bytes!s:>8}  {name}")
+        total = sum(event['dur'] for event in git_events) / 1000
+        lines.append(f'{len(git_events)} git commands, {total:.1f}ms in git.')
+        return '\n'.join(lines)
+
+    def write(self):
+        """
+        Write the events to `path` in the Chrome trace event format.
+        """
+        with open(self.path, 'w') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+
+
+def start(path):
+    """
+    Start tracing: install the GitPython hook and begin collecting events. The slim backend records its commands
+    itself, so GitPython is neither hooked nor imported when it is selected.
+    :param path: The file the Chrome trace is written to by `finish`.
+    :return: The active `Tracer`.
+    """
+    global _tracer
+    if _tracer is None:
+        from rflow import backend
+        _tracer = Tracer(path)
+        if backend.selected() == 'gitpython':
+            with span('import git'):
+                _install_gitpython_hook()
+    return _tracer
+
+
+def finish(stream=None):
+    """
+    Stop tracing, print the summary table and write the trace file.
+    :param stream: Where the summary table is printed, standard error by default.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    stream = stream or sys.stderr
+    if tracer is not None:
+        print(tracer.summary(), file=stream)
+        tracer.write()
+        print(f'Trace written to {tracer.path}', file=stream)
+
+
+def is_enabled():
+    return _tracer is not None
+
+
+@contextlib.contextmanager
+def span(name, **args):
+    """
+    Record the duration of a phase, e.g. `with trace.span('open repository'):`. Does nothing when tracing is off.
+    :param name: The name of the phase.
+    :param args: Extra data shown with the event.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        tracer.record(name, 'phase', start_time, time.perf_counter() - start_time, **args)
+
+
+def record_command(command, start_time, exit_code, output_bytes):
+    """
+    Record a finished git command. Does nothing when tracing is off.
+    :param command: The command line as a list.
+    :param start_time: The `time.perf_counter()` value when the command started.
+    :param exit_code: The exit code of the command.
+    :param output_bytes: The number of bytes the command wrote to stdout and stderr.
+    """
+    tracer = _tracer
+    if tracer is not None:
+        tracer.record(' '.join(str(part) for part in command), 'git', start_time, time.perf_counter() - start_time,
+                      exit_code=exit_code, output_bytes=output_bytes)
+
+
+def _output_size(output):
+    if isinstance(output, tuple):
+        return sum(_output_size(part) for part in output[1:])
+    if isinstance(output, (str, bytes)):
+        return len(output)
+    return 0
+
+
+def _install_gitpython_hook():
+    from git import GitCommandError
+    from git.cmd import Git
+
+    if getattr(Git.execute, 'rflow_traced', False):
+        return
+    execute = Git.execute
+
+    def traced_execute(self, command, *args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            output = execute(self, command, *args, **kwargs)
+        except GitCommandError as e:
+            record_command(command, start_time, e.status, _output_size((None, e.stdout, e.stderr)))
+            raise
+        exit_code = output[0] if isinstance(output, tuple) else 0
+        record_command(command, start_time, exit_code, _output_size(output))
+        return output
+
+    traced_execute.rflow_traced = True
+    Git.execute = traced_execute
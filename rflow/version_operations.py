@@ -1,7 +1,93 @@
 import json
 import os
+import re
+import tempfile
+from collections import namedtuple
+
 import click
-import semantic_version
+
+from rflow import git_operations
+
+
+VERSION_INFO_FILE = 'version.info'
+
+
+class VersionInfo:
+    """
+    The parsed content of a version.info file.
+    Unknown keys are preserved so that saving the model only changes the version fields.
+    """
+
+    def __init__(self, data):
+        """
+        :param data: The decoded JSON object of the version.info file.
+        :raises ValueError: If the current or next version is missing.
+        """
+        if not isinstance(data, dict) or 'currentVersion' not in data or 'nextVersion' not in data:
+            raise ValueError("version.info file not found or invalid format")
+        self.data = data
+
+    @property
+    def current_version(self):
+        return self.data['currentVersion']
+
+    @property
+    def next_version(self):
+        return self.data['nextVersion']
+
+    def update(self, current_version, next_version):
+        """
+        Set both versions at once.
+        :param current_version: The current version.
+        :param next_version: The next version.
+        """
+        self.data['currentVersion'] = current_version
+        self.data['nextVersion'] = next_version
+
+    def to_json(self):
+        """
+        :return: The version.info content as written to disk.
+        """
+        return json.dumps(self.data, indent=4)
+
+    @classmethod
+    def from_json(cls, text):
+        """
+        :param text: The content of a version.info file.
+        :return: A `VersionInfo` instance.
+        :raises ValueError: If the content is not valid JSON or misses a version field.
+        """
+        try:
+            return cls(json.loads(text))
+        except json.JSONDecodeError:
+            raise ValueError("version.info file not found or invalid format")
+
+    @classmethod
+    def load(cls, file_path=VERSION_INFO_FILE, echo=click.echo):
+        """
+        Read and parse a version.info file.
+        :param file_path: The path of the version.info file.
+        :param echo: The function used to report a missing file.
+        :return: A `VersionInfo` instance.
+        :raises click.Abort: If the file does not exist.
+        :raises ValueError: If the file has an invalid format.
+        """
+        check_version_info_exists(file_path, echo)
+        with open(file_path, 'r') as file:
+            return cls.from_json(file.read())
+
+    def save(self, file_path=VERSION_INFO_FILE):
+        """
+        Write the model to disk atomically: the content goes to a temporary file in the same directory which then
+        replaces the target, so readers never see a partially written version.info.
+        :param file_path: The path of the version.info file.
+        """
+        directory = os.path.dirname(os.path.abspath(file_path))
+        mode = os.stat(file_path).st_mode & 0o777 if os.path.exists(file_path) else 0o644
+        with tempfile.NamedTemporaryFile('w', dir=directory, prefix='.version.info.', delete=False) as file:
+            file.write(self.to_json())
+        os.chmod(file.name, mode)
+        os.replace(file.name, file_path)
 
 
 def update_version_info(file_path, current_version, next_version):
@@ -14,13 +100,9 @@ def update_version_info(file_path, current_version, next_version):
     :param next_version: The next version.
     :type next_version: str
     """
-    with open(file_path, 'r+') as file:
-        version_info = json.load(file)
-        version_info['currentVersion'] = current_version
-        version_info['nextVersion'] = next_version
-        file.seek(0)
-        json.dump(version_info, file, indent=4)
-        file.truncate()
+    version_info = VersionInfo.load(file_path)
+    version_info.update(current_version, next_version)
+    version_info.save(file_path)
 
 
 def read_current_version():
@@ -30,11 +112,8 @@ def read_current_version():
     :raises ValueError: If the 'version.info' file is not found or has an invalid format.
     """
     try:
-        check_version_info_exists()
-        with open('version.info', 'r') as file:
-            version_info = json.load(file)
-        return version_info['currentVersion']
-    except (FileNotFoundError, KeyError):
+        return VersionInfo.load().current_version
+    except FileNotFoundError:
         raise ValueError("version.info file not found or invalid format")
 
 
@@ -45,11 +124,8 @@ def read_next_version():
     :raises ValueError: If the version.info file is not found or has an invalid format.
     """
     try:
-        check_version_info_exists()
-        with open('version.info', 'r') as file:
-            version_info = json.load(file)
-        return version_info['nextVersion']
-    except (FileNotFoundError, KeyError):
+        return VersionInfo.load().next_version
+    except FileNotFoundError:
         raise ValueError("version.info file not found or invalid format")
 
 
@@ -58,6 +134,7 @@ def increment_major_version(version):
     :param version: The current version in semantic versioning format (e.g. "1.2.3").
     :return: The incremented version with the major version number increased by 1 (e.g. "2.0.0").
     """
+    import semantic_version
     semver = semantic_version.Version(version)
     return str(semver.next_major())
 
@@ -68,6 +145,7 @@ def increment_minor_version(version):
     :param version: A string representing the current version in semantic versioning format (MAJOR.MINOR.PATCH)
     :return: A string representing the next minor version in semantic versioning format (MAJOR.MINOR.PATCH)
     """
+    import semantic_version
     semver = semantic_version.Version(version)
     return str(semver.next_minor())
 
@@ -77,39 +155,147 @@ def increment_patch_version(version):
     :param version: The current version in semantic versioning format (e.g. "1.2.3").
     :return: The incremented version with the patch number increased by 1 (e.g. "1.2.4").
     """
+    import semantic_version
     semver = semantic_version.Version(version)
     return str(semver.next_patch())
 
 
-def get_latest_release_version(repo):
+RELEASE_BRANCH_PATTERNS = ('refs/heads/release/v*', 'refs/remotes/*/release/v*')
+
+
+def list_release_branches(repo, remote=None):
     """
-    Get the latest release version from a given repository.
-    :param repo: The repository to get the latest release version from.
-    :return: The latest release version as a string, or None if no release branches are found or there are no versions available.
+    List the local and remote-tracking release branches with one ref scan.
+    :param repo: The repository to scan.
+    :param remote: The name of a remote whose advertised release branches are listed too, for clones that do not
+                   track every branch. None to only scan local refs.
+    :return: A list of (refname, version) tuples, where version is a `semantic_version.Version`. Branches with an
+             invalid version in their name are skipped.
     """
-    release_branches = [branch for branch in repo.branches if branch.name.startswith('release/v')]
-    if not release_branches:
-        return None
-    versions = []
-    for branch in release_branches:
+    import semantic_version
+    release_branches = []
+    refnames = git_operations.list_refs(repo, *RELEASE_BRANCH_PATTERNS)
+    if remote:
+        refnames += [git_operations.tracking_ref(refname, remote)
+                     for refname in git_operations.ls_remote(repo, remote, 'refs/heads/release/v*')]
+    for refname in refnames:
         try:
-            version_str = branch.name.split('release/v')[-1]
-            versions.append(semantic_version.Version(version_str))
+            version_str = refname.split('release/v')[-1]
+            release_branches.append((refname, semantic_version.Version(version_str)))
         except ValueError:
             continue  # Ignore branches with invalid version formats
+    return release_branches
+
+
+def release_branches_by_line(repo):
+    """
+    Pick one release branch per release line, preferring local branches over remote-tracking ones.
+    :param repo: The repository to scan.
+    :return: A dict mapping (major, minor) tuples to full ref names.
+    """
+    branches = {}
+    for refname, version in list_release_branches(repo):
+        line = (version.major, version.minor)
+        if line not in branches or refname.startswith('refs/heads/'):
+            branches[line] = refname
+    return branches
+
+
+def get_latest_release_version(repo, remote=None):
+    """
+    Get the latest release version from a given repository.
+    Local and remote-tracking release branches are both taken into account.
+    :param repo: The repository to get the latest release version from.
+    :param remote: The name of a remote to ask for its release branches too, or None.
+    :return: The latest release version as a string, or None if no release branches are found or there are no versions available.
+    """
+    versions = [version for _, version in list_release_branches(repo, remote)]
     if not versions:
         return None
     return str(max(versions))  # Return the highest version
 
 
-def check_version_info_exists():
+RELEASE_TAG_RE = re.compile(r'^v(\d+\.\d+\.\d+)$')
+
+ReleaseLine = namedtuple('ReleaseLine', ['line', 'branch', 'branch_info', 'tag', 'tag_info', 'problems'])
+
+
+def list_release_tags(repo):
+    """
+    List the release tags (v<major>.<minor>.<patch>, snapshot tags excluded) with one ref scan.
+    :param repo: The repository to scan.
+    :return: A list of (tag name, version) tuples, where version is a `semantic_version.Version`.
+    """
+    import semantic_version
+    release_tags = []
+    for tag_name in git_operations.list_refs(repo, 'refs/tags/v*', fmt='%(refname:strip=2)'):
+        match = RELEASE_TAG_RE.match(tag_name)
+        if match:
+            release_tags.append((tag_name, semantic_version.Version(match.group(1))))
+    return release_tags
+
+
+def collect_release_lines(repo):
+    """
+    Read version.info from every release branch and release tag and group the results per release line.
+    All files are read through one `git cat-file --batch` process, nothing is checked out.
+    Local release branches take precedence over remote-tracking ones of the same line.
+    :param repo: The repository to inspect.
+    :return: A list of `ReleaseLine` tuples sorted by version. `branch_info` and `tag_info` are `VersionInfo`
+             instances (or None), `tag` is the latest release tag of the line and `problems` lists the mismatches
+             found between the names and the content of the branch and its tags.
+    """
+    import semantic_version
+    branches = release_branches_by_line(repo)
+    tags = {}
+    for tag_name, version in list_release_tags(repo):
+        tags.setdefault((version.major, version.minor), []).append((version, tag_name))
+    names = [f'{refname}:{VERSION_INFO_FILE}' for refname in branches.values()]
+    names += [f'refs/tags/{tag_name}:{VERSION_INFO_FILE}' for line_tags in tags.values() for _, tag_name in line_tags]
+    contents = git_operations.read_files(repo, names)
+
+    def parse(name, problems, label):
+        if contents.get(name) is None:
+            problems.append(f'{label} has no version.info')
+            return None
+        try:
+            return VersionInfo.from_json(contents[name])
+        except ValueError:
+            problems.append(f'{label} has an invalid version.info')
+            return None
+
+    release_lines = []
+    for line in sorted(set(branches) | set(tags)):
+        problems = []
+        refname = branches.get(line)
+        branch = refname.split('/', 2)[-1] if refname else None
+        branch_info = parse(f'{refname}:{VERSION_INFO_FILE}', problems, branch) if refname else None
+        latest_tag, tag_info = None, None
+        for version, tag_name in sorted(tags.get(line, [])):
+            info = parse(f'refs/tags/{tag_name}:{VERSION_INFO_FILE}', problems, tag_name)
+            if info and info.current_version != str(version):
+                problems.append(f'{tag_name} records version {info.current_version}')
+            latest_tag, tag_info = tag_name, info
+        if branch_info and latest_tag:
+            try:
+                if semantic_version.Version(branch_info.current_version) < semantic_version.Version(latest_tag[1:]):
+                    problems.append(f'{branch} is behind {latest_tag}')
+            except ValueError:
+                problems.append(f'{branch} records an invalid version {branch_info.current_version}')
+        release_lines.append(ReleaseLine(f'{line[0]}.{line[1]}', branch, branch_info, latest_tag, tag_info, problems))
+    return release_lines
+
+
+def check_version_info_exists(file_path=VERSION_INFO_FILE, echo=click.echo):
     """
     Function to check if a 'version.info' exists in the current directory.
     Raises a FileNotFoundError if 'version.info' does not exist.
+    :param file_path: The path of the version.info file.
+    :param echo: The function used to report the problem.
     :return: None
     """
-    if not os.path.exists('version.info'):
-        click.echo("version.info file does not exist. Please initialize it using 'rflow init'.")
+    if not os.path.exists(file_path):
+        echo("version.info file does not exist. Please initialize it using 'rflow init'.")
         raise click.Abort()
 
 
@@ -118,5 +304,6 @@ def init_version():
     This method initializes a version number and returns it as a string.
     :return: The initialized version as a string.
     """
+    import semantic_version
     semver = semantic_version.Version('1.0.0')
     return str(semver)
@@ -13,7 +13,7 @@ except (FileNotFoundError, KeyError):
 setup(
     name='rflow',
     version=current_version,
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     include_package_data=True,
     install_requires=[
         'click==8.1.7',
@@ -24,7 +24,7 @@ setup(
     ],
     entry_points={
         'console_scripts': [
-            'rflow=rflow.cli:cli',
+            'rflow=rflow.client:main',
         ],
     },
 )
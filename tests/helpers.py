@@ -0,0 +1,51 @@
+import os
+import subprocess
+import tempfile
+
+
+def git(cwd, *args):
+    """
+    Run a git command in the given directory and return its standard output.
+    """
+    return subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+class RepoFixture:
+    """
+    A scratch working repository cloned from a local bare `origin`, with one commit on `main`.
+    """
+
+    def __init__(self, version_info='{\n    "currentVersion": "1.0.0",\n    "nextVersion": "1.1.0"\n}'):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.origin = os.path.join(self.temp_dir.name, 'origin.git')
+        self.path = os.path.join(self.temp_dir.name, 'work')
+        git(self.temp_dir.name, 'init', '-q', '--bare', '-b', 'main', self.origin)
+        git(self.temp_dir.name, 'clone', '-q', self.origin, self.path)
+        git(self.path, 'config', 'user.name', 'rflow')
+        git(self.path, 'config', 'user.email', 'rflow@example.com')
+        git(self.path, 'checkout', '-q', '-B', 'main')
+        if version_info is not None:
+            with open(os.path.join(self.path, 'version.info'), 'w') as file:
+                file.write(version_info)
+            git(self.path, 'add', 'version.info')
+        git(self.path, 'commit', '-q', '--allow-empty', '-m', 'Initial commit')
+        git(self.path, 'push', '-q', '--set-upstream', 'origin', 'main')
+
+    def git(self, *args):
+        return git(self.path, *args)
+
+    def remote_git(self, *args):
+        return git(self.origin, *args)
+
+    def clone(self, name, *args):
+        """
+        Clone `origin` again, e.g. with `--depth 1`, and return the path of the new working tree.
+        """
+        path = os.path.join(self.temp_dir.name, name)
+        git(self.temp_dir.name, 'clone', '-q', *args, f'file://{self.origin}', path)
+        git(path, 'config', 'user.name', 'rflow')
+        git(path, 'config', 'user.email', 'rflow@example.com')
+        return path
+
+    def cleanup(self):
+        self.temp_dir.cleanup()
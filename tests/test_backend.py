@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+import unittest
+
+from rflow import backend
+from rflow.backend import GitCommandError, InvalidRepositoryError, SlimRepo, open_repository
+from tests.helpers import RepoFixture
+
+
+class TestBackends(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.fixture.git('branch', 'release/v1.0.0')
+
+    def test_both_backends_describe_the_repository_alike(self):
+        gitpython_repo = open_repository(self.fixture.path, backend='gitpython')
+        with open_repository(self.fixture.path, backend='slim') as slim_repo:
+            self.assertIsInstance(slim_repo, SlimRepo)
+            for name in ('working_dir', 'git_dir', 'common_dir'):
+                self.assertEqual(os.path.realpath(getattr(slim_repo, name)),
+                                 os.path.realpath(getattr(gitpython_repo, name)))
+            self.assertEqual(sorted(slim_repo.branches), sorted(branch.name for branch in gitpython_repo.branches))
+            self.assertEqual(slim_repo.git.rev_parse('HEAD'), gitpython_repo.git.rev_parse('HEAD'))
+
+    def test_invalid_repositories_are_rejected_by_both_backends(self):
+        os.mkdir(os.path.join(self.fixture.path, 'sub'))
+        for name in backend.BACKENDS:
+            for path in (os.path.join(self.fixture.path, 'sub'), os.path.join(self.fixture.path, 'missing')):
+                with self.assertRaises(InvalidRepositoryError):
+                    open_repository(path, backend=name)
+
+    def test_slim_objects_are_read_by_one_batch_process(self):
+        with SlimRepo(self.fixture.path) as repo:
+            sha, kind, size, data = repo.git.get_object_data('HEAD:version.info')
+            batch = repo.git._batch
+            self.assertEqual((kind, size), ('blob', len(data)))
+            self.assertIn(b'"currentVersion": "1.0.0"', data)
+            with self.assertRaises(ValueError):
+                repo.git.get_object_data('HEAD:missing')
+            self.assertEqual(repo.git.get_object_data('HEAD')[1], 'commit')
+            self.assertIs(repo.git._batch, batch)
+
+    def test_slim_errors_carry_the_command_and_stderr(self):
+        repo = SlimRepo(self.fixture.path)
+        with self.assertRaises(GitCommandError) as raised:
+            repo.git.rev_parse('--verify', 'does-not-exist')
+        self.assertEqual(raised.exception.command[:2], ['git', 'rev-parse'])
+        self.assertEqual(raised.exception.status, 128)
+        self.assertIn('does-not-exist', str(raised.exception))
+
+    def test_slim_backend_does_not_load_gitpython(self):
+        code = ('import sys\nimport rflow.cli\ntry:\n    rflow.cli.cli(["release"])\nexcept SystemExit:\n    pass\n'
+                'print("git" in sys.modules)')
+        env = dict(os.environ, RFLOW_BACKEND='slim', RFLOW_NO_DAEMON='1',
+                   PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        result = subprocess.run([sys.executable, '-c', code], cwd=self.fixture.path, env=env, capture_output=True,
+                                text=True, check=True)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], 'False')
+        self.assertEqual(self.fixture.remote_git('branch', '--list', 'release/v1.1.0').strip(), 'release/v1.1.0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.generate import Scale, generate, git
+from benchmarks.run import compare
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_generate_scenario(self):
+        with tempfile.TemporaryDirectory() as root:
+            work = generate(root, Scale(release_branches=3, tags=4, snapshot_tags=5, files=10))
+            self.assertEqual(len(git(work, 'for-each-ref', 'refs/heads/release/').splitlines()), 3)
+            self.assertEqual(len(git(work, 'for-each-ref', 'refs/remotes/origin/release/').splitlines()), 3)
+            self.assertEqual(len(git(work, 'tag', '--list').splitlines()), 9)
+            self.assertEqual(git(work, 'status', '--porcelain'), '')
+            self.assertTrue(os.path.exists(os.path.join(work, 'src', 'module000', 'file000009.txt')))
+
+    def test_compare_reports_regressions(self):
+        baseline = {'results': [{'scale': 'small', 'command': 'snap', 'seconds': 1.0, 'git_processes': 5}]}
+        results = [{'scale': 'small', 'command': 'snap', 'seconds': 1.1, 'git_processes': 5}]
+        self.assertEqual(compare(results, baseline, 1.25), [])
+        results = [{'scale': 'small', 'command': 'snap', 'seconds': 2.0, 'git_processes': 6}]
+        self.assertEqual(len(compare(results, baseline, 1.25)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import unittest
+from unittest.mock import patch
+
+from rflow import flows
+from rflow.backend import open_repository
+from rflow.catalog import VersionCatalog, ref_stamp
+from rflow.context import RflowContext
+from tests.helpers import RepoFixture
+
+
+class TestVersionCatalog(unittest.TestCase):
+    def test_queries(self):
+        catalog = VersionCatalog([(1, 4, 3), (1, 4, 1), (2, 0, 0), (2, 1, 5), (10, 0, 0)],
+                                 [((1, 4, 0), 'refs/heads/release/v1.4.0'),
+                                  ((2, 1, 0), 'refs/remotes/origin/release/v2.1.0')])
+        self.assertEqual(catalog.latest_tag(), '10.0.0')
+        self.assertEqual(catalog.latest_tag(2), '2.1.5')
+        self.assertIsNone(catalog.latest_tag(3))
+        self.assertEqual(catalog.next_free_patch(1, 4), '1.4.4')
+        self.assertEqual(catalog.next_free_patch(1, 5), '1.5.0')
+        self.assertTrue(catalog.has_tag('1.4.3'))
+        self.assertFalse(catalog.has_tag('1.4.2'))
+        self.assertIsNone(catalog.has_tag('1.4.3-rc1'))
+        self.assertEqual(catalog.latest_branch(), '2.1.0')
+        self.assertEqual(catalog.latest_branch(1), '1.4.0')
+
+
+class TestPersistentCatalog(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        for tag in ('v1.0.0', 'v1.0.1', 'v1.0.0-20240101000000'):
+            self.fixture.git('tag', tag)
+        self.fixture.git('branch', 'release/v1.0.0')
+        self.repo = open_repository(self.fixture.path)
+
+    def test_saved_catalog_is_reused_until_refs_change(self):
+        catalog = VersionCatalog.load(self.repo)
+        self.assertEqual(catalog.tags, [(1, 0, 0), (1, 0, 1)])
+        with patch.object(VersionCatalog, 'scan', side_effect=AssertionError('refs scanned again')):
+            self.assertEqual(VersionCatalog.load(self.repo).tags, catalog.tags)
+        self.fixture.git('tag', 'v1.0.2')
+        self.assertIsNone(VersionCatalog.read(self.repo))
+        self.assertTrue(VersionCatalog.load(self.repo).has_tag('1.0.2'))
+        self.fixture.git('pack-refs', '--all')
+        self.fixture.git('tag', '-d', 'v1.0.0')
+        self.assertFalse(VersionCatalog.load(self.repo).has_tag('1.0.0'))
+
+    def test_reftable_repositories_are_stamped_by_their_table_list(self):
+        os.mkdir(os.path.join(self.repo.common_dir, 'reftable'))
+        tables_list = os.path.join(self.repo.common_dir, 'reftable', 'tables.list')
+        with open(tables_list, 'w') as file:
+            file.write('0x000000000001-0x000000000003-1a2b3c4d.ref\n')
+        stamp = ref_stamp(self.repo)
+        self.assertEqual(list(stamp), ['reftable/tables.list'])
+        with open(tables_list, 'a') as file:
+            file.write('0x000000000004-0x000000000004-5e6f7a8b.ref\n')
+        self.assertNotEqual(ref_stamp(self.repo), stamp)
+
+    def test_rflow_changes_are_recorded_without_a_rescan(self):
+        rctx = RflowContext(self.fixture.path, echo=lambda message, err=False: None)
+        rctx.catalog
+        flows.release(rctx)
+        with patch.object(VersionCatalog, 'scan', side_effect=AssertionError('refs scanned again')):
+            catalog = VersionCatalog.load(self.repo)
+        self.assertEqual(catalog.latest_branch(), '1.1.0')
+        self.assertIn(((1, 1, 0), 'refs/remotes/origin/release/v1.1.0'), catalog.branches)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import io
+import os
+import unittest
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+from rflow import changelog
+from rflow.backend import open_repository
+from rflow.cli import cli
+from rflow.context import RflowContext
+from tests.helpers import RepoFixture
+
+
+class TestTemplate(unittest.TestCase):
+    def test_release_template_is_split_around_the_version_block(self):
+        with open(os.path.join(os.path.dirname(__file__), '..', changelog.TEMPLATE_FILE), encoding='utf-8') as file:
+            head, block, tail = changelog.split_template(file.read())
+        self.assertTrue(block.startswith('## Version [Version Number] - [Release Date]'))
+        self.assertIn('Release Notes', head)
+        self.assertTrue(tail.startswith('---'))
+
+    def test_placeholders_are_replaced_by_the_commits(self):
+        _, block, _ = changelog.split_template(changelog.DEFAULT_TEMPLATE)
+        commits = [changelog.history.Commit('a' * 40, 'Add the changelog command'),
+                   changelog.history.Commit('b' * 40, 'fix: crash on empty tags'),
+                   changelog.history.Commit('c' * 40, 'Update version.info on main branch')]
+        sections = changelog.spool_sections(changelog.classify(commits))
+        out = io.StringIO()
+        changelog.render_block(block, '1.4.0', '2024-05-01', sections, out)
+        self.assertEqual(out.getvalue(), '## Version 1.4.0 - 2024-05-01\n\n'
+                                         '### 🌟 Release Highlights:\n- Add the changelog command (aaaaaaa)\n\n'
+                                         '### 🐞 Bug Fixes:\n- fix: crash on empty tags (bbbbbbb)\n\n'
+                                         '### 📚 Documentation Updates:\n- No changes.\n\n')
+
+
+class TestChangelog(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.repo = open_repository(self.fixture.path)
+        self.fixture.git('tag', 'v1.3.0')
+        for subject, tag in (('Add streaming', None), ('fix: broken pipe', 'v1.4.0'), ('Update README', None),
+                             ('Add cache', 'v1.5.0'), ('Add preflight', None)):
+            self.fixture.git('commit', '-q', '--allow-empty', '-m', subject)
+            if tag:
+                self.fixture.git('tag', tag)
+        self.fixture.git('tag', 'v1.5.0-20240101000000')
+
+    def generate(self, start, end, **kwargs):
+        out = io.StringIO()
+        computed = changelog.generate(self.repo, start, end, out, template=changelog.DEFAULT_TEMPLATE, **kwargs)
+        return out.getvalue(), computed
+
+    def test_range_is_cut_at_release_tags(self):
+        notes, computed = self.generate('v1.3.0', 'HEAD', version='1.6.0')
+        self.assertEqual(computed, 3)
+        versions = [line.split(' - ')[0] for line in notes.splitlines() if line.startswith('## Version')]
+        self.assertEqual(versions, ['## Version 1.6.0', '## Version 1.5.0', '## Version 1.4.0'])
+        self.assertLess(notes.index('Add cache'), notes.index('Add streaming'))
+        self.assertIn('- Update README', notes.split('### 📚')[2].split('###')[0])
+
+    def test_cumulative_notes_only_render_new_commits(self):
+        first, _ = self.generate('v1.3.0', 'v1.5.0')
+        self.fixture.git('commit', '-q', '--allow-empty', '-m', 'Add more')
+        self.fixture.git('tag', 'v1.6.0')
+        with patch.object(changelog, 'iter_commits', wraps=changelog.iter_commits) as iter_commits:
+            notes, computed = self.generate('v1.3.0', 'v1.6.0')
+        self.assertEqual(computed, 1)
+        iter_commits.assert_called_once_with(self.repo, 'v1.5.0..v1.6.0')
+        self.assertTrue(notes.endswith(first.split('\n', 2)[2]))
+
+    def test_cli_since_last_tag(self):
+        result = CliRunner().invoke(cli, ['changelog', '--since-last-tag'], obj=RflowContext(self.fixture.path))
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('## Version 1.0.0 - ', result.output)
+        self.assertIn('- Add preflight', result.output)
+        self.assertNotIn('Add cache', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
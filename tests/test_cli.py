@@ -0,0 +1,110 @@
+import json
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+from rflow import git_operations
+from rflow.cli import cli
+from rflow.context import RflowContext
+from tests.helpers import RepoFixture
+
+
+def imported_modules(code):
+    result = subprocess.run([sys.executable, '-c', code + '\nimport sys\nprint(",".join(sys.modules))'],
+                            capture_output=True, text=True, check=True)
+    return set(result.stdout.strip().splitlines()[-1].split(','))
+
+
+class TestStartup(unittest.TestCase):
+    def test_import_does_not_load_heavy_modules(self):
+        modules = imported_modules('import rflow.cli')
+        self.assertNotIn('git', modules)
+        self.assertNotIn('semantic_version', modules)
+
+    def test_client_imports_only_the_standard_library(self):
+        modules = imported_modules('import rflow.client')
+        self.assertNotIn('click', modules)
+        self.assertNotIn('git', modules)
+
+    def test_help_does_not_load_gitpython(self):
+        for args in (['--help'], ['release', '--help']):
+            modules = imported_modules(
+                f'import rflow.cli\ntry:\n    rflow.cli.cli({args!r})\nexcept SystemExit:\n    pass')
+            self.assertNotIn('git', modules)
+
+
+class TestCommands(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+
+    def invoke(self, *args, path=None):
+        result = CliRunner(mix_stderr=False).invoke(cli, list(args), obj=RflowContext(path or self.fixture.path))
+        self.assertEqual(result.exit_code, 0, result.output + result.stderr)
+        return result
+
+    def remote_version_info(self, ref):
+        return json.loads(self.fixture.remote_git('show', f'{ref}:version.info'))
+
+    def test_release_does_not_switch_branches(self):
+        self.invoke('release')
+        self.assertEqual(self.fixture.git('symbolic-ref', '--short', 'HEAD'), 'main')
+        self.assertEqual(self.fixture.git('status', '--porcelain'), '')
+        self.assertEqual(self.remote_version_info('main'), {'currentVersion': '1.1.0', 'nextVersion': '1.2.0'})
+        self.assertEqual(self.remote_version_info('release/v1.1.0'),
+                         {'currentVersion': '1.1.0', 'nextVersion': '1.1.1'})
+
+    def test_init_in_a_repository_without_remote(self):
+        fixture = RepoFixture(version_info=None)
+        self.addCleanup(fixture.cleanup)
+        fixture.git('remote', 'remove', 'origin')
+        self.assertIn('Initialized version.info with version: 1.0.0', self.invoke('init', path=fixture.path).output)
+        with open(f'{fixture.path}/version.info') as file:
+            self.assertEqual(json.load(file)['currentVersion'], '1.0.0')
+
+    def test_fix_updates_release_and_fix_branches(self):
+        self.invoke('release')
+        self.fixture.git('tag', 'v1.1.0', 'release/v1.1.0')
+        self.invoke('fix', '1.1.0', 'crash')
+        self.assertEqual(self.fixture.git('symbolic-ref', '--short', 'HEAD'), 'main')
+        expected = {'currentVersion': '1.1.1', 'nextVersion': '1.1.2'}
+        self.assertEqual(self.remote_version_info('release/v1.1.0'), expected)
+        self.assertEqual(self.remote_version_info('fix/crash-from-1.1.0'), expected)
+        self.assertEqual(self.fixture.remote_git('rev-parse', 'fix/crash-from-1.1.0^'),
+                         self.fixture.git('rev-parse', 'v1.1.0'))
+
+    def test_fix_on_several_lines_pushes_once(self):
+        self.invoke('release')
+        self.invoke('release')
+        self.fixture.git('tag', 'v1.1.0', 'release/v1.1.0')
+        self.fixture.git('tag', 'v1.2.0', 'release/v1.2.0')
+        with patch('rflow.git_operations.push', wraps=git_operations.push) as push:
+            self.invoke('fix', '--to', '1.1,1.2', 'crash')
+        push.assert_called_once()
+        self.assertEqual(self.remote_version_info('fix/crash-from-1.1.0'),
+                         {'currentVersion': '1.1.1', 'nextVersion': '1.1.2'})
+        self.assertEqual(self.remote_version_info('release/v1.2.0'),
+                         {'currentVersion': '1.2.1', 'nextVersion': '1.2.2'})
+        self.assertEqual(self.fixture.remote_git('rev-parse', 'fix/crash-from-1.2.0^'),
+                         self.fixture.git('rev-parse', 'v1.2.0'))
+
+    def test_fix_and_tag_in_a_shallow_clone(self):
+        self.invoke('release')
+        self.fixture.git('tag', 'v1.1.0', 'release/v1.1.0')
+        self.fixture.git('push', '-q', 'origin', 'v1.1.0')
+        path = self.fixture.clone('ci', '--depth', '1', '--no-tags')
+        self.invoke('fix', '1.1.0', 'crash', path=path)
+        self.assertEqual(self.remote_version_info('release/v1.1.0'),
+                         {'currentVersion': '1.1.1', 'nextVersion': '1.1.2'})
+        self.assertEqual(self.fixture.remote_git('rev-parse', 'release/v1.1.0^'), self.fixture.git('rev-parse', 'v1.1.0'))
+        self.fixture.remote_git('tag', 'v1.1.1', 'release/v1.1.0')
+        clone = self.fixture.clone('ci-release', '--depth', '1', '--no-tags', '--branch', 'release/v1.1.0')
+        result = self.invoke('tag', path=clone)
+        self.assertIn('Tag v1.1.1 already exists', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
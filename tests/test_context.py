@@ -0,0 +1,51 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import click
+
+from rflow.context import RflowContext
+from rflow.version_operations import VersionInfo
+
+
+class TestRflowContext(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.version_file = os.path.join(self.temp_dir.name, 'version.info')
+        with open(self.version_file, 'w') as f:
+            json.dump({'currentVersion': '1.0.0', 'nextVersion': '1.1.0', 'name': 'demo'}, f)
+        self.rctx = RflowContext(self.temp_dir.name)
+
+    def test_version_info_is_parsed_once(self):
+        with patch('rflow.context.VersionInfo.load', wraps=VersionInfo.load) as load:
+            self.assertEqual(self.rctx.version_info.current_version, '1.0.0')
+            self.assertEqual(self.rctx.version_info.next_version, '1.1.0')
+        load.assert_called_once()
+
+    def test_flush_writes_only_when_changed(self):
+        self.rctx.update_version_info('1.1.0', '1.2.0')
+        self.rctx.flush()
+        mtime = os.stat(self.version_file).st_mtime_ns
+        self.rctx.flush()
+        self.assertEqual(os.stat(self.version_file).st_mtime_ns, mtime)
+        with open(self.version_file) as f:
+            data = json.load(f)
+        self.assertEqual(data, {'currentVersion': '1.1.0', 'nextVersion': '1.2.0', 'name': 'demo'})
+        self.assertEqual(os.listdir(self.temp_dir.name), ['version.info'])
+
+    def test_update_creates_missing_version_info(self):
+        os.remove(self.version_file)
+        self.rctx.update_version_info('1.0.0', '1.0.0')
+        self.rctx.flush()
+        self.assertEqual(RflowContext(self.temp_dir.name).version_info.next_version, '1.0.0')
+
+    def test_repo_outside_git_aborts(self):
+        with self.assertRaises(click.Abort):
+            self.rctx.repo
+
+
+if __name__ == '__main__':
+    unittest.main()
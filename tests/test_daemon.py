@@ -0,0 +1,98 @@
+import json
+import os
+import threading
+import unittest
+from unittest.mock import patch
+
+from rflow import client
+from rflow.cli import cli
+from rflow.daemon import RflowDaemon, file_stamp
+from rflow.version_operations import VersionInfo
+from tests.helpers import RepoFixture
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.socket = os.path.join(self.fixture.temp_dir.name, 'rflow.sock')
+        self.server = RflowDaemon(self.socket, cli)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(thread.join)
+        self.addCleanup(self.server.shutdown)
+
+    def forward(self, *args):
+        return client.forward(list(args), self.fixture.path, self.socket)
+
+    def test_forwards_commands_and_reuses_the_context(self):
+        self.assertEqual(self.forward('version'), ('Current version: 1.0.0\n', '', 0))
+        with patch.object(VersionInfo, 'load', side_effect=AssertionError('version.info parsed again')):
+            self.assertEqual(self.forward('versions'), ('1.0.0 (next 1.1.0)\n', '', 0))
+        self.assertEqual(len(self.server.contexts), 1)
+
+    def test_changed_version_info_is_read_again(self):
+        self.forward('version')
+        with open(os.path.join(self.fixture.path, 'version.info'), 'w') as file:
+            json.dump({'currentVersion': '2.0.0', 'nextVersion': '2.1.0'}, file)
+        self.assertEqual(self.forward('version')[0], 'Current version: 2.0.0\n')
+
+    def test_reports_errors_and_exit_codes(self):
+        stdout, stderr, exit_code = self.forward('changelog', '--since-last-tag')
+        self.assertEqual(exit_code, 1)
+        self.assertIn('No release tag found before HEAD.', stderr)
+        self.assertIn('Aborted!', stderr)
+        self.assertEqual(self.forward('versions', '--no-such-option')[2], 2)
+
+    def test_commands_that_push_run_in_the_caller(self):
+        stdout, stderr, exit_code = self.forward('release')
+        self.assertEqual(exit_code, 2)
+        self.assertIn("does not run 'release'", stderr)
+        self.assertEqual(self.fixture.remote_git('branch', '--list', 'release/*'), '')
+        with patch.dict(os.environ, {client.SOCKET_ENV: self.socket}), \
+                patch('rflow.client.forward', side_effect=AssertionError('forwarded')), \
+                patch('rflow.cli.cli.main') as main:
+            client.main(['release'])
+        main.assert_called_once_with(['release'], prog_name='rflow')
+        self.assertEqual(self.forward('push-status')[2], 2)
+
+    def test_moved_branch_is_noticed(self):
+        self.forward('status')
+        rctx, stamp = self.server.contexts[self.fixture.path]
+        self.fixture.git('commit', '-q', '--allow-empty', '-m', 'Outside rflow')
+        self.assertNotEqual(file_stamp(rctx), stamp)
+
+    def test_no_daemon_means_no_forwarding(self):
+        self.assertIsNone(client.forward(['version'], self.fixture.path, self.socket + '.missing'))
+
+    def test_sockets_of_other_users_are_not_used(self):
+        real_stat = os.stat
+
+        def stat(path, *args, **kwargs):
+            result = real_stat(path, *args, **kwargs)
+            if path == self.socket:
+                return os.stat_result((result.st_mode, result.st_ino, result.st_dev, result.st_nlink,
+                                       os.getuid() + 1, *tuple(result)[5:]))
+            return result
+
+        with patch('os.stat', side_effect=stat):
+            self.assertIsNone(self.forward('version'))
+
+    def test_default_socket_directory_is_private(self):
+        path = os.path.join(self.fixture.temp_dir.name, 'private', 'rflow.sock')
+        client.private_directory(path)
+        self.assertEqual(os.stat(os.path.dirname(path)).st_mode & 0o777, 0o700)
+        os.chmod(os.path.dirname(path), 0o755)
+        with self.assertRaises(PermissionError):
+            client.private_directory(path)
+
+    def test_stuck_daemon_times_out(self):
+        with patch.object(self.server, 'run', side_effect=lambda *args: threading.Event().wait(0.5) or {}):
+            stdout, stderr, exit_code = client.forward(['version'], self.fixture.path, self.socket, timeout=0.1)
+        self.assertEqual(exit_code, 1)
+        self.assertIn('did not answer within 0.1 seconds', stderr)
+
+
+if __name__ == '__main__':
+    unittest.main()
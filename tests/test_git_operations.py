@@ -1,7 +1,10 @@
 import unittest
 from unittest.mock import patch
 
-from rflow.git_operations import (is_release_branch, get_main_branch_name)
+from rflow.backend import GitCommandError, open_repository
+from rflow.git_operations import (is_release_branch, get_main_branch_name, push, parse_push_output, commit_files,
+                                  read_file, update_ref, is_incomplete_clone, fetch_missing_refs)
+from tests.helpers import RepoFixture, git as git_cmd
 
 
 class TestGitOperations(unittest.TestCase):
@@ -9,17 +12,103 @@ class TestGitOperations(unittest.TestCase):
         self.assertTrue(is_release_branch('release/v1.0.0'))
         self.assertFalse(is_release_branch('main'))
 
-    @patch('rflow.git_operations.git.Repo', autospec=True)
-    def test_get_main_branch_name(self, mock_repo):
-        mock_repo.branches = ['main']
-        self.assertEqual(get_main_branch_name(mock_repo), 'main')
+    def test_get_main_branch_name(self):
+        for branches, expected in ((['main'], 'main'), (['master'], 'master'), (['fail'], None)):
+            with patch('rflow.git_operations.branch_exists', side_effect=lambda repo, name: name in branches):
+                if expected is None:
+                    with self.assertRaises(ValueError):
+                        get_main_branch_name(None)
+                else:
+                    self.assertEqual(get_main_branch_name(None), expected)
 
-        mock_repo.branches = ['master']
-        self.assertEqual(get_main_branch_name(mock_repo), 'master')
+    def test_parse_push_output(self):
+        output = 'To origin.git\n*\tmain:refs/heads/main\t[new branch]\n \tv1:refs/tags/v1\tabc..def\nDone'
+        refs = parse_push_output(output)
+        self.assertEqual([ref.destination for ref in refs], ['refs/heads/main', 'refs/tags/v1'])
+        self.assertEqual(refs[0].flag, '*')
+        self.assertEqual(refs[1].summary, 'abc..def')
 
-        mock_repo.branches = ['fail']
-        with self.assertRaises(ValueError):
-            get_main_branch_name(mock_repo)
+
+class TestPush(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.repo = open_repository(self.fixture.path)
+
+    def test_push_sends_all_refspecs_at_once(self):
+        self.fixture.git('commit', '-q', '--allow-empty', '-m', 'change')
+        self.fixture.git('branch', 'release/v1.0.0')
+        result = push(self.repo, ['main', 'release/v1.0.0'], set_upstream=True)
+        self.assertEqual(result.remote, 'origin')
+        self.assertEqual(len(result.refs), 2)
+        self.assertEqual(self.fixture.remote_git('rev-parse', 'release/v1.0.0'), self.fixture.git('rev-parse', 'HEAD'))
+
+    def test_atomic_push_rejects_every_ref(self):
+        self.fixture.git('commit', '-q', '--allow-empty', '-m', 'diverged')
+        self.fixture.git('push', '-q', 'origin', 'main')
+        self.fixture.git('reset', '-q', '--hard', 'HEAD~1')
+        self.fixture.git('commit', '-q', '--allow-empty', '-m', 'local')
+        self.fixture.git('branch', 'release/v1.0.0')
+        with self.assertRaises(GitCommandError):
+            push(self.repo, ['main', 'release/v1.0.0'])
+        self.assertEqual(self.fixture.remote_git('branch', '--list', 'release/*'), '')
+
+
+class TestPlumbing(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.repo = open_repository(self.fixture.path)
+
+    def test_commit_files_keeps_working_tree_and_other_files(self):
+        head = self.fixture.git('rev-parse', 'HEAD')
+        commit = commit_files(self.repo, head, {'version.info': 'new\n', 'deep/dir/file.txt': 'x'}, 'Bump')
+        self.assertEqual(self.fixture.git('rev-parse', 'HEAD'), head)
+        self.assertEqual(self.fixture.git('status', '--porcelain'), '')
+        self.assertEqual(read_file(self.repo, commit, 'version.info'), 'new\n')
+        self.assertEqual(read_file(self.repo, commit, 'deep/dir/file.txt'), 'x')
+        self.assertIsNone(read_file(self.repo, head, 'deep/dir/file.txt'))
+        self.assertEqual(self.fixture.git('rev-parse', f'{commit}^'), head)
+
+    def test_update_ref_refuses_existing_branch_when_creating(self):
+        head = self.fixture.git('rev-parse', 'HEAD')
+        update_ref(self.repo, 'refs/heads/release/v1.0.0', head, '')
+        with self.assertRaises(GitCommandError):
+            update_ref(self.repo, 'refs/heads/release/v1.0.0', head, '')
+
+
+class TestIncompleteClones(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.fixture.git('commit', '-q', '--allow-empty', '-m', 'second')
+        self.fixture.git('tag', 'v1.0.0')
+        self.fixture.git('branch', 'release/v1.0.0')
+        self.fixture.git('push', '-q', 'origin', 'main', 'release/v1.0.0', 'v1.0.0')
+
+    def test_detects_shallow_and_single_branch_clones(self):
+        self.assertFalse(is_incomplete_clone(open_repository(self.fixture.path)))
+        self.assertTrue(is_incomplete_clone(open_repository(self.fixture.clone('shallow', '--depth', '1'))))
+        narrow = self.fixture.clone('narrow', '--single-branch', '--no-tags')
+        self.assertTrue(is_incomplete_clone(open_repository(narrow)))
+
+    def test_fetches_only_missing_refs_and_stays_shallow(self):
+        path = self.fixture.clone('shallow', '--depth', '1', '--no-tags')
+        repo = open_repository(path)
+        fetched = fetch_missing_refs(repo, ['refs/tags/v1.0.0', 'refs/heads/release/v1.0.0', 'refs/tags/v9.9.9'])
+        self.assertEqual(fetched, ['refs/tags/v1.0.0', 'refs/heads/release/v1.0.0'])
+        self.assertEqual(git_cmd(path, 'rev-parse', 'v1.0.0'), self.fixture.git('rev-parse', 'v1.0.0'))
+        self.assertEqual(git_cmd(path, 'rev-parse', 'origin/release/v1.0.0'),
+                         self.fixture.git('rev-parse', 'release/v1.0.0'))
+        self.assertEqual(git_cmd(path, 'rev-parse', '--is-shallow-repository'), 'true')
+        self.assertEqual(fetch_missing_refs(repo, ['refs/tags/v1.0.0']), [])
+
+    def test_missing_tags_are_looked_up_once(self):
+        with patch('rflow.git_operations.ref_exists', return_value=False) as ref_exists, \
+                patch('rflow.git_operations.is_incomplete_clone', return_value=False):
+            self.assertEqual(fetch_missing_refs(None, ['refs/tags/v1.0.0', 'refs/heads/release/v1.0.0']), [])
+        self.assertEqual([call.args[1] for call in ref_exists.call_args_list],
+                         ['refs/tags/v1.0.0', 'refs/remotes/origin/release/v1.0.0', 'refs/heads/release/v1.0.0'])
 
 
 if __name__ == '__main__':
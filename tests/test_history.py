@@ -0,0 +1,47 @@
+import os
+import unittest
+
+from rflow.backend import open_repository
+from rflow.history import release_status, iter_set_bits, is_fix
+from tests.helpers import RepoFixture
+
+
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+
+    def commit(self, name, subject, *extra_args):
+        with open(os.path.join(self.fixture.path, name), 'w') as f:
+            f.write(subject)
+        self.fixture.git('add', name)
+        self.fixture.git('commit', '-q', '-m', subject, *extra_args)
+        return self.fixture.git('rev-parse', 'HEAD')
+
+    def test_helpers(self):
+        self.assertEqual(list(iter_set_bits(0b10110)), [1, 2, 4])
+        self.assertTrue(is_fix('fix: crash on start'))
+        self.assertTrue(is_fix("Merge branch 'fix/crash-from-1.0.0'"))
+        self.assertFalse(is_fix('Add prefix option'))
+
+    def test_release_status(self):
+        self.fixture.git('branch', 'release/v1.0.0')
+        self.fixture.git('tag', 'v1.0.0')
+        fix_picked = self.commit('a.txt', 'fix: picked crash')
+        self.commit('b.txt', 'Add feature')
+        self.commit('c.txt', 'Fix missing overflow')
+        self.fixture.git('checkout', '-q', 'release/v1.0.0')
+        self.fixture.git('cherry-pick', '-x', fix_picked)
+        self.commit('d.txt', 'Release only change')
+        self.fixture.git('checkout', '-q', '-b', 'release/v1.1.0', 'main')
+        self.fixture.git('checkout', '-q', 'main')
+        statuses = release_status(open_repository(self.fixture.path), 'main')
+        self.assertEqual([status.line for status in statuses], ['1.0', '1.1'])
+        old, new = statuses
+        self.assertEqual((old.tag, old.commits_since_tag), ('v1.0.0', 2))
+        self.assertEqual([commit.subject for commit in old.missing_fixes], ['Fix missing overflow'])
+        self.assertEqual((new.tag, new.commits_since_tag, new.missing_fixes), (None, 0, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
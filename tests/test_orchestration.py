@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+from rflow import flows
+from rflow.backend import SlimGitCommandError
+from rflow.orchestration import describe_error, read_manifest, remote_host, run_across_repos, format_summary
+from tests.helpers import RepoFixture
+
+
+class TestOrchestration(unittest.TestCase):
+    def test_remote_host(self):
+        self.assertEqual(remote_host('https://github.com/tonylook/rflow.git'), 'github.com')
+        self.assertEqual(remote_host('ssh://git@git.example.com:2222/repo.git'), 'git.example.com')
+        self.assertEqual(remote_host('git@github.com:tonylook/rflow.git'), 'github.com')
+        self.assertEqual(remote_host('/srv/git/repo.git'), 'local')
+        self.assertEqual(remote_host('file:///srv/git/repo.git'), 'local')
+
+    def test_read_manifest(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manifest = os.path.join(temp_dir, 'manifest.txt')
+            with open(manifest, 'w') as f:
+                f.write('# services\nservice-a\n\n/abs/service-b\n')
+            self.assertEqual(read_manifest(manifest), [os.path.join(temp_dir, 'service-a'), '/abs/service-b'])
+
+    def test_describe_error_keeps_the_fatal_line(self):
+        stderr = ("fatal: '/srv/git/missing.git' does not appear to be a git repository\n"
+                  "fatal: Could not read from remote repository.\n\n"
+                  "Please make sure you have the correct access rights\nand the repository exists.\n")
+        error = SlimGitCommandError(['git', 'push'], 128, '', stderr)
+        self.assertEqual(describe_error(error),
+                         "fatal: '/srv/git/missing.git' does not appear to be a git repository")
+
+    def test_release_across_repos(self):
+        fixtures = [RepoFixture() for _ in range(3)]
+        for fixture in fixtures:
+            self.addCleanup(fixture.cleanup)
+        paths = [fixture.path for fixture in fixtures] + ['/nonexistent/repo']
+        results = run_across_repos(flows.release, paths, jobs=2, per_host=1)
+        self.assertEqual([result.ok for result in results], [True, True, True, False])
+        self.assertEqual(results[0].messages, ['Release branch release/v1.1.0 created and pushed.'])
+        for fixture in fixtures:
+            self.assertEqual(fixture.remote_git('branch', '--list', 'release/*').strip(), 'release/v1.1.0')
+        self.assertIn('3 succeeded, 1 failed', format_summary(results))
+
+    def test_missing_version_info_is_reported_in_the_summary(self):
+        fixture = RepoFixture(version_info=None)
+        self.addCleanup(fixture.cleanup)
+        results = run_across_repos(flows.release, [fixture.path])
+        self.assertFalse(results[0].ok)
+        self.assertEqual(results[0].messages,
+                         ["version.info file does not exist. Please initialize it using 'rflow init'."])
+
+
+if __name__ == '__main__':
+    unittest.main()
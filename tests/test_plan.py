@@ -0,0 +1,87 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+from rflow import flows
+from rflow.backend import GitCommandError
+from rflow.context import RflowContext
+from rflow.plan import Plan, apply
+from tests.helpers import RepoFixture
+
+
+class TestPlan(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.messages = []
+        self.rctx = RflowContext(self.fixture.path, echo=lambda message, err=False: self.messages.append(message))
+
+    def refs(self):
+        return self.fixture.git('for-each-ref', '--format=%(refname) %(objectname)')
+
+    def test_release_plan_chains_the_release_branch_on_the_new_main_commit(self):
+        plan = flows.plan_release(self.rctx)
+        self.assertEqual([update.ref for update in plan.ref_updates], ['refs/heads/main', 'refs/heads/release/v1.1.0'])
+        self.assertIs(plan.ref_updates[1].new.parent, plan.ref_updates[0].new)
+        self.assertEqual(plan.ref_updates[1].old, '')
+        self.assertEqual(plan.refresh_paths, ['version.info'])
+
+    def test_dry_run_changes_nothing(self):
+        refs = self.refs()
+        flows.release(self.rctx, dry_run=True)
+        self.assertEqual(self.refs(), refs)
+        self.assertEqual(self.fixture.git('status', '--porcelain'), '')
+        self.assertIn('  create refs/heads/release/v1.1.0 -> <new commit 2>', self.messages)
+        self.assertIn('  push origin main release/v1.1.0 (atomic, set upstream)', self.messages)
+
+    def test_dry_run_of_several_fix_lines_fetches_and_writes_nothing(self):
+        flows.release(self.rctx)
+        flows.release(self.rctx)
+        self.fixture.git('tag', 'v1.1.0', 'release/v1.1.0')
+        self.fixture.git('tag', 'v1.2.0', 'release/v1.2.0')
+        self.messages.clear()
+        objects = self.fixture.git('count-objects')
+        with patch('rflow.git_operations.fetch_missing_refs', side_effect=AssertionError('fetched')):
+            flows.fix_lines(self.rctx, ['1.1', '1.2'], 'crash', dry_run=True)
+        self.assertEqual(self.fixture.git('count-objects'), objects)
+        self.assertIn('  create refs/heads/fix/crash-from-1.2.0 -> <new commit 4>', self.messages)
+
+    def test_stale_plan_changes_no_ref(self):
+        plan = flows.plan_release(self.rctx)
+        self.fixture.git('branch', 'release/v1.1.0')
+        refs = self.refs()
+        with self.assertRaises(GitCommandError):
+            apply(self.rctx.repo, plan)
+        self.assertEqual(self.refs(), refs)
+        self.assertEqual(json.loads(self.fixture.git('show', 'main:version.info'))['nextVersion'], '1.1.0')
+
+    def test_rejected_push_reverts_the_local_refs(self):
+        hook = os.path.join(self.fixture.origin, 'hooks', 'pre-receive')
+        with open(hook, 'w') as file:
+            file.write('#!/bin/sh\necho "pushes are frozen" >&2\nexit 1\n')
+        os.chmod(hook, 0o755)
+        refs = self.refs()
+        with self.assertRaises(GitCommandError):
+            flows.release(self.rctx)
+        self.assertEqual(self.refs(), refs)
+        self.assertEqual(self.fixture.git('status', '--porcelain'), '')
+        self.assertEqual(json.loads(self.fixture.git('show', 'main:version.info'))['nextVersion'], '1.1.0')
+        os.remove(hook)
+        flows.release(RflowContext(self.fixture.path, echo=lambda message, err=False: None))
+        self.assertEqual(self.fixture.remote_git('branch', '--list', 'release/*').strip(), 'release/v1.1.0')
+
+    def test_pushes_to_one_remote_are_sent_together(self):
+        head = self.fixture.git('rev-parse', 'HEAD')
+        plan = Plan()
+        plan.update_ref('refs/tags/v1', head, '')
+        plan.update_ref('refs/tags/v2', head, '')
+        plan.push(['refs/tags/v1'])
+        plan.push(['refs/tags/v2'])
+        results = apply(self.rctx.repo, plan)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(self.fixture.remote_git('tag', '--list'), 'v1\nv2')
+
+
+if __name__ == '__main__':
+    unittest.main()
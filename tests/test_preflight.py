@@ -0,0 +1,71 @@
+import unittest
+from unittest.mock import patch
+
+from rflow import flows, git_operations, preflight
+from rflow.backend import open_repository
+from rflow.context import RflowContext
+from rflow.plan import Plan
+from tests.helpers import RepoFixture, git
+
+
+class TestPreflight(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.repo = open_repository(self.fixture.path)
+        self.rctx = RflowContext(self.fixture.path, echo=lambda message, err=False: None)
+
+    def local_refs(self):
+        return self.fixture.git('for-each-ref', '--format=%(refname) %(objectname)')
+
+    def test_parse_refspec(self):
+        self.assertEqual(preflight.parse_refspec('main'), (False, 'refs/heads/main', 'refs/heads/main'))
+        self.assertEqual(preflight.parse_refspec('+refs/tags/v1.0.0'),
+                         (True, 'refs/tags/v1.0.0', 'refs/tags/v1.0.0'))
+        self.assertEqual(preflight.parse_refspec(':refs/tags/v1.0.0'), (False, '', 'refs/tags/v1.0.0'))
+
+    def test_moved_remote_branch_stops_release_before_local_work(self):
+        other = self.fixture.clone('other')
+        git(other, 'commit', '-q', '--allow-empty', '-m', 'Pushed elsewhere')
+        git(other, 'push', '-q', 'origin', 'main')
+        refs = self.local_refs()
+        with self.assertRaises(preflight.PreflightError) as raised:
+            flows.release(self.rctx)
+        self.assertEqual([conflict.ref for conflict in raised.exception.conflicts], ['refs/heads/main'])
+        self.assertEqual(self.local_refs(), refs)
+        self.assertEqual(self.fixture.git('status', '--porcelain'), '')
+
+    def test_tag_only_on_the_remote_is_reported_before_tagging(self):
+        flows.release(self.rctx)
+        self.fixture.git('checkout', '-q', 'release/v1.1.0')
+        self.fixture.remote_git('tag', 'v1.1.0', 'main')
+        rctx = RflowContext(self.fixture.path, echo=lambda message, err=False: None)
+        with self.assertRaises(preflight.PreflightError) as raised:
+            flows.tag(rctx)
+        self.assertIn('Tag v1.1.0 already exists on origin.', str(raised.exception))
+        self.assertFalse(git_operations.tag_exists(self.repo, 'v1.1.0'))
+
+    def test_advertisement_is_cached_briefly(self):
+        refs = ['refs/heads/main', 'refs/tags/v9.9.9']
+        with patch('rflow.git_operations.ls_remote', wraps=git_operations.ls_remote) as ls_remote:
+            first = preflight.advertised_refs(self.repo, 'origin', refs, now=1000)
+            self.assertEqual(preflight.advertised_refs(self.repo, 'origin', refs, now=1010), first)
+            self.assertEqual(ls_remote.call_count, 1)
+            preflight.advertised_refs(self.repo, 'origin', refs, now=1000 + preflight.CACHE_SECONDS + 1)
+            self.assertEqual(ls_remote.call_count, 2)
+        self.assertEqual(first, {'refs/heads/main': self.fixture.remote_git('rev-parse', 'main'),
+                                 'refs/tags/v9.9.9': None})
+
+    def test_pushed_refs_are_recorded_for_the_next_command(self):
+        flows.release(self.rctx)
+        plan = Plan()
+        plan.push(['main', 'release/v1.1.0'])
+        with patch('rflow.git_operations.ls_remote', side_effect=AssertionError('remote asked again')):
+            self.assertEqual(preflight.check(self.repo, plan), [])
+        advertised = preflight.advertised_refs(self.repo, 'origin', ['refs/heads/release/v1.1.0'])
+        self.assertEqual(advertised['refs/heads/release/v1.1.0'],
+                         self.fixture.remote_git('rev-parse', 'release/v1.1.0'))
+
+
+if __name__ == '__main__':
+    unittest.main()
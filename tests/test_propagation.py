@@ -0,0 +1,108 @@
+import json
+import os
+import unittest
+from unittest.mock import patch
+
+import click
+
+from rflow import flows, git_operations, propagation
+from rflow.backend import open_repository
+from rflow.context import RflowContext
+from rflow.version_operations import VersionInfo
+from tests.helpers import RepoFixture
+
+VERSION_INFO = {
+    'currentVersion': '1.0.0',
+    'nextVersion': '1.1.0',
+    'propagate': [
+        {'files': 'pyproject.toml', 'pattern': 'version = "{version}"'},
+        {'files': ['charts/*/Chart.yaml'], 'pattern': 'appVersion: {version}'},
+        {'files': '**/package.json', 'pattern': '"version": "{version}"'},
+    ],
+}
+
+
+class TestPropagation(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture(json.dumps(VERSION_INFO, indent=4))
+        self.addCleanup(self.fixture.cleanup)
+        self.write('pyproject.toml', '[project]\nname = "demo"\nversion = "1.0.0"\n')
+        self.write('charts/api/Chart.yaml', 'name: api\nversion: 0.3.0\nappVersion: 1.0.0\n')
+        self.write('web/app/package.json', '{\n  "name": "app",\n  "version": "1.0.0"\n}\n')
+        self.write('web/app/README.md', 'version = "1.0.0"\n')
+        self.fixture.git('add', '.')
+        self.fixture.git('commit', '-q', '-m', 'Declare versions')
+        self.fixture.git('push', '-q')
+        self.repo = open_repository(self.fixture.path)
+        self.rctx = RflowContext(self.fixture.path, echo=lambda message, err=False: None)
+
+    def write(self, path, content):
+        os.makedirs(os.path.dirname(os.path.join(self.fixture.path, path)), exist_ok=True)
+        with open(os.path.join(self.fixture.path, path), 'w') as file:
+            file.write(content)
+
+    def show(self, revision, path):
+        return self.fixture.git('show', f'{revision}:{path}')
+
+    def test_glob_regex(self):
+        for glob, path, expected in [('charts/*/Chart.yaml', 'charts/api/Chart.yaml', True),
+                                     ('charts/*/Chart.yaml', 'charts/api/sub/Chart.yaml', False),
+                                     ('**/package.json', 'package.json', True),
+                                     ('**/package.json', 'web/app/package.json', True),
+                                     ('src/[!_]*.py', 'src/_private.py', False),
+                                     ('pyproject.toml', 'pyprojectxtoml', False)]:
+            self.assertEqual(propagation.Rule(glob, '{version}').matches(path), expected, (glob, path))
+
+    def test_malformed_rules_are_rejected(self):
+        for rule in ({'files': 'a.txt', 'pattern': 'version'}, {'pattern': '{version}'}):
+            with self.assertRaises(ValueError):
+                propagation.load_rules(VersionInfo(dict(VERSION_INFO, propagate=[rule])))
+
+    def test_release_rewrites_declared_files_in_the_version_commit(self):
+        flows.release(self.rctx)
+        for revision in ('release/v1.1.0', 'main'):
+            version = json.loads(self.show(revision, 'version.info'))['currentVersion']
+            self.assertIn(f'version = "{version}"', self.show(revision, 'pyproject.toml'))
+            self.assertIn(f'appVersion: {version}', self.show(revision, 'charts/api/Chart.yaml'))
+            self.assertIn('version: 0.3.0', self.show(revision, 'charts/api/Chart.yaml'))
+            self.assertIn(f'"version": "{version}"', self.show(revision, 'web/app/package.json'))
+            self.assertEqual(self.show(revision, 'web/app/README.md'), 'version = "1.0.0"')
+        self.assertEqual(self.fixture.git('diff-tree', '-r', '--name-only', '--no-commit-id', 'main').splitlines(),
+                         ['charts/api/Chart.yaml', 'pyproject.toml', 'version.info', 'web/app/package.json'])
+        self.assertEqual(self.fixture.git('status', '--porcelain'), '')
+
+    def test_uncommitted_changes_to_propagated_files_stop_the_bump(self):
+        edited = '{\n  "name": "app",\n  "version": "1.0.0",\n  "private": true\n}\n'
+        self.write('web/app/package.json', edited)
+        refs = self.fixture.git('for-each-ref', '--format=%(refname) %(objectname)')
+        with self.assertRaises(click.ClickException) as raised:
+            flows.major(self.rctx)
+        self.assertIn('web/app/package.json', raised.exception.format_message())
+        self.assertEqual(self.fixture.git('for-each-ref', '--format=%(refname) %(objectname)'), refs)
+        with open(os.path.join(self.fixture.path, 'web/app/package.json')) as file:
+            self.assertEqual(file.read(), edited)
+
+    def test_files_under_a_planned_parent_are_read_in_one_batch(self):
+        with patch('rflow.git_operations.read_file', side_effect=AssertionError('read one by one')), \
+                patch('rflow.git_operations.read_files', wraps=git_operations.read_files) as read_files:
+            plan = flows.plan_release(self.rctx)
+        self.assertEqual(read_files.call_count, 2)
+        self.assertEqual(read_files.call_args.args[1], [])
+        self.assertIs(plan.ref_updates[1].new.parent, plan.ref_updates[0].new)
+
+    def test_pattern_index_follows_the_tree_without_listing_it_again(self):
+        rules = propagation.load_rules(VersionInfo(VERSION_INFO))
+        self.assertEqual(propagation.matching_paths(self.repo, rules, 'HEAD'),
+                         ['charts/api/Chart.yaml', 'pyproject.toml', 'web/app/package.json'])
+        self.fixture.git('mv', 'charts/api', 'charts/gateway')
+        self.write('package.json', '{"version": "1.0.0"}\n')
+        self.fixture.git('add', '.')
+        self.fixture.git('commit', '-q', '-m', 'Rename chart')
+        with patch('rflow.git_operations.stream_records', wraps=git_operations.stream_records) as stream_records:
+            self.assertEqual(propagation.matching_paths(self.repo, rules, 'HEAD'),
+                             ['charts/gateway/Chart.yaml', 'package.json', 'pyproject.toml', 'web/app/package.json'])
+        self.assertEqual([call.args[1] for call in stream_records.call_args_list], ['diff-tree'])
+
+
+if __name__ == '__main__':
+    unittest.main()
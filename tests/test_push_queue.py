@@ -0,0 +1,95 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from rflow import flows, push_queue
+from rflow.backend import open_repository
+from rflow.context import RflowContext
+from rflow.plan import PushStep
+from tests.helpers import RepoFixture, git
+
+
+class TestPushQueue(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.repo = open_repository(self.fixture.path)
+        self.rctx = RflowContext(self.fixture.path, echo=lambda message, err=False: None)
+
+    def test_async_release_returns_before_pushing(self):
+        messages = []
+        rctx = RflowContext(self.fixture.path, echo=lambda message, err=False: messages.append(message))
+        with patch.object(push_queue, 'start_worker_process') as start_worker:
+            flows.release(rctx, async_push=True)
+        self.assertEqual(messages[0], 'Release branch release/v1.1.0 created and queued for push.')
+        start_worker.assert_called_once()
+        self.assertEqual(self.fixture.remote_git('branch', '--list', 'release/*'), '')
+        self.assertEqual([queued.status for queued in push_queue.read_queue(self.repo)], ['pending'])
+        push_queue.drain(self.repo)
+        self.assertEqual(self.fixture.remote_git('branch', '--list', 'release/*').strip(), 'release/v1.1.0')
+        self.assertEqual(push_queue.read_queue(self.repo), [])
+
+    def test_queued_push_sends_what_the_command_created(self):
+        with patch.object(push_queue, 'start_worker_process'):
+            flows.release(self.rctx, async_push=True)
+        released = self.fixture.git('rev-parse', 'main')
+        self.fixture.git('commit', '-q', '--allow-empty', '-m', 'WIP do not push')
+        push_queue.drain(self.repo)
+        self.assertEqual(self.fixture.remote_git('rev-parse', 'main'), released)
+        self.assertEqual(self.fixture.git('config', 'branch.release/v1.1.0.merge'), 'refs/heads/release/v1.1.0')
+
+    def test_queued_push_does_not_overwrite_a_moved_remote(self):
+        with patch.object(push_queue, 'start_worker_process'):
+            flows.release(self.rctx, async_push=True)
+        other = self.fixture.clone('other')
+        git(other, 'commit', '-q', '--allow-empty', '-m', 'Pushed elsewhere')
+        git(other, 'push', '-q', 'origin', 'main')
+        moved = self.fixture.remote_git('rev-parse', 'main')
+        push_queue.drain(self.repo, sleep=lambda seconds: None)
+        self.assertEqual(self.fixture.remote_git('rev-parse', 'main'), moved)
+        self.assertEqual([queued.status for queued in push_queue.read_queue(self.repo)], ['failed'])
+
+    def test_pending_pushes_to_a_remote_are_coalesced(self):
+        for tag in ('v1.0.0', 'v1.0.1'):
+            self.fixture.git('tag', tag)
+            push_queue.enqueue(self.repo, [PushStep('origin', [f'refs/tags/{tag}'], False)], start_worker=False)
+        with patch('rflow.git_operations.push', wraps=push_queue.git_operations.push) as push:
+            push_queue.drain(self.repo)
+        push.assert_called_once()
+        self.assertEqual(self.fixture.remote_git('tag', '--list'), 'v1.0.0\nv1.0.1')
+
+    def test_network_errors_are_retried_with_backoff(self):
+        self.fixture.git('tag', 'v1.0.0')
+        push_queue.enqueue(self.repo, [PushStep('unreachable', ['refs/tags/v1.0.0'], False)], start_worker=False)
+        self.fixture.git('remote', 'add', 'unreachable', f'{self.fixture.temp_dir.name}/missing.git')
+        delays = []
+        push_queue.drain(self.repo, sleep=delays.append)
+        self.assertEqual(delays, [1, 2, 4, 8, 16])
+        [queued] = push_queue.read_queue(self.repo)
+        self.assertEqual((queued.status, queued.attempts), ('failed', push_queue.MAX_ATTEMPTS))
+        self.assertEqual(push_queue.clear_failed(self.repo), 1)
+        self.assertEqual(push_queue.read_queue(self.repo), [])
+
+    def test_a_rejected_push_does_not_block_the_others(self):
+        self.fixture.git('tag', 'v1.0.0')
+        self.fixture.git('push', '-q', 'origin', 'v1.0.0')
+        self.fixture.git('commit', '-q', '--allow-empty', '-m', 'moved')
+        self.fixture.git('tag', '-f', 'v1.0.0')
+        self.fixture.git('tag', 'v1.0.1')
+        push_queue.enqueue(self.repo, [PushStep('origin', ['refs/tags/v1.0.0'], False)], start_worker=False)
+        push_queue.enqueue(self.repo, [PushStep('origin', ['refs/tags/v1.0.1'], False)], start_worker=False)
+        push_queue.drain(self.repo, sleep=lambda seconds: None)
+        self.assertEqual([queued.status for queued in push_queue.read_queue(self.repo)], ['failed'])
+        self.assertIn('v1.0.1', self.fixture.remote_git('tag', '--list'))
+
+    def test_worker_process_drains_the_queue(self):
+        self.fixture.git('tag', 'v1.0.0')
+        push_queue.enqueue(self.repo, [PushStep('origin', ['refs/tags/v1.0.0'], False)])
+        deadline = time.time() + 20
+        while push_queue.read_queue(self.repo) and time.time() < deadline:
+            time.sleep(0.1)
+        self.assertEqual(self.fixture.remote_git('tag', '--list'), 'v1.0.0')
+
+
+if __name__ == '__main__':
+    unittest.main()
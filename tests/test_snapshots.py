@@ -0,0 +1,133 @@
+import datetime
+import unittest
+from unittest.mock import patch
+
+from rflow import flows
+from rflow.backend import open_repository
+from rflow.context import RflowContext
+from rflow.snapshots import (parse_snapshot_tag, parse_age, select_for_pruning, list_snapshot_tags,
+                             prune_snapshots, snapshot_tag_name, push_snapshots)
+from tests.helpers import RepoFixture
+
+
+class TestSnapshots(unittest.TestCase):
+    def test_parse_snapshot_tag(self):
+        snapshot = parse_snapshot_tag('v1.2.0-20240131120000')
+        self.assertEqual(snapshot.version, '1.2.0')
+        self.assertEqual(snapshot.created, datetime.datetime(2024, 1, 31, 12, 0, 0))
+        self.assertIsNone(parse_snapshot_tag('v1.2.0'))
+        self.assertIsNone(parse_snapshot_tag('v1.2.0-20241331120000'))
+
+    def test_snapshot_tag_name_round_trip(self):
+        now = datetime.datetime(2024, 5, 6, 7, 8, 9)
+        self.assertEqual(parse_snapshot_tag(snapshot_tag_name('2.0.0', now)).created, now)
+
+    def test_unique_names_keep_the_creation_time(self):
+        now = datetime.datetime(2024, 5, 6, 7, 8, 9, 123456)
+        names = {snapshot_tag_name('2.0.0', now, unique=True) for _ in range(20)}
+        self.assertGreater(len(names), 1)
+        snapshot = parse_snapshot_tag(names.pop())
+        self.assertEqual((snapshot.version, snapshot.created), ('2.0.0', now))
+
+    def test_parse_age(self):
+        self.assertEqual(parse_age('30d'), datetime.timedelta(days=30))
+        self.assertEqual(parse_age('2w'), datetime.timedelta(weeks=2))
+        with self.assertRaises(ValueError):
+            parse_age('soon')
+
+    def test_select_for_pruning(self):
+        snapshots = list_snapshot_tags([
+            'refs/tags/v1.0.0-20240101000000',
+            'refs/tags/v1.0.0-20240102000000',
+            'refs/tags/v1.0.0-20240103000000',
+            'refs/tags/v1.1.0-20240101000000',
+            'refs/tags/v1.1.0',
+        ])
+        self.assertEqual(select_for_pruning(snapshots, keep=1),
+                         ['v1.0.0-20240101000000', 'v1.0.0-20240102000000'])
+        now = datetime.datetime(2024, 1, 3, 12, 0, 0)
+        self.assertEqual(select_for_pruning(snapshots, older_than=datetime.timedelta(days=2), now=now),
+                         ['v1.0.0-20240101000000', 'v1.1.0-20240101000000'])
+        self.assertEqual(select_for_pruning(snapshots), [])
+
+
+class TestPruneSnapshots(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        for tag in ['v1.0.0-20240101000000', 'v1.0.0-20240102000000', 'v1.0.0-20240103000000', 'v1.0.0']:
+            self.fixture.git('tag', tag)
+        self.fixture.git('push', '-q', 'origin', '--tags')
+        self.repo = open_repository(self.fixture.path)
+
+    def test_prune_local_and_remote(self):
+        pruned_local, pruned_remote = prune_snapshots(self.repo, keep=1)
+        self.assertEqual(pruned_local, ['v1.0.0-20240101000000', 'v1.0.0-20240102000000'])
+        self.assertEqual(pruned_remote, pruned_local)
+        expected = 'v1.0.0\nv1.0.0-20240103000000'
+        self.assertEqual(self.fixture.git('tag', '--list'), expected)
+        self.assertEqual(self.fixture.remote_git('tag', '--list'), expected)
+
+    def test_dry_run_deletes_nothing(self):
+        pruned_local, _ = prune_snapshots(self.repo, keep=0, dry_run=True)
+        self.assertEqual(len(pruned_local), 3)
+        self.assertEqual(len(self.fixture.git('tag', '--list').splitlines()), 4)
+
+
+class TestConcurrentSnapshots(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.repo = open_repository(self.fixture.path)
+        self.messages = []
+        self.rctx = RflowContext(self.fixture.path, echo=lambda message, err=False: self.messages.append(message))
+        # Another job already pushed a snapshot of the same second, at another commit
+        self.fixture.git('commit', '-q', '--allow-empty', '-m', 'other job')
+        self.fixture.git('push', '-q', 'origin', 'HEAD:refs/tags/v1.1.0-20240101000000')
+        self.fixture.git('reset', '-q', '--hard', 'HEAD~1')
+
+    def test_snap_retries_a_collision_under_a_unique_name(self):
+        def name(version, now=None, unique=False):
+            return snapshot_tag_name(version, now, unique) if unique else 'v1.1.0-20240101000000'
+        with patch('rflow.snapshots.snapshot_tag_name', side_effect=name):
+            tag = flows.snap(self.rctx)
+        self.assertEqual(parse_snapshot_tag(tag).version, '1.1.0')
+        self.assertNotEqual(tag, 'v1.1.0-20240101000000')
+        self.assertIn('v1.1.0-20240101000000 already exists, retrying with a unique name.', self.messages[0])
+        self.assertEqual(self.fixture.remote_git('rev-parse', tag), self.fixture.git('rev-parse', 'HEAD'))
+        self.assertEqual(self.fixture.git('tag', '--list', 'v1.1.0-20240101000000'), '')
+
+    def test_snap_retries_a_push_rejected_past_preflight(self):
+        # The other job's tag is not seen by preflight, as with a stale cache or a push at the same moment
+        def name(version, now=None, unique=False):
+            return snapshot_tag_name(version, now, unique) if unique else 'v1.1.0-20240101000000'
+        with patch('rflow.snapshots.snapshot_tag_name', side_effect=name), \
+                patch.object(RflowContext, 'preflight') as preflight:
+            tag = flows.snap(self.rctx)
+        self.assertEqual(preflight.call_count, 2)
+        self.assertNotEqual(tag, 'v1.1.0-20240101000000')
+        self.assertIn('v1.1.0-20240101000000 already exists, retrying with a unique name.', self.messages[0])
+        self.assertEqual(self.fixture.remote_git('rev-parse', tag), self.fixture.git('rev-parse', 'HEAD'))
+        self.assertEqual(self.fixture.git('tag', '--list', 'v1.1.0-20240101000000'), '')
+
+    def test_deferred_snapshots_are_pushed_together(self):
+        self.fixture.git('tag', 'v1.1.0-20240101000000')
+        self.fixture.git('tag', 'v1.1.0-20240101000001')
+        result = push_snapshots(self.repo, ['v1.1.0-20240101000000', 'v1.1.0-20240101000001'])
+        self.assertEqual(len(result.pushed), 2)
+        self.assertEqual(result.failed, [])
+        self.assertIn('v1.1.0-20240101000001', result.pushed)
+        self.assertEqual(len(self.fixture.remote_git('tag', '--list').splitlines()), 3)
+
+    def test_defer_then_push_deferred(self):
+        tags = [flows.snap(self.rctx, unique=True, defer=True) for _ in range(3)]
+        self.assertEqual(self.fixture.remote_git('tag', '--list'), 'v1.1.0-20240101000000')
+        flows.push_deferred_snapshots(self.rctx)
+        self.assertEqual(self.fixture.remote_git('tag', '--list').splitlines()[1:], sorted(tags))
+        self.assertRegex(self.messages[-1], r'^Pushed 3 snapshot tag\(s\) in ')
+        flows.push_deferred_snapshots(self.rctx)
+        self.assertEqual(self.messages[-1], 'No deferred snapshot tags to push.')
+
+
+if __name__ == '__main__':
+    unittest.main()
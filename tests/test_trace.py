@@ -0,0 +1,43 @@
+import io
+import json
+import os
+import unittest
+
+from rflow import trace
+from rflow.backend import GitCommandError, open_repository
+from tests.helpers import RepoFixture
+
+
+class TestTrace(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+        self.trace_file = os.path.join(self.fixture.temp_dir.name, 'trace.json')
+
+    def test_records_git_commands_and_phases(self):
+        repo = open_repository(self.fixture.path)
+        trace.start(self.trace_file)
+        self.addCleanup(trace.finish, io.StringIO())
+        with trace.span('phase'):
+            repo.git.rev_parse('HEAD')
+        with self.assertRaises(GitCommandError):
+            repo.git.rev_parse('--verify', 'does-not-exist')
+        summary = io.StringIO()
+        trace.finish(summary)
+        self.assertFalse(trace.is_enabled())
+        self.assertIn('2 git commands', summary.getvalue())
+        with open(self.trace_file) as f:
+            events = json.load(f)['traceEvents']
+        git_events = [event for event in events if event['cat'] == 'git']
+        self.assertEqual([event['args']['exit_code'] for event in git_events], [0, 128])
+        self.assertEqual(git_events[0]['args']['output_bytes'], 40)
+        self.assertIn('phase', [event['name'] for event in events if event['cat'] == 'phase'])
+
+    def test_span_is_a_no_op_when_disabled(self):
+        with trace.span('nothing'):
+            pass
+        self.assertFalse(trace.is_enabled())
+
+
+if __name__ == '__main__':
+    unittest.main()
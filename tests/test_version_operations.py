@@ -6,9 +6,11 @@ import os
 
 import click
 
+from rflow.backend import open_repository
 from rflow.version_operations import (read_current_version, read_next_version, increment_major_version,
                                       increment_minor_version, increment_patch_version, check_version_info_exists,
-                                      init_version, get_latest_release_version)
+                                      init_version, get_latest_release_version, collect_release_lines)
+from tests.helpers import RepoFixture
 
 
 class TestVersionOperations(unittest.TestCase):
@@ -17,6 +19,7 @@ class TestVersionOperations(unittest.TestCase):
             'currentVersion': '1.0.0',
             'nextVersion': '1.0.1',
         }
+        self.addCleanup(os.chdir, os.getcwd())
         self.temp_dir = tempfile.TemporaryDirectory()
         self.version_file = os.path.join(self.temp_dir.name, 'version.info')
         with open(self.version_file, 'w') as f:
@@ -51,17 +54,49 @@ class TestVersionOperations(unittest.TestCase):
         self.assertEqual(init_version(), '1.0.0')
 
     def test_get_latest_release_version(self):
-        class FakeBranch:
-            def __init__(self, name):
-                self.name = name
-
         fake_repo = MagicMock()
-        fake_repo.branches = [
-            FakeBranch('release/v1.0.0'),
-            FakeBranch('release/v1.2.0'),
-            FakeBranch('release/v1.3.0'),
-        ]
+        fake_repo.git.for_each_ref.return_value = '\n'.join([
+            'refs/heads/release/v1.0.0',
+            'refs/heads/release/v1.2.0',
+            'refs/remotes/origin/release/v1.3.0',
+            'refs/heads/release/vnext',
+        ])
         self.assertEqual(get_latest_release_version(fake_repo), '1.3.0')
+        fake_repo.git.for_each_ref.assert_called_once_with('--format=%(refname)', 'refs/heads/release/v*',
+                                                           'refs/remotes/*/release/v*')
+
+    def test_get_latest_release_version_without_release_branches(self):
+        fake_repo = MagicMock()
+        fake_repo.git.for_each_ref.return_value = ''
+        self.assertIsNone(get_latest_release_version(fake_repo))
+
+
+class TestCollectReleaseLines(unittest.TestCase):
+    def setUp(self):
+        self.fixture = RepoFixture()
+        self.addCleanup(self.fixture.cleanup)
+
+    def commit_version_info(self, current_version, next_version):
+        with open(os.path.join(self.fixture.path, 'version.info'), 'w') as f:
+            json.dump({'currentVersion': current_version, 'nextVersion': next_version}, f)
+        self.fixture.git('commit', '-q', '-am', f'Version {current_version}')
+
+    def test_reports_versions_and_mismatches(self):
+        self.fixture.git('checkout', '-q', '-b', 'release/v1.0.0')
+        self.fixture.git('tag', 'v1.0.0')
+        self.commit_version_info('1.0.1', '1.0.2')
+        self.fixture.git('tag', 'v1.0.1')
+        self.fixture.git('tag', 'v1.0.1-20240101000000')
+        self.fixture.git('checkout', '-q', '-b', 'release/v1.1.0')
+        self.commit_version_info('1.1.0', '1.1.1')
+        self.fixture.git('tag', 'v1.1.2')
+        release_lines = collect_release_lines(open_repository(self.fixture.path))
+        self.assertEqual([release_line.line for release_line in release_lines], ['1.0', '1.1'])
+        first, second = release_lines
+        self.assertEqual((first.branch, first.tag, first.branch_info.current_version),
+                         ('release/v1.0.0', 'v1.0.1', '1.0.1'))
+        self.assertEqual(first.problems, [])
+        self.assertEqual(second.problems, ['v1.1.2 records version 1.1.0', 'release/v1.1.0 is behind v1.1.2'])
 
 
 if __name__ == '__main__':